@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+HealthBot benchmark: drive scripted sessions through the full workflow against
+latency-injecting stand-ins for OpenAI and Tavily (no API keys needed)
+"""
+
+import argparse
+import json
+
+from healthbot_modules.benchmark import BenchmarkRunner
+
+def main():
+    """Entry point for the offline benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark HealthBot with fake OpenAI/Tavily upstreams")
+    parser.add_argument("--sessions", type=int, default=100, help="scripted sessions to run (default 100)")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions in flight at once (default 20)")
+    parser.add_argument("--engine", choices=["async", "sync"], default="async",
+                        help="asyncio engine or one thread per session (default async)")
+    parser.add_argument("--topics-per-session", type=int, default=1)
+    parser.add_argument("--distinct-topics", type=int, default=50,
+                        help="size of the topic pool sessions draw from; smaller means more cache hits")
+    parser.add_argument("--llm-latency", default="lognormal:0.8:0.4",
+                        help="fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA (seconds)")
+    parser.add_argument("--tavily-latency", default="lognormal:0.6:0.4", help="same format as --llm-latency")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--tavily-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=float, default=0,
+                        help="OpenAI requests-per-minute quota to schedule against (default 0, unlimited)")
+    parser.add_argument("--llm-tpm", type=float, default=0, help="OpenAI tokens-per-minute quota (default 0, unlimited)")
+    parser.add_argument("--tavily-rpm", type=float, default=0, help="Tavily requests-per-minute quota (default 0, unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache-dir", help="reuse a cache directory instead of a fresh temporary one")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report peak Python allocations via tracemalloc (slower)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    runner = BenchmarkRunner(
+        sessions=args.sessions, concurrency=args.concurrency, engine=args.engine,
+        topics_per_session=args.topics_per_session, distinct_topics=args.distinct_topics,
+        llm_latency=args.llm_latency, tavily_latency=args.tavily_latency,
+        llm_failure_rate=args.llm_failure_rate, tavily_failure_rate=args.tavily_failure_rate,
+        llm_rpm=args.llm_rpm, llm_tpm=args.llm_tpm, tavily_rpm=args.tavily_rpm,
+        seed=args.seed, cache_dir=args.cache_dir, trace_memory=args.trace_memory
+    )
+    report = runner.run()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,69 @@ HealthBot: AI-Powered Patient Education System
 A modular LangGraph-style workflow for patient education
 """
 
-from healthbot_modules.workflow import HealthBotWorkflow
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+
+from healthbot_modules.clients import STARTUP
+from healthbot_modules.workflow import AsyncHealthBotWorkflow, HealthBotWorkflow
+
+STARTUP.reset(_STARTED)
+STARTUP.mark("modules imported")
+
+def startup_report():
+    """Show the cold-start path with clients deferred, then what building them eagerly would add"""
+    workflow = HealthBotWorkflow()
+    STARTUP.mark("ready for input")
+    started = time.perf_counter()
+    workflow.llm_with_tools.resolve()
+    workflow.search_tool.resolve()
+    for line in STARTUP.report():
+        print(line)
+    print(f"building the clients before the first prompt would add {time.perf_counter() - started:.2f}s")
 
 def main():
     """Main entry point for HealthBot application"""
+    parser = argparse.ArgumentParser(description="HealthBot patient education system")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run the session on the asyncio engine")
+    parser.add_argument("--resume", metavar="SESSION_ID",
+                        help="continue a checkpointed session (requires HEALTHBOT_CHECKPOINT=1)")
+    parser.add_argument("--serve", action="store_true",
+                        help="serve many sessions over HTTP/WebSocket instead of the console")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on (with --serve)")
+    parser.add_argument("--port", type=int, default=8080, help="port to serve on (with --serve)")
+    parser.add_argument("--idle-timeout", type=float, default=15 * 60,
+                        help="seconds before an idle served session is evicted (with --serve)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes serving sessions (with --serve; 0 starts one per CPU)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print cold-start timings and exit")
+    args = parser.parse_args()
+    
+    if args.startup_report:
+        startup_report()
+        return
+    
+    if args.serve:
+        # aiohttp is only needed for the server
+        from healthbot_modules.server import run_server
+        from healthbot_modules.workers import run_workers
+        try:
+            if args.workers == 1:
+                run_server(args.host, args.port, idle_timeout=args.idle_timeout)
+            else:
+                run_workers(args.host, args.port, args.workers, idle_timeout=args.idle_timeout)
+        except Exception as e:
+            print(f"Failed to start HealthBot server: {str(e)}")
+            print("Please check your config.env file and API keys.")
+        return
+    
     try:
-        workflow = HealthBotWorkflow()
-        workflow.execute_workflow()
+        workflow = AsyncHealthBotWorkflow() if args.use_async else HealthBotWorkflow()
+        workflow.execute_workflow(args.resume)
     except Exception as e:
         print(f"Failed to initialize HealthBot: {str(e)}")
         print("Please check your config.env file and API keys.")
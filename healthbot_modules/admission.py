@@ -0,0 +1,340 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import Histogram
+
+# Priority classes, most urgent first. Work for a patient who is waiting on the
+# answer is interactive; quiz speculation and offline pre-warming only use quota
+# that interactive work leaves over.
+INTERACTIVE, SPECULATIVE, PREWARM = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SPECULATIVE: "speculative", PREWARM: "prewarm"}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("healthbot_admission_priority", default=INTERACTIVE)
+
+@contextmanager
+def admission_priority(priority: int):
+    """Run the enclosed upstream calls (in this context) at the given priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> int:
+    return _priority.get()
+
+class AdmissionRejected(Exception):
+    """A request was shed: the admission queue was full or it waited too long"""
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, holding at most burst_seconds' worth
+
+    The level may go negative when a request turns out to have cost more than was
+    reserved for it; later requests then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (requests larger than the bucket wait for a full one)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+class _Waiter:
+    __slots__ = ("priority", "requests", "tokens", "enqueued", "event", "loop", "outcome")
+
+    def __init__(self, priority: int, requests: int, tokens: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.priority = priority
+        self.requests = requests
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+        # None while queued, True once admitted, or the AdmissionRejected that shed it
+        self.outcome: Any = None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+class AdmissionScheduler:
+    """Process-wide admission control for one upstream API's quota
+
+    Requests are admitted in priority order, oldest first within a class, when
+    both the requests-per-minute and tokens-per-minute buckets can cover them
+    (a limit of 0 means unlimited). Token costs are reserved from an estimate
+    and settled against the usage the API reports. At most max_queue requests
+    wait: a new request sheds the least urgent waiter if it is more urgent, and
+    is rejected otherwise; requests waiting longer than max_wait are shed too.
+
+    Thread callers block; coroutines await. Both share one queue.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, max_queue: int = 1000,
+                 max_wait: float = 60.0, burst_seconds: float = 10.0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._queue: List[tuple] = []
+        self._depth = 0
+        self._wait = {priority: Histogram() for priority in PRIORITY_NAMES}
+        # charged: hedges, retries and fallbacks of admitted calls, sent without queueing
+        self._counters = {"admitted": 0, "charged": 0, "shed": 0, "expired": 0, "max_queue_depth": 0}
+        self.configure(rpm, tpm, max_queue, max_wait, burst_seconds)
+
+    def configure(self, rpm: float = 0, tpm: float = 0, max_queue: int = 1000,
+                  max_wait: float = 60.0, burst_seconds: float = 10.0):
+        with self._lock:
+            self.rpm = rpm
+            self.tpm = tpm
+            self.max_queue = max_queue
+            self.max_wait = max_wait
+            self._requests = TokenBucket(rpm, burst_seconds) if rpm else None
+            self._tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+
+    @property
+    def limited(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def has_headroom(self) -> bool:
+        """Nothing is queued, so an extra (e.g. hedged) request would not delay anyone"""
+        return self._depth == 0
+
+    # Queue bookkeeping; callers hold self._lock
+
+    def _ready_in(self, waiter: _Waiter, now: float) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = self._requests.wait_time(waiter.requests, now)
+        if self._tokens is not None and waiter.tokens:
+            wait = max(wait, self._tokens.wait_time(waiter.tokens, now))
+        return wait
+
+    def _admit(self, waiter: _Waiter, now: float):
+        if self._requests is not None:
+            self._requests.take(waiter.requests)
+        if self._tokens is not None:
+            self._tokens.take(waiter.tokens)
+        waiter.outcome = True
+        self._counters["admitted"] += 1
+        self._wait[waiter.priority].observe(now - waiter.enqueued)
+
+    def _head(self) -> Optional[_Waiter]:
+        while self._queue and self._queue[0][2].outcome is not None:
+            heapq.heappop(self._queue)
+        return self._queue[0][2] if self._queue else None
+
+    def _pump(self, now: float) -> Optional[_Waiter]:
+        """Admit waiters from the head while quota allows, waking each; returns the new head"""
+        admitted = False
+        while True:
+            head = self._head()
+            if head is None or self._ready_in(head, now) > 0:
+                if admitted and head is not None:
+                    # The new head may be sleeping without a timer
+                    head.wake()
+                return head
+            heapq.heappop(self._queue)
+            self._depth -= 1
+            self._admit(head, now)
+            head.wake()
+            admitted = True
+
+    def _remove(self, waiter: _Waiter, outcome: AdmissionRejected):
+        waiter.outcome = outcome
+        self._depth -= 1
+        waiter.wake()
+        head = self._head()
+        if head is not None:
+            head.wake()
+
+    def _shed(self, waiter: _Waiter, reason: str, counter: str = "shed"):
+        self._counters[counter] += 1
+        self._remove(waiter, AdmissionRejected(f"{self.name} request {reason}"))
+
+    def _enqueue(self, priority: int, requests: int, tokens: int,
+                 loop: Optional[asyncio.AbstractEventLoop]) -> _Waiter:
+        waiter = _Waiter(priority, requests, tokens, loop)
+        if self._depth >= self.max_queue:
+            live = [entry for entry in self._queue if entry[2].outcome is None]
+            worst = max(live, key=lambda entry: (entry[0], entry[1]), default=None)
+            if worst is None or worst[0] <= priority:
+                self._counters["shed"] += 1
+                raise AdmissionRejected(f"{self.name} admission queue is full ({self.max_queue} waiting)")
+            self._shed(worst[2], "shed for more urgent work")
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self._depth += 1
+        self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], self._depth)
+        return waiter
+
+    def _poll(self, waiter: _Waiter) -> Optional[float]:
+        """Settle the waiter if it can be; otherwise seconds to sleep before polling again"""
+        now = time.monotonic()
+        head = self._pump(now)
+        if waiter.outcome is not None:
+            return None
+        if self.max_wait is not None and now - waiter.enqueued >= self.max_wait:
+            self._shed(waiter, f"waited longer than {self.max_wait}s", "expired")
+            return None
+        remaining = self.max_wait - (now - waiter.enqueued) if self.max_wait is not None else 60.0
+        # Only the head sleeps until quota refills; the rest wait to be woken
+        return min(remaining, self._ready_in(waiter, now)) if waiter is head else remaining
+
+    def _abandon(self, waiter: _Waiter):
+        """Take a waiter that stopped waiting (e.g. a cancelled coroutine) out of the queue"""
+        if waiter.outcome is None:
+            self._remove(waiter, AdmissionRejected(f"{self.name} request abandoned"))
+
+    # Public API
+
+    def acquire(self, tokens: int = 0, requests: int = 1, priority: Optional[int] = None):
+        """Block until the request is admitted; raises AdmissionRejected if it is shed"""
+        if not self.limited:
+            return
+        priority = current_priority() if priority is None else priority
+        with self._lock:
+            waiter = self._enqueue(priority, requests, tokens, None)
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    timeout = self._poll(waiter)
+                if timeout is None:
+                    break
+                waiter.event.wait(timeout)
+        finally:
+            with self._lock:
+                self._abandon(waiter)
+        if waiter.outcome is not True:
+            raise waiter.outcome
+
+    async def aacquire(self, tokens: int = 0, requests: int = 1, priority: Optional[int] = None):
+        """Async variant of acquire; a cancelled waiter leaves the queue"""
+        if not self.limited:
+            return
+        priority = current_priority() if priority is None else priority
+        with self._lock:
+            waiter = self._enqueue(priority, requests, tokens, asyncio.get_running_loop())
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    timeout = self._poll(waiter)
+                if timeout is None:
+                    break
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                self._abandon(waiter)
+        if waiter.outcome is not True:
+            raise waiter.outcome
+
+    def settle(self, reserved: int, actual: int):
+        """Correct a token reservation once the API has reported the real usage"""
+        if self._tokens is None or not actual:
+            return
+        with self._lock:
+            self._tokens.take(actual - reserved)
+
+    def charge(self, tokens: int = 0, requests: int = 1):
+        """Take quota for a request sent without waiting for it
+
+        The buckets may go into debt, which queued requests then wait out.
+        """
+        if not self.limited:
+            return
+        with self._lock:
+            if self._requests is not None:
+                self._requests.take(requests)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+            self._counters["charged"] += requests
+
+    def admit(self, tokens: int = 0) -> "AdmittedCall":
+        """Block until one call is admitted (see AdmittedCall); raises AdmissionRejected if it is shed"""
+        self.acquire(tokens)
+        return AdmittedCall(self, tokens)
+
+    async def aadmit(self, tokens: int = 0) -> "AdmittedCall":
+        """Async variant of admit"""
+        await self.aacquire(tokens)
+        return AdmittedCall(self, tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["queue_depth"] = self._depth
+            stats["wait"] = {PRIORITY_NAMES[priority]: histogram.to_dict()
+                             for priority, histogram in self._wait.items() if histogram.count}
+        stats["rpm"] = self.rpm
+        stats["tpm"] = self.tpm
+        return stats
+
+class AdmittedCall:
+    """One logical upstream call, admitted once before its deadline starts running
+
+    The first request it sends was paid for on admission. Any further request
+    (a hedge, a retry or a fallback model) is charged without queueing: the
+    caller's deadline is already running, and a request stuck in the queue would
+    only be sent after its caller had given up on it.
+    """
+
+    def __init__(self, scheduler: AdmissionScheduler, tokens: int):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self._sent = 0
+        self._lock = threading.Lock()
+
+    def sent(self):
+        with self._lock:
+            self._sent += 1
+            extra = self._sent > 1
+        if extra:
+            self.scheduler.charge(self.tokens)
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """fn, counting each call as a request sent under this admission"""
+        def metered(*args):
+            self.sent()
+            return fn(*args)
+        return metered
+
+    def awrap(self, coro_fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Async variant of wrap"""
+        async def metered(*args):
+            self.sent()
+            return await coro_fn(*args)
+        return metered
+
+# One per upstream quota, shared by every session; the workflow sets the limits from the
+# environment. A call waits at most as long as the upstream's deadline (see resilience.py).
+ADMISSION: Dict[str, AdmissionScheduler] = {
+    "llm": AdmissionScheduler("OpenAI", max_wait=60.0),
+    "tavily": AdmissionScheduler("Tavily", max_wait=20.0),
+}
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    return {kind: scheduler.stats() for kind, scheduler in ADMISSION.items()}
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .fakes import FakeChatModel, FakeSearchTool, LatencyModel
+from .metrics import Histogram
+from .admission import admission_stats
+from .resilience import resilience_stats
+from .routing import ROUTER
+from .search import MedicalSummarizationService
+from .session_io import SessionIO, session_notices
+from .state import StateManager
+from .workflow import AsyncHealthBotWorkflow
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+class ScriptedIO(SessionIO):
+    """A scripted patient that answers each prompt by what it asks for
+
+    Answering by prompt (rather than from a fixed list) keeps the script in step
+    when an injected failure sends the session back to an earlier node.
+    """
+
+    def __init__(self, topics: List[str], rng: random.Random, max_reads: int = 200):
+        self.topics = list(topics)
+        self.topic = None
+        # Asks for one more question from the pool per topic, when offered
+        self.asked_another = False
+        self.rng = rng
+        self.max_reads = max_reads
+        self.reads = 0
+        self.output_chars = 0
+
+    def write(self, text: str = "", end: str = "\n"):
+        self.output_chars += len(text) + len(end)
+
+    def read(self, prompt: str) -> str:
+        self.reads += 1
+        if self.reads > self.max_reads:
+            raise RuntimeError("Scripted session did not finish")
+        if "health topic" in prompt:
+            # A retry after a failed search asks for the same topic again
+            if self.topics:
+                self.topic = self.topics.pop(0)
+                self.asked_another = False
+            return self.topic
+        if "Press Enter" in prompt:
+            return ""
+        if "A, B, C, or D" in prompt:
+            return self.rng.choice("ABCD")
+        if "2 or 3" in prompt and not self.asked_another:
+            self.asked_another = True
+            return "3"
+        if "1 or 2" in prompt or "2 or 3" in prompt:
+            return "1" if self.topics else "2"
+        raise RuntimeError(f"Unexpected prompt: {prompt!r}")
+
+    async def aread(self, prompt: str) -> str:
+        # Yield like a real client would between answers
+        await asyncio.sleep(0)
+        return self.read(prompt)
+
+class BenchmarkRunner:
+    """Drives scripted sessions through the full node graph against fake upstreams
+
+    Every run uses a fresh cache directory unless one is given, so results only
+    depend on the configuration and seed.
+    """
+
+    def __init__(self, sessions: int = 100, concurrency: int = 20, engine: str = "async",
+                 topics_per_session: int = 1, distinct_topics: int = 50,
+                 llm_latency: str = "lognormal:0.8:0.4", tavily_latency: str = "lognormal:0.6:0.4",
+                 llm_failure_rate: float = 0.0, tavily_failure_rate: float = 0.0,
+                 llm_rpm: float = 0, llm_tpm: float = 0, tavily_rpm: float = 0,
+                 seed: int = 1, cache_dir: Optional[str] = None, trace_memory: bool = False):
+        if engine not in ("async", "sync"):
+            raise ValueError(f"Unknown engine '{engine}', expected 'async' or 'sync'")
+        self.config = {
+            "sessions": sessions, "concurrency": concurrency, "engine": engine,
+            "topics_per_session": topics_per_session, "distinct_topics": distinct_topics,
+            "llm_latency": llm_latency, "tavily_latency": tavily_latency,
+            "llm_failure_rate": llm_failure_rate, "tavily_failure_rate": tavily_failure_rate,
+            "llm_rpm": llm_rpm, "llm_tpm": llm_tpm, "tavily_rpm": tavily_rpm,
+            "seed": seed, "trace_memory": trace_memory,
+        }
+        self.cache_dir = cache_dir
+        self.llm = FakeChatModel(LatencyModel(llm_latency, seed), llm_failure_rate, seed)
+        self.search_tool = FakeSearchTool(LatencyModel(tavily_latency, seed + 1), tavily_failure_rate, seed + 1)
+
+    def _scripts(self) -> List[ScriptedIO]:
+        rng = random.Random(self.config["seed"])
+        topics = [f"benchmark topic {index}" for index in range(self.config["distinct_topics"])]
+        return [ScriptedIO([rng.choice(topics) for _ in range(self.config["topics_per_session"])],
+                           random.Random(rng.random()))
+                for _ in range(self.config["sessions"])]
+
+    def _create_workflow(self) -> AsyncHealthBotWorkflow:
+        os.environ["HEALTHBOT_CACHE_DIR"] = self.cache_dir or tempfile.mkdtemp(prefix="healthbot_bench_")
+        # The fakes have no quota, so only the limits asked for are scheduled against
+        os.environ["HEALTHBOT_OPENAI_RPM"] = str(self.config["llm_rpm"])
+        os.environ["HEALTHBOT_OPENAI_TPM"] = str(self.config["llm_tpm"])
+        os.environ["HEALTHBOT_TAVILY_RPM"] = str(self.config["tavily_rpm"])
+        return AsyncHealthBotWorkflow(self.config["concurrency"], llm=self.llm, search_tool=self.search_tool)
+
+    async def _run_async(self, workflow: AsyncHealthBotWorkflow, scripts: List[ScriptedIO],
+                         session_seconds: Histogram) -> list:
+        semaphore = asyncio.Semaphore(self.config["concurrency"])
+
+        async def run(io: ScriptedIO):
+            async with semaphore:
+                started = time.perf_counter()
+                state = await workflow.execute_session(io)
+                session_seconds.observe(time.perf_counter() - started)
+                return state
+
+        return await asyncio.gather(*(run(io) for io in scripts), return_exceptions=True)
+
+    def _run_sync(self, workflow: AsyncHealthBotWorkflow, scripts: List[ScriptedIO],
+                  session_seconds: Histogram) -> list:
+        lock = threading.Lock()
+
+        def run(io: ScriptedIO):
+            started = time.perf_counter()
+            state = StateManager.create_initial_state()
+            try:
+                with session_notices(io):
+                    while state["should_continue"] and state["workflow_step"] != "end":
+                        state = workflow.graph.run_step(state, io)
+            except Exception as e:
+                return e
+            finally:
+                if workflow.speculator is not None:
+                    workflow.speculator.cancel(state["session_id"])
+            with lock:
+                session_seconds.observe(time.perf_counter() - started)
+            return state
+
+        with ThreadPoolExecutor(max_workers=self.config["concurrency"]) as executor:
+            return list(executor.map(run, scripts))
+
+    def run(self) -> Dict[str, Any]:
+        """Run the benchmark and return the machine-readable report"""
+        workflow = self._create_workflow()
+        scripts = self._scripts()
+        session_seconds = Histogram()
+        if self.config["trace_memory"]:
+            tracemalloc.start()
+
+        started = time.perf_counter()
+        if self.config["engine"] == "async":
+            outcomes = asyncio.run(self._run_async(workflow, scripts, session_seconds))
+        else:
+            outcomes = self._run_sync(workflow, scripts, session_seconds)
+        elapsed = time.perf_counter() - started
+
+        memory = {"peak_rss_mb": self._peak_rss_mb()}
+        if self.config["trace_memory"]:
+            memory["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        if workflow.speculator is not None:
+            workflow.speculator.shutdown()
+
+        nodes = workflow.metrics.to_dict()
+        steps = sum(node["wall"]["count"] for node in nodes.values())
+        completed = sum(1 for outcome in outcomes
+                        if isinstance(outcome, dict) and outcome["workflow_step"] == "end")
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        return {
+            "config": self.config,
+            "python": sys.version.split()[0],
+            "elapsed_seconds": elapsed,
+            "sessions": {
+                "completed": completed,
+                "failed": len(errors),
+                "first_error": repr(errors[0]) if errors else None,
+                "latency": session_seconds.to_dict(),
+            },
+            "throughput": {
+                "sessions_per_second": completed / elapsed if elapsed else 0.0,
+                "steps_per_second": steps / elapsed if elapsed else 0.0,
+            },
+            "nodes": nodes,
+            "upstream": {"llm": self.llm.stats(), "tavily": self.search_tool.stats()},
+            "caches": {
+                "search": workflow.search_cache.stats(),
+                "summary": workflow.summary_store.stats(),
+                "speculation": workflow.speculator.stats() if workflow.speculator is not None else None,
+            },
+            "context_packing": MedicalSummarizationService.packer.stats(),
+            "coalescing": workflow.coalescing_stats(),
+            "admission": admission_stats(),
+            "routing": ROUTER.stats(),
+            "resilience": dict(resilience_stats(), search_fallbacks=workflow.nodes.search_service.fallbacks,
+                               search_saturated=workflow.nodes.search_service.saturated),
+            "topics": workflow.topic_index.stats() if workflow.topic_index is not None else None,
+            "memory": memory,
+        }
+
+    @staticmethod
+    def _peak_rss_mb() -> Optional[float]:
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+class LRUCacheTier:
+    """In-memory LRU tier with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, expires_at) for a live entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key: str, value: Any, expires_at: float, tag: Optional[str] = None):
+        """Store an entry, evicting the least recently used ones when full"""
+        with self._lock:
+            self._entries[key] = (value, expires_at, tag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_tag(self, tag: Optional[str], keep: bool = False) -> int:
+        """Delete entries carrying the tag (or, with keep=True, every other entry)"""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if (entry[2] == tag) != keep]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCacheTier:
+    """Disk-backed tier stored in a single SQLite table, bounded by payload bytes
+
+    Expired rows are kept for a further stale_seconds so get(allow_stale=True) can
+    still serve them while an upstream is down.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_bytes: int = 64 * 1024 * 1024,
+                 stale_seconds: float = 0.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                tag TEXT
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+        if "tag" not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN tag TEXT")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Tuple[Any, float]]:
+        """Return (value, expires_at) for a live entry (or a kept stale one with allow_stale), or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.stale_seconds <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            if row[1] <= now and not allow_stale:
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float, tag: Optional[str] = None):
+        """Store an entry and evict least recently used rows above max_bytes"""
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, accessed_at, tag) "
+                f"VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload, len(payload), expires_at, time.time(), tag)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time() - self.stale_seconds,))
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            f"SELECT key, size FROM {self.table} ORDER BY accessed_at ASC"
+        ).fetchall():
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete_tag(self, tag: Optional[str], keep: bool = False) -> int:
+        """Delete rows carrying the tag (or, with keep=True, every other row)"""
+        condition = "tag IS NOT ?" if keep else "tag IS ?"
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE {condition}", (tag,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+class TieredCache:
+    """Two-tier (memory, then disk) cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, memory: Optional[LRUCacheTier] = None,
+                 disk: Optional[SQLiteCacheTier] = None, ttl_seconds: float = 24 * 3600):
+        self.memory = memory if memory is not None else LRUCacheTier()
+        self.disk = disk
+        self.ttl_seconds = ttl_seconds
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "invalidated": 0,
+                          "stale_hits": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look the key up in memory, then on disk (promoting disk hits)"""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._count("memory_hits")
+            return entry[0]
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._count("disk_hits")
+                self.memory.set(key, entry[0], entry[1])
+                return entry[0]
+        self._count("misses")
+        return None
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """An expired value the disk tier still keeps, as a fallback when the upstream is failing"""
+        if self.disk is None:
+            return None
+        entry = self.disk.get(key, allow_stale=True)
+        if entry is None:
+            return None
+        self._count("stale_hits")
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None, tag: Optional[str] = None):
+        """Store a value in every tier with its own expiry time and optional tag"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, expires_at, tag)
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at, tag)
+        self._count("sets")
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def delete_tag(self, tag: Optional[str], keep: bool = False) -> int:
+        """Delete entries by tag from every tier, returning the number removed"""
+        removed = self.memory.delete_tag(tag, keep)
+        if self.disk is not None:
+            removed = max(removed, self.disk.delete_tag(tag, keep))
+        with self._lock:
+            self._counters["invalidated"] += removed
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current hit rate"""
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+def normalize_topic(topic: str) -> str:
+    """Normalize a topic string for use in cache keys"""
+    return " ".join(topic.lower().split())
+
+def make_cache_key(*parts: Any) -> str:
+    """Build a stable hash key from JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def create_search_cache(cache_dir: Optional[str] = None, ttl_seconds: float = 24 * 3600,
+                        max_entries: int = 256, stale_seconds: float = 0.0) -> TieredCache:
+    """Create the default search cache, adding a disk tier when cache_dir is given"""
+    disk = None
+    if cache_dir:
+        disk = SQLiteCacheTier(os.path.join(cache_dir, "healthbot_cache.sqlite3"), table="search",
+                               stale_seconds=stale_seconds)
+    return TieredCache(LRUCacheTier(max_entries), disk, ttl_seconds)
+
+class SummaryStore:
+    """Content-addressed store of patient summaries, tagged by prompt template hash
+
+    Quiz question pools generated from a summary are kept next to it, under the
+    same tag, so invalidating a template drops the pools built on its summaries.
+    """
+
+    def __init__(self, cache: TieredCache, template_hash: str, quiz_pools: Optional[TieredCache] = None):
+        self.cache = cache
+        self.template_hash = template_hash
+        self.quiz_pools = quiz_pools if quiz_pools is not None else TieredCache(ttl_seconds=cache.ttl_seconds)
+
+    def key(self, topic: str, search_results: List[dict], model: Optional[str],
+            temperature: Optional[float], packing: Optional[Dict[str, Any]] = None) -> str:
+        """Hash every input the summary depends on, including context packing settings"""
+        bundle = [(result.get('url'), result.get('content')) for result in search_results]
+        return make_cache_key("summary", topic, bundle, self.template_hash, model, temperature, packing)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def get_stale(self, key: str) -> Optional[str]:
+        return self.cache.get_stale(key)
+
+    def set(self, key: str, summary: str):
+        self.cache.set(key, summary, tag=self.template_hash)
+
+    def get_quiz_pool(self, key: str) -> Optional[List[list]]:
+        return self.quiz_pools.get(key)
+
+    def set_quiz_pool(self, key: str, pool: List[list]):
+        self.quiz_pools.set(key, pool, tag=self.template_hash)
+
+    def invalidate(self, template_hash: Optional[str] = None) -> int:
+        """Drop summaries built from template_hash, or from any template but the current one"""
+        if template_hash is None:
+            self.quiz_pools.delete_tag(self.template_hash, keep=True)
+            return self.cache.delete_tag(self.template_hash, keep=True)
+        self.quiz_pools.delete_tag(template_hash)
+        return self.cache.delete_tag(template_hash)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["template_hash"] = self.template_hash
+        stats["quiz_pools"] = self.quiz_pools.stats()
+        return stats
+
+def create_summary_store(template_hash: str, cache_dir: Optional[str] = None,
+                         ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 256,
+                         stale_seconds: float = 0.0) -> SummaryStore:
+    """Create the default summary store, adding a disk tier when cache_dir is given"""
+    disk = pool_disk = None
+    if cache_dir:
+        path = os.path.join(cache_dir, "healthbot_cache.sqlite3")
+        disk = SQLiteCacheTier(path, table="summaries", stale_seconds=stale_seconds)
+        pool_disk = SQLiteCacheTier(path, table="quiz_pools")
+    return SummaryStore(TieredCache(LRUCacheTier(max_entries), disk, ttl_seconds), template_hash,
+                        TieredCache(LRUCacheTier(max_entries), pool_disk, ttl_seconds))
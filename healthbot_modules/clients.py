@@ -0,0 +1,162 @@
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Importing langchain, langchain_openai and langchain_community costs most of a
+# cold start, so nothing in the package imports them at module level. They are
+# loaded (and clients built) on first use, or ahead of time by warm_in_background().
+
+TRUSTED_MEDICAL_DOMAINS = ["mayoclinic.org", "webmd.com", "nih.gov", "cdc.gov", "healthline.com", "medlineplus.gov"]
+SEARCH_MAX_RESULTS = 3
+SEARCH_DEPTH = "advanced"
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_TEMPERATURE = 0.3
+
+class StartupTimer:
+    """Named timings for the startup report: phases and deferred imports/constructions"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.marks: Dict[str, float] = {}
+        self.deferred: Dict[str, float] = {}
+
+    def reset(self, origin: float):
+        """Measure from an earlier point, e.g. the top of the entry script"""
+        self.origin = origin
+
+    def mark(self, name: str):
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self.origin)
+
+    def record_deferred(self, name: str, seconds: float):
+        with self._lock:
+            self.deferred[name] = self.deferred.get(name, 0.0) + seconds
+
+    def report(self) -> List[str]:
+        with self._lock:
+            marks = dict(self.marks)
+            deferred = dict(self.deferred)
+        lines = [f"{name}: {seconds:.2f}s after start" for name, seconds in marks.items()]
+        if deferred:
+            lines.append(f"deferred off the startup path: {sum(deferred.values()):.2f}s ("
+                         + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in deferred.items()) + ")")
+        return lines
+
+STARTUP = StartupTimer()
+
+def _timed_import(module: str) -> Any:
+    """Import a module, charging first-time cost to the startup report"""
+    started = time.perf_counter()
+    loaded = importlib.import_module(module)
+    seconds = time.perf_counter() - started
+    if seconds > 0.001:
+        STARTUP.record_deferred(f"import {module}", seconds)
+    return loaded
+
+def system_message(content: str) -> Any:
+    return _timed_import("langchain_core.messages").SystemMessage(content=content)
+
+def human_message(content: str) -> Any:
+    return _timed_import("langchain_core.messages").HumanMessage(content=content)
+
+class LazyClient:
+    """Stands in for a client and builds it on first attribute access"""
+
+    __slots__ = ("_factory", "_client", "_lock")
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+class ClientRegistry:
+    """Process-wide OpenAI and Tavily clients, built once and shared by every node and session
+
+    All chat models share one pair of keep-alive httpx pools (sync and async),
+    so connections to the OpenAI API are reused across calls, models and sessions.
+    The Tavily wrapper manages its own HTTP sessions, so one tool instance is shared.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._llms: Dict[Tuple, Any] = {}
+        self._search_tool = None
+        self._http_clients: Optional[Tuple[Any, Any]] = None
+
+    def _build(self, name: str, factory: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        built = factory()
+        STARTUP.record_deferred(name, time.perf_counter() - started)
+        return built
+
+    def http_clients(self) -> Tuple[Any, Any]:
+        """Shared (httpx.Client, httpx.AsyncClient) with bounded keep-alive pools"""
+        with self._lock:
+            if self._http_clients is None:
+                httpx = _timed_import("httpx")
+                limits = httpx.Limits(max_connections=self.max_connections,
+                                      max_keepalive_connections=self.max_keepalive)
+                self._http_clients = (httpx.Client(limits=limits, timeout=self.timeout),
+                                      httpx.AsyncClient(limits=limits, timeout=self.timeout))
+            return self._http_clients
+
+    def llm(self, model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, **kwargs) -> Any:
+        """The shared ChatOpenAI for these settings"""
+        key = (model, temperature, tuple(sorted(kwargs.items())))
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                ChatOpenAI = _timed_import("langchain_openai").ChatOpenAI
+                http_client, http_async_client = self.http_clients()
+                llm = self._llms[key] = self._build(f"ChatOpenAI({model})", lambda: ChatOpenAI(
+                    model=model, temperature=temperature,
+                    http_client=http_client, http_async_client=http_async_client, **kwargs
+                ))
+            return llm
+
+    def search_tool(self) -> Any:
+        """The shared TavilySearchResults tool restricted to trusted medical domains"""
+        with self._lock:
+            if self._search_tool is None:
+                TavilySearchResults = _timed_import("langchain_community.tools.tavily_search").TavilySearchResults
+                self._search_tool = self._build("TavilySearchResults", lambda: TavilySearchResults(
+                    max_results=SEARCH_MAX_RESULTS,
+                    search_depth=SEARCH_DEPTH,
+                    include_domains=TRUSTED_MEDICAL_DOMAINS
+                ))
+            return self._search_tool
+
+    def warm_in_background(self, *warmers: Callable[[], Any]) -> threading.Thread:
+        """Import and build the default clients on a daemon thread (e.g. while the patient types)"""
+        def warm():
+            try:
+                _timed_import("langchain_core.messages")
+                for warmer in warmers or (self.llm, self.search_tool):
+                    warmer()
+            except Exception:
+                # A failure here resurfaces, with its error, on first real use
+                pass
+        thread = threading.Thread(target=warm, name="healthbot-warm", daemon=True)
+        thread.start()
+        return thread
+
+CLIENTS = ClientRegistry()
+
+def resolve_client(client: Any) -> Any:
+    """The real client behind a LazyClient (other clients are returned as they are)"""
+    return client.resolve() if isinstance(client, LazyClient) else client
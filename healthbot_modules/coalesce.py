@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+class CoalescedCallAborted(Exception):
+    """The shared call was interrupted in the thread that was running it"""
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one in-flight call
+
+    The first caller for a key runs the call; callers arriving while it is in
+    flight wait for it and get the same result, or the same exception. Nothing is
+    kept once the call finishes (caching is the caches' job). Sync callers
+    (threads) and async callers are tracked separately, async ones per event
+    loop: a task can only be awaited on its own loop, and one left pending by a
+    loop that was closed is dropped rather than joined.
+
+    An async waiter that is cancelled stops waiting without disturbing the
+    others; the shared call itself is cancelled only when no one is waiting.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._sync_calls: Dict[str, Future] = {}
+        self._async_calls: Dict[Tuple[asyncio.AbstractEventLoop, str], Tuple["asyncio.Task", List[int]]] = {}
+        self._counters = {
+            "calls": 0,       # calls actually made
+            "coalesced": 0,   # duplicate calls avoided by joining one in flight
+            "errors": 0,      # shared calls that raised (each waiter got the error)
+            "cancelled": 0,   # shared calls cancelled after every waiter left
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key: str, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args), or wait for the identical call already running in another thread"""
+        with self._lock:
+            future = self._sync_calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._sync_calls[key] = Future()
+                self._counters["calls"] += 1
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self._count("errors")
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # e.g. KeyboardInterrupt: stop this thread, but give waiters an ordinary error
+            future.set_exception(CoalescedCallAborted(f"{self.name} call was interrupted"))
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+
+    async def ado(self, key: str, coro_fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Async variant of do: await coro_fn(*args) once per key among concurrent callers"""
+        flight = (asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._async_calls.get(flight)
+            if entry is None:
+                self._drop_closed_loops()
+                task = asyncio.ensure_future(coro_fn(*args))
+                entry = self._async_calls[flight] = (task, [0])
+                task.add_done_callback(lambda done, flight=flight: self._async_done(flight, done))
+                self._counters["calls"] += 1
+            else:
+                self._counters["coalesced"] += 1
+            task, waiters = entry
+            waiters[0] += 1
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                with self._lock:
+                    waiters[0] -= 1
+                    abandoned = waiters[0] == 0
+                if abandoned:
+                    task.cancel()
+            raise
+
+    def _drop_closed_loops(self):
+        """Forget calls left pending by a closed loop, whose done callbacks will never run; caller holds the lock"""
+        for flight in [flight for flight in self._async_calls if flight[0].is_closed()]:
+            del self._async_calls[flight]
+
+    def _async_done(self, flight: Tuple[asyncio.AbstractEventLoop, str], task: "asyncio.Task"):
+        with self._lock:
+            entry = self._async_calls.get(flight)
+            if entry is not None and entry[0] is task:
+                del self._async_calls[flight]
+            if task.cancelled():
+                self._counters["cancelled"] += 1
+            elif task.exception() is not None:
+                self._counters["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._drop_closed_loops()
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._sync_calls) + len(self._async_calls)
+        return stats
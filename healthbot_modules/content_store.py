@@ -0,0 +1,311 @@
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import LRUCacheTier, normalize_topic
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# Content image layout, little-endian:
+#   header   magic, format version, entry count, index offset, published at
+#   payloads per entry: topic key length and UTF-8 key, then the zlib JSON entry
+#   index    per entry: key hash, payload offset and length, created at, template hash;
+#            sorted by key hash so lookups binary-search it in place
+_MAGIC = b"HBCI"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIQd")
+_RECORD = struct.Struct("<QQId16s")
+_KEY_LENGTH = struct.Struct("<H")
+
+def _key_hash(topic_key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(topic_key.encode("utf-8"), digest_size=8).digest(), "little")
+
+class ContentStoreLocked(Exception):
+    """Another process is already the content store's writer"""
+
+class ContentImage:
+    """A published, read-only snapshot of a TopicContentStore, memory-mapped
+
+    Every process mapping the same image shares its pages through the OS page
+    cache, so the content is held in memory once per host however many workers
+    read it. Nothing is copied out of the mapping until an entry is decoded.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        magic, version, self.count, self._index, self.published_at = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} content image")
+
+    def _record(self, position: int) -> tuple:
+        return _RECORD.unpack_from(self._map, self._index + position * _RECORD.size)
+
+    def _payload(self, offset: int, length: int) -> Tuple[str, bytes]:
+        key_length, = _KEY_LENGTH.unpack_from(self._map, offset)
+        start = offset + _KEY_LENGTH.size
+        return self._map[start:start + key_length].decode("utf-8"), self._map[start + key_length:offset + length]
+
+    def find(self, topic_key: str) -> Optional[Tuple[bytes, str, float]]:
+        """(compressed entry, template hash, created_at) for a normalized topic, or None"""
+        target = _key_hash(topic_key)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        # Keys whose hashes collide sit next to each other
+        for position in range(low, self.count):
+            key_hash, offset, length, created_at, template_hash = self._record(position)
+            if key_hash != target:
+                break
+            key, payload = self._payload(offset, length)
+            if key == topic_key:
+                return payload, template_hash.rstrip(b"\0").decode("ascii"), created_at
+        return None
+
+    @staticmethod
+    def write(path: str, rows: Iterable[Tuple[str, bytes, str, float]]) -> int:
+        """Write (topic key, compressed entry, template hash, created_at) rows as an image at path
+
+        The image is built under a temporary name and renamed over path, so a
+        reader maps either the old image or the complete new one. Returns the
+        number of entries.
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        index = []
+        with open(temp_path, "wb") as f:
+            f.write(bytes(_HEADER.size))
+            offset = _HEADER.size
+            for topic_key, payload, template_hash, created_at in rows:
+                key = topic_key.encode("utf-8")
+                blob = _KEY_LENGTH.pack(len(key)) + key + payload
+                f.write(blob)
+                index.append((_key_hash(topic_key), offset, len(blob), created_at, template_hash.encode("ascii")))
+                offset += len(blob)
+            index.sort()
+            for record in index:
+                f.write(_RECORD.pack(*record))
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(index), offset, time.time()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return len(index)
+
+class TopicContentStore:
+    """Compact on-disk store of precomputed search results, summary and quiz per topic
+
+    Rows hold zlib-compressed JSON keyed by normalized topic. An entry is fresh
+    while it is younger than ttl_seconds and was built with the current summary
+    prompt template; stale entries are ignored by readers and rebuilt by pre-warming.
+
+    The SQLite table is written by a single writer (one pre-warm run, holding a
+    lock file) and published as a ContentImage. Readers in any number of
+    processes look entries up in the latest image, checking for a newer one at
+    most every refresh_seconds, and only query SQLite until a first image exists.
+    """
+
+    def __init__(self, path: str, template_hash: str, ttl_seconds: float = 7 * 24 * 3600,
+                 memory_entries: int = 256, image_path: Optional[str] = None, refresh_seconds: float = 1.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.template_hash = template_hash
+        self.ttl_seconds = ttl_seconds
+        self.image_path = image_path or os.path.splitext(path)[0] + ".img"
+        self.refresh_seconds = refresh_seconds
+        # Decoded entries this process wrote, or read from SQLite while no image exists
+        self._memory = LRUCacheTier(memory_entries)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "stale_hits": 0, "publishes": 0}
+        self._image: Optional[ContentImage] = None
+        self._image_checked = float("-inf")
+        self._writer = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS topics (
+                topic_key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                template_hash TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def encode(entry: Dict[str, Any]) -> bytes:
+        return zlib.compress(json.dumps(entry, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def decode(payload: bytes) -> Dict[str, Any]:
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def _is_fresh(self, template_hash: str, created_at: float) -> bool:
+        return template_hash == self.template_hash and created_at + self.ttl_seconds > time.time()
+
+    def _mapped(self) -> Optional[ContentImage]:
+        """The latest published image, if any; re-checked at most every refresh_seconds"""
+        now = time.monotonic()
+        if now - self._image_checked < self.refresh_seconds:
+            return self._image
+        self._image_checked = now
+        try:
+            stat = os.stat(self.image_path)
+        except FileNotFoundError:
+            return self._image
+        if self._image is None or self._image.identity != (stat.st_dev, stat.st_ino, stat.st_mtime_ns,
+                                                           stat.st_size):
+            try:
+                image = ContentImage(self.image_path)
+            except (OSError, ValueError, struct.error):
+                return self._image
+            if self._writer is None:
+                # Entries read from SQLite before the first image are in it, or were replaced
+                self._memory.clear()
+            # Lookups still using the old image finish with it; it is unmapped after the last one
+            self._image = image
+        return self._image
+
+    def get(self, topic: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """Return the fresh entry for a topic (or any stored one with allow_stale), or None"""
+        topic_key = normalize_topic(topic)
+        cached = self._memory.get(topic_key)
+        if cached is not None:
+            self._count("hits")
+            return cached[0]
+
+        image = self._mapped()
+        if image is not None:
+            row = image.find(topic_key)
+        else:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT payload, template_hash, created_at FROM topics WHERE topic_key = ?", (topic_key,)
+                ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        if not self._is_fresh(row[1], row[2]):
+            if allow_stale:
+                self._count("stale_hits")
+                return self.decode(row[0])
+            self._count("misses")
+            return None
+
+        entry = self.decode(row[0])
+        if image is None:
+            self._memory.set(topic_key, entry, row[2] + self.ttl_seconds)
+        self._count("hits")
+        return entry
+
+    def acquire_writer(self):
+        """Become the store's single writer, or raise ContentStoreLocked if another process is
+
+        The lock is held until release_writer() or the process exits. Without
+        fcntl (Windows) writers are not checked.
+        """
+        if self._writer is not None:
+            return
+        lock = open(f"{self.image_path}.lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                raise ContentStoreLocked(f"Another process is writing {self.path}")
+        self._writer = lock
+
+    def release_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def publish(self) -> int:
+        """Write every stored entry to a new image for readers to switch to; returns the entry count"""
+        self.acquire_writer()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic_key, payload, template_hash, created_at FROM topics"
+            ).fetchall()
+        count = ContentImage.write(self.image_path, rows)
+        self._count("publishes")
+        return count
+
+    def unpublished(self) -> bool:
+        """Whether entries were written since the latest image was published"""
+        with self._lock:
+            count, newest = self._conn.execute("SELECT COUNT(*), MAX(created_at) FROM topics").fetchone()
+        image = self._mapped()
+        if image is None:
+            return count > 0
+        return count != image.count or (newest or 0.0) > image.published_at
+
+    def put(self, topic: str, search_results: List[dict], summary: str, quiz_content: str,
+            correct_answer: Optional[str], quiz_bundle: Optional[dict] = None,
+            quiz_pool: Optional[List[list]] = None):
+        """Write (or replace) the precomputed content for a topic; readers see it once it is published"""
+        self.acquire_writer()
+        topic_key = normalize_topic(topic)
+        entry = {
+            "topic": topic,
+            "search_results": search_results,
+            "summary": summary,
+            "quiz_content": quiz_content,
+            "correct_answer": correct_answer,
+            "quiz_bundle": quiz_bundle,
+            "quiz_pool": quiz_pool,
+        }
+        created_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO topics (topic_key, payload, template_hash, created_at) VALUES (?, ?, ?, ?)",
+                (topic_key, self.encode(entry), self.template_hash, created_at)
+            )
+            self._conn.commit()
+        self._memory.set(topic_key, entry, created_at + self.ttl_seconds)
+        self._count("writes")
+
+    def fresh_topic_keys(self) -> List[str]:
+        """Normalized topics whose entries are fresh (used to resume pre-warming)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT topic_key, template_hash, created_at FROM topics").fetchall()
+        return [row[0] for row in rows if self._is_fresh(row[1], row[2])]
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+        image = self._image
+        stats["image"] = None if image is None else {
+            "entries": image.count, "bytes": image.size, "published_at": image.published_at,
+        }
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+def create_content_store(cache_dir: str, template_hash: str,
+                         ttl_seconds: float = 7 * 24 * 3600) -> TopicContentStore:
+    """Create the pre-warmed content store (and its published image) in cache_dir"""
+    return TopicContentStore(os.path.join(cache_dir, "healthbot_content.sqlite3"), template_hash, ttl_seconds)
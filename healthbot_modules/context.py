@@ -0,0 +1,241 @@
+import math
+import random
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+# Queries for the sections the summary prompt asks for; passages are ranked per section
+SECTION_QUERIES = [
+    "what is {topic} definition overview condition",
+    "{topic} common signs symptoms",
+    "{topic} causes risk factors",
+    "{topic} treatment options medication therapy management",
+    "{topic} when to seek medical care doctor emergency",
+]
+
+STOPWORDS = frozenset("""a an and are as at be by can for from has have in is it its of on or that the
+    their this to was were will with you your may also which who what when how than these those""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+def terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+class Passage:
+    """A slice of one search result, remembered with its source and position"""
+
+    __slots__ = ("url", "text", "result_index", "position", "terms", "tokens")
+
+    def __init__(self, url: str, text: str, result_index: int, position: int):
+        self.url = url
+        self.text = text
+        self.result_index = result_index
+        self.position = position
+        self.terms = terms(text)
+        self.tokens = estimate_tokens(text)
+
+class ContextPacker:
+    """Packs search results into a token budget before summarization
+
+    Results are split into sentence-aligned passages; near-duplicates (MinHash
+    estimate of shingle Jaccard similarity at or above dedupe_threshold) are
+    dropped, keeping the copy from the higher-ranked result. Passages are scored
+    against each required section with BM25 and taken round-robin, best first,
+    until token_budget is spent, so every section gets material. Packed passages
+    keep their source URL and original order. token_budget=0 disables packing.
+
+    A sentence longer than passage_words (e.g. unpunctuated page text) is split
+    into passage_words-word pieces, and if even the best passage does not fit the
+    budget it is cut down to it, so results with any text always pack something.
+    """
+
+    # Bump when packing changes what it returns for the same params
+    VERSION = 2
+
+    def __init__(self, token_budget: int = 1200, passage_words: int = 60, dedupe_threshold: float = 0.7,
+                 shingle_size: int = 3, num_perm: int = 32, bm25_k1: float = 1.5, bm25_b: float = 0.75):
+        self.token_budget = token_budget
+        self.passage_words = passage_words
+        self.dedupe_threshold = dedupe_threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bm25_k1 = bm25_k1
+        self.bm25_b = bm25_b
+        # Fixed seed: signatures (and so packing) must not vary between processes
+        rng = random.Random(0)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                       for _ in range(num_perm)]
+        self._lock = threading.Lock()
+        self._counters = {"packed": 0, "input_tokens": 0, "packed_tokens": 0, "duplicates": 0}
+
+    def params(self) -> Dict[str, Any]:
+        """Everything packing output depends on (part of the summary store key)"""
+        return {
+            "version": self.VERSION, "token_budget": self.token_budget, "passage_words": self.passage_words,
+            "dedupe_threshold": self.dedupe_threshold, "shingle_size": self.shingle_size,
+            "num_perm": self.num_perm, "bm25_k1": self.bm25_k1, "bm25_b": self.bm25_b,
+        }
+
+    def split_passages(self, search_results: List[dict]) -> List[Passage]:
+        passages = []
+        for result_index, result in enumerate(search_results):
+            url = result.get('url', 'Unknown source')
+            current: List[str] = []
+            current_words = 0
+            for sentence in self._sentences(result.get('content') or ''):
+                current.append(sentence)
+                current_words += len(sentence.split())
+                if current_words >= self.passage_words:
+                    passages.append(Passage(url, " ".join(current), result_index, len(passages)))
+                    current, current_words = [], 0
+            if current:
+                passages.append(Passage(url, " ".join(current), result_index, len(passages)))
+        return passages
+
+    def _sentences(self, text: str) -> Iterator[str]:
+        """Sentences of text, with any longer than passage_words split into pieces that long"""
+        for sentence in _SENTENCE_END.split(text):
+            words = sentence.split()
+            if len(words) <= self.passage_words:
+                if words:
+                    yield sentence.strip()
+                continue
+            for start in range(0, len(words), self.passage_words):
+                yield " ".join(words[start:start + self.passage_words])
+
+    def _truncated(self, passage: Passage) -> Passage:
+        """passage cut at a word boundary to fit token_budget"""
+        limit = self.token_budget * 4
+        text = passage.text[:limit]
+        if len(passage.text) > limit and " " in text:
+            text = text[:text.rindex(" ")]
+        return Passage(passage.url, text, passage.result_index, passage.position)
+
+    def _signature(self, passage: Passage) -> List[int]:
+        words = passage.terms or [passage.text.lower()]
+        size = min(self.shingle_size, len(words))
+        shingles = {zlib.crc32(" ".join(words[index:index + size]).encode("utf-8"))
+                    for index in range(len(words) - size + 1)}
+        return [min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles) for a, b in self._perms]
+
+    def dedupe(self, passages: List[Passage]) -> List[Passage]:
+        kept: List[Passage] = []
+        signatures: List[List[int]] = []
+        for passage in passages:
+            signature = self._signature(passage)
+            duplicate = any(
+                sum(1 for left, right in zip(signature, other) if left == right) / self.num_perm
+                >= self.dedupe_threshold
+                for other in signatures
+            )
+            if not duplicate:
+                kept.append(passage)
+                signatures.append(signature)
+        return kept
+
+    def bm25_scores(self, query: str, passages: List[Passage]) -> List[float]:
+        count = len(passages)
+        average_length = sum(len(passage.terms) for passage in passages) / count or 1.0
+        document_frequency = Counter()
+        for passage in passages:
+            document_frequency.update(set(passage.terms))
+        query_terms = set(terms(query))
+
+        scores = []
+        for passage in passages:
+            frequencies = Counter(passage.terms)
+            length_norm = self.bm25_k1 * (1 - self.bm25_b + self.bm25_b * len(passage.terms) / average_length)
+            score = 0.0
+            for term in query_terms:
+                frequency = frequencies.get(term)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (self.bm25_k1 + 1) / (frequency + length_norm)
+            scores.append(score)
+        return scores
+
+    def pack(self, topic: str, search_results: List[dict]) -> List[dict]:
+        """Return [{'url', 'content'}] passages that fit the token budget, in source order"""
+        if self.token_budget <= 0:
+            return [{"url": result.get('url', 'Unknown source'), "content": result.get('content', '')}
+                    for result in search_results]
+
+        passages = self.split_passages(search_results)
+        unique = self.dedupe(passages)
+        if unique:
+            rankings = []
+            for query in SECTION_QUERIES:
+                scores = self.bm25_scores(query.format(topic=topic), unique)
+                rankings.append([index for index in sorted(range(len(unique)), key=lambda i: -scores[i])
+                                 if scores[index] > 0])
+            chosen = self._fill(unique, rankings)
+            if not chosen:
+                # Nothing matched any section: keep the highest-ranked results' passages
+                chosen = self._fill(unique, [list(range(len(unique)))])
+            if not chosen:
+                # Not even one passage fits: cut the best down to the budget
+                best = next((ranking[0] for ranking in rankings if ranking), 0)
+                unique[best] = self._truncated(unique[best])
+                chosen = {best}
+        else:
+            chosen = []
+
+        packed = [unique[index] for index in sorted(chosen, key=lambda i: unique[i].position)]
+        self._record(passages, len(passages) - len(unique), packed)
+        return self._merge_by_source(packed)
+
+    def _fill(self, passages: List[Passage], rankings: List[List[int]]) -> set:
+        """Take each section's best remaining passage in turn until nothing more fits"""
+        chosen = set()
+        remaining = self.token_budget
+        cursors = [0] * len(rankings)
+        progress = True
+        while progress:
+            progress = False
+            for section, ranking in enumerate(rankings):
+                while cursors[section] < len(ranking):
+                    index = ranking[cursors[section]]
+                    cursors[section] += 1
+                    if index in chosen or passages[index].tokens > remaining:
+                        continue
+                    chosen.add(index)
+                    remaining -= passages[index].tokens
+                    progress = True
+                    break
+        return chosen
+
+    @staticmethod
+    def _merge_by_source(packed: List[Passage]) -> List[dict]:
+        merged: List[dict] = []
+        by_url: Dict[str, dict] = {}
+        for passage in packed:
+            entry = by_url.get(passage.url)
+            if entry is None:
+                entry = by_url[passage.url] = {"url": passage.url, "content": passage.text}
+                merged.append(entry)
+            else:
+                entry["content"] += " ... " + passage.text
+        return merged
+
+    def _record(self, passages: List[Passage], duplicates: int, packed: List[Passage]):
+        with self._lock:
+            self._counters["packed"] += 1
+            self._counters["input_tokens"] += sum(passage.tokens for passage in passages)
+            self._counters["packed_tokens"] += sum(passage.tokens for passage in packed)
+            self._counters["duplicates"] += duplicates
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["token_budget"] = self.token_budget
+        stats["reduction"] = (1 - stats["packed_tokens"] / stats["input_tokens"]) if stats["input_tokens"] else 0.0
+        return stats
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .search import TAVILY_TOOL_NAME
+
+# Offline stand-ins for ChatOpenAI and TavilySearchResults with injected latency
+# and failures, used by the benchmark harness. Responses are canned but shaped
+# like the real ones, so every node and parser runs its normal path.
+
+class FakeUpstreamError(Exception):
+    """An injected upstream failure"""
+
+class LatencyModel:
+    """Seeded latency distribution, parsed from specs like 'fixed:0.2',
+    'uniform:0.1:0.4' or 'lognormal:0.8:0.5' (median seconds, sigma)"""
+
+    DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, spec: str = "fixed:0", seed: Optional[int] = None):
+        parts = spec.split(":")
+        self.distribution = parts[0]
+        if self.distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{self.distribution}', "
+                             f"expected one of {self.DISTRIBUTIONS}")
+        self.params = [float(value) for value in parts[1:]]
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}[self.distribution]
+        if len(self.params) != expected:
+            raise ValueError(f"Latency spec '{spec}' needs {expected} parameter(s)")
+        self.spec = spec
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.params[0]
+            if self.distribution == "uniform":
+                return self._random.uniform(*self.params)
+            median, sigma = self.params
+            return median * self._random.lognormvariate(0.0, sigma)
+
+class FakeMessage:
+    """Just enough of an AIMessage/AIMessageChunk for the services"""
+
+    __slots__ = ("content", "tool_calls", "usage_metadata")
+
+    def __init__(self, content: str, tool_calls: Optional[List[dict]] = None,
+                 input_tokens: int = 0, output_tokens: int = 0):
+        self.content = content
+        self.tool_calls = tool_calls or []
+        self.usage_metadata = None
+        if input_tokens or output_tokens:
+            self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                   "total_tokens": input_tokens + output_tokens}
+
+class _Upstream:
+    """Latency, failure injection and call counting shared by the fakes"""
+
+    def __init__(self, latency: LatencyModel, failure_rate: float, seed: Optional[int]):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0}
+
+    def _draw(self) -> float:
+        """Count a call and return its latency, or raise an injected failure"""
+        with self._lock:
+            self.counters["calls"] += 1
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.counters["failures"] += 1
+        if failed:
+            raise FakeUpstreamError("injected upstream failure")
+        return self.latency.sample()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+QUIZ_BUNDLE = {
+    "question": "According to the summary, what is the first step in managing this condition?",
+    "options": {
+        "A": "Ignoring the symptoms",
+        "B": "Talking to a healthcare provider",
+        "C": "Stopping all medication",
+        "D": "Waiting a year",
+    },
+    "correct_answer": "B",
+    "feedback": {
+        "A": "The summary advises against ignoring symptoms.",
+        "B": "Correct: the summary recommends speaking with a healthcare provider first.",
+        "C": "The summary does not suggest stopping medication.",
+        "D": "The summary recommends acting promptly.",
+    },
+}
+
+SUMMARY_TEXT = (
+    "## What it is\nA common condition that affects many people.\n\n"
+    "## Symptoms\nFatigue, discomfort and changes in daily routines are typical.\n\n"
+    "## Treatment\nTalk to a healthcare provider first; treatment options exist.\n\n"
+    "## When to see a doctor\nSeek care if symptoms get worse.\n\n"
+    "Sources: mayoclinic.org, cdc.gov"
+)
+
+class FakeChatModel(_Upstream):
+    """ChatOpenAI stand-in: invoke/ainvoke/stream/astream/batch, bind_tools and bind
+
+    Replies are chosen from the prompt: tool calls when tools are bound, a JSON
+    bundle, classic quiz text, grading feedback, or otherwise a summary.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None, failure_rate: float = 0.0,
+                 seed: Optional[int] = None, chunk_chars: int = 16, ttft_fraction: float = 0.3,
+                 model_name: str = "fake-chat"):
+        super().__init__(latency or LatencyModel(), failure_rate, seed)
+        self.model_name = model_name
+        self.temperature = 0.3
+        self.chunk_chars = chunk_chars
+        # Share of the latency spent before the first streamed chunk
+        self.ttft_fraction = ttft_fraction
+        self.tools = None
+
+    def bind_tools(self, tools: list) -> "FakeChatModel":
+        bound = FakeChatModel.__new__(FakeChatModel)
+        bound.__dict__.update(self.__dict__)
+        bound.tools = tools
+        return bound
+
+    def bind(self, **kwargs) -> "FakeChatModel":
+        """A copy answering as kwargs['model'] (other request parameters are ignored)"""
+        bound = FakeChatModel.__new__(FakeChatModel)
+        bound.__dict__.update(self.__dict__)
+        bound.model_name = kwargs.get("model", self.model_name)
+        return bound
+
+    def _reply(self, messages: list) -> FakeMessage:
+        prompt = "\n".join(message.content for message in messages)
+        if self.tools:
+            query = messages[-1].content.strip().splitlines()[0][:80]
+            calls = [{"name": TAVILY_TOOL_NAME, "args": {"query": f"{query} {aspect}"}, "id": f"call_{index}"}
+                     for index, aspect in enumerate(("symptoms", "treatment"))]
+            return FakeMessage("", calls, input_tokens=len(prompt) // 4, output_tokens=20)
+        if '"questions"' in prompt:
+            content = json.dumps({"questions": self._pool_questions(prompt)})
+        elif "single JSON object" in prompt:
+            content = json.dumps(QUIZ_BUNDLE)
+        elif "multiple choice" in prompt:
+            content = self._classic_quiz()
+        elif "educational feedback" in prompt:
+            content = "Grade: A\nThe summary explains why this answer is right."
+        else:
+            content = SUMMARY_TEXT
+        return FakeMessage(content, input_tokens=len(prompt) // 4, output_tokens=len(content) // 4)
+
+    @staticmethod
+    def _pool_questions(prompt: str) -> List[dict]:
+        match = re.search(r"create (\d+) different", prompt)
+        size = int(match.group(1)) if match else 3
+        return [dict(QUIZ_BUNDLE, question=f"{QUIZ_BUNDLE['question']} (question {index + 1})")
+                for index in range(size)]
+
+    @staticmethod
+    def _classic_quiz() -> str:
+        lines = [f"Question: {QUIZ_BUNDLE['question']}"]
+        lines += [f"{letter}) {text}" for letter, text in QUIZ_BUNDLE["options"].items()]
+        lines.append(f"Correct Answer: {QUIZ_BUNDLE['correct_answer']}")
+        return "\n".join(lines)
+
+    def _chunks(self, reply: FakeMessage) -> List[FakeMessage]:
+        text = reply.content
+        chunks = [FakeMessage(text[index:index + self.chunk_chars])
+                  for index in range(0, len(text), self.chunk_chars)] or [FakeMessage("")]
+        chunks[-1].usage_metadata = reply.usage_metadata
+        return chunks
+
+    def invoke(self, messages: list, **kwargs) -> FakeMessage:
+        time.sleep(self._draw())
+        return self._reply(messages)
+
+    async def ainvoke(self, messages: list, **kwargs) -> FakeMessage:
+        await asyncio.sleep(self._draw())
+        return self._reply(messages)
+
+    def stream(self, messages: list, **kwargs):
+        latency = self._draw()
+        chunks = self._chunks(self._reply(messages))
+        time.sleep(latency * self.ttft_fraction)
+        gap = latency * (1 - self.ttft_fraction) / len(chunks)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(gap)
+
+    async def astream(self, messages: list, **kwargs):
+        latency = self._draw()
+        chunks = self._chunks(self._reply(messages))
+        await asyncio.sleep(latency * self.ttft_fraction)
+        gap = latency * (1 - self.ttft_fraction) / len(chunks)
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(gap)
+
+    def batch(self, inputs: List[list], config: Any = None, return_exceptions: bool = False, **kwargs) -> list:
+        def call(messages: list):
+            try:
+                return self.invoke(messages)
+            except FakeUpstreamError as e:
+                if return_exceptions:
+                    return e
+                raise
+        with ThreadPoolExecutor(max_workers=max(1, len(inputs))) as executor:
+            return list(executor.map(call, inputs))
+
+class FakeSearchTool(_Upstream):
+    """TavilySearchResults stand-in returning canned trusted-source results"""
+
+    name = TAVILY_TOOL_NAME
+
+    def __init__(self, latency: Optional[LatencyModel] = None, failure_rate: float = 0.0,
+                 seed: Optional[int] = None, results_per_query: int = 3):
+        super().__init__(latency or LatencyModel(), failure_rate, seed)
+        self.results_per_query = results_per_query
+
+    def _results(self, args: dict) -> List[dict]:
+        query = args.get("query", "")
+        slug = "-".join(query.lower().split()[:4])
+        domains = ("mayoclinic.org", "cdc.gov", "nih.gov", "medlineplus.gov")
+        return [{
+            "url": f"https://www.{domains[index % len(domains)]}/{slug}/{index}",
+            "content": f"{query}: overview, common symptoms and treatment options (source {index}).",
+        } for index in range(self.results_per_query)]
+
+    def invoke(self, args: dict, **kwargs) -> List[dict]:
+        time.sleep(self._draw())
+        return self._results(args)
+
+    async def ainvoke(self, args: dict, **kwargs) -> List[dict]:
+        await asyncio.sleep(self._draw())
+        return self._results(args)
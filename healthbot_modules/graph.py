@@ -0,0 +1,98 @@
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .metrics import StepRecord, begin_step, end_step
+from .state import HealthBotState
+
+END_STEP = "end"
+
+# Hooks receive the step's record and the state the node was given (pre) or returned (post)
+NodeHook = Callable[[StepRecord, HealthBotState], None]
+
+class NodeSpec:
+    """A workflow node: its sync and async callables and the steps it may move to"""
+
+    __slots__ = ("name", "fn", "afn", "transitions")
+
+    def __init__(self, name: str, fn: Callable[[HealthBotState], HealthBotState],
+                 transitions: Iterable[str],
+                 afn: Optional[Callable[..., Awaitable[HealthBotState]]] = None):
+        self.name = name
+        self.fn = fn
+        self.afn = afn
+        self.transitions: FrozenSet[str] = frozenset(transitions)
+
+class NodeGraph:
+    """Table-driven executor: maps each workflow_step to its node and allowed transitions"""
+
+    def __init__(self, entry: str):
+        self.entry = entry
+        self.nodes: Dict[str, NodeSpec] = {}
+        self.pre_hooks: List[NodeHook] = []
+        self.post_hooks: List[NodeHook] = []
+
+    def register(self, name: str, fn: Callable[[HealthBotState], HealthBotState],
+                 transitions: Iterable[str], afn: Optional[Callable[..., Awaitable[HealthBotState]]] = None):
+        if name in self.nodes:
+            raise ValueError(f"Node '{name}' is already registered")
+        self.nodes[name] = NodeSpec(name, fn, transitions, afn)
+
+    def validate(self):
+        """Check once at startup that every transition target exists and every node is reachable"""
+        if self.entry not in self.nodes:
+            raise ValueError(f"Entry node '{self.entry}' is not registered")
+        for spec in self.nodes.values():
+            unknown = spec.transitions - set(self.nodes) - {END_STEP}
+            if unknown:
+                raise ValueError(f"Node '{spec.name}' has transitions to unknown steps: {sorted(unknown)}")
+
+        reachable = set()
+        frontier = [self.entry]
+        while frontier:
+            name = frontier.pop()
+            if name in reachable or name == END_STEP:
+                continue
+            reachable.add(name)
+            frontier.extend(self.nodes[name].transitions)
+        unreachable = set(self.nodes) - reachable
+        if unreachable:
+            raise ValueError(f"Nodes unreachable from '{self.entry}': {sorted(unreachable)}")
+
+    def _begin(self, state: HealthBotState) -> Tuple[NodeSpec, StepRecord]:
+        spec = self.nodes.get(state["workflow_step"])
+        if spec is None:
+            raise ValueError(f"No node registered for step '{state['workflow_step']}'")
+        record = begin_step(spec.name)
+        for hook in self.pre_hooks:
+            hook(record, state)
+        return spec, record
+
+    def _finish(self, spec: NodeSpec, record: StepRecord, new_state: HealthBotState) -> HealthBotState:
+        end_step(record)
+        if new_state["workflow_step"] not in spec.transitions:
+            raise ValueError(f"Node '{spec.name}' moved to disallowed step '{new_state['workflow_step']}'")
+        for hook in self.post_hooks:
+            hook(record, new_state)
+        return new_state
+
+    def run_step(self, state: HealthBotState, *args: Any) -> HealthBotState:
+        """Run the node for the current workflow_step with pre/post hooks; extra args are passed to the node"""
+        spec, record = self._begin(state)
+        try:
+            new_state = spec.fn(state, *args)
+        except BaseException:
+            end_step(record)
+            raise
+        return self._finish(spec, record, new_state)
+
+    async def arun_step(self, state: HealthBotState, *args: Any) -> HealthBotState:
+        """Async variant of run_step; extra args are passed to the node"""
+        spec, record = self._begin(state)
+        if spec.afn is None:
+            end_step(record)
+            raise ValueError(f"Node '{spec.name}' has no async variant")
+        try:
+            new_state = await spec.afn(state, *args)
+        except BaseException:
+            end_step(record)
+            raise
+        return self._finish(spec, record, new_state)
@@ -0,0 +1,153 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+class Histogram:
+    """Fixed-bucket latency histogram (bucket bounds in seconds)"""
+
+    BOUNDS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (capped at the observed max)"""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                bound = self.BOUNDS[index] if index < len(self.BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+class StepRecord:
+    """Timing and usage collected while one node runs"""
+
+    __slots__ = ("node", "started", "wall_seconds", "llm_seconds", "llm_calls",
+                 "tavily_seconds", "tavily_calls", "tokens", "closed")
+
+    def __init__(self, node: str):
+        self.node = node
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+        self.tavily_seconds = 0.0
+        self.tavily_calls = 0
+        self.tokens = 0
+        self.closed = False
+
+    def close(self):
+        self.wall_seconds = time.perf_counter() - self.started
+        self.closed = True
+
+_current_step: contextvars.ContextVar = contextvars.ContextVar("healthbot_current_step", default=None)
+_record_lock = threading.Lock()
+
+def begin_step(node: str) -> StepRecord:
+    """Make a new StepRecord current for upstream calls in this context"""
+    record = StepRecord(node)
+    _current_step.set(record)
+    return record
+
+def end_step(record: StepRecord):
+    record.close()
+    if _current_step.get() is record:
+        _current_step.set(None)
+
+def current_node() -> Optional[str]:
+    """The node running in this context, if its step is still open"""
+    record = _current_step.get()
+    return None if record is None or record.closed else record.node
+
+def record_upstream_call(kind: str, seconds: float, tokens: int = 0):
+    """Attribute an LLM or Tavily call to the node running in this context
+
+    Calls that finish after their node has ended (e.g. background speculation)
+    are not attributed to it.
+    """
+    record = _current_step.get()
+    if record is None or record.closed:
+        return
+    with _record_lock:
+        if kind == "llm":
+            record.llm_seconds += seconds
+            record.llm_calls += 1
+            record.tokens += tokens
+        else:
+            record.tavily_seconds += seconds
+            record.tavily_calls += 1
+
+class WorkflowMetrics:
+    """Per-node histograms of wall-clock, LLM and Tavily latency plus token usage
+
+    Register post_node as a graph post-node hook.
+    """
+
+    def __init__(self):
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def post_node(self, record: StepRecord, state: Optional[dict] = None):
+        with self._lock:
+            node = self._nodes.setdefault(record.node, {
+                "wall": Histogram(), "llm": Histogram(), "tavily": Histogram(),
+                "llm_calls": 0, "tavily_calls": 0, "tokens": 0,
+            })
+            node["wall"].observe(record.wall_seconds)
+            if record.llm_calls:
+                node["llm"].observe(record.llm_seconds)
+            if record.tavily_calls:
+                node["tavily"].observe(record.tavily_seconds)
+            node["llm_calls"] += record.llm_calls
+            node["tavily_calls"] += record.tavily_calls
+            node["tokens"] += record.tokens
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "wall": node["wall"].to_dict(),
+                    "llm": node["llm"].to_dict(),
+                    "tavily": node["tavily"].to_dict(),
+                    "llm_calls": node["llm_calls"],
+                    "tavily_calls": node["tavily_calls"],
+                    "tokens": node["tokens"],
+                }
+                for name, node in self._nodes.items()
+            }
+
+    def report(self) -> List[str]:
+        """Format one line per node for the end-of-session summary"""
+        lines = [f"{'node':<15}{'runs':>6}{'p50':>9}{'p95':>9}{'max':>9}{'llm avg':>10}{'tavily avg':>12}{'tokens':>9}"]
+        for name, node in self.to_dict().items():
+            wall = node["wall"]
+            lines.append(
+                f"{name:<15}{wall['count']:>6}{wall['p50']:>8.2f}s{wall['p95']:>8.2f}s{wall['max']:>8.2f}s"
+                f"{node['llm']['avg']:>9.2f}s{node['tavily']['avg']:>11.2f}s{node['tokens']:>9}"
+            )
+        return lines
@@ -1,245 +1,686 @@
+import random
+from typing import Callable, List, Optional
+
+from .cache import LRUCacheTier
 from .state import HealthBotState, StateManager
 from .search import MedicalSearchService, MedicalSummarizationService
 from .quiz import QuizService
+from .speculation import QuizSpeculator
+from .content_store import TopicContentStore
+from .topics import TopicIndex
+from .session_io import CONSOLE, SessionIO
+
+class TokenPrinter:
+    """Writes streamed tokens to the session as they arrive, showing a header before the first one"""
+
+    def __init__(self, io: SessionIO, header: Optional[Callable[[], None]] = None):
+        self.io = io
+        self.header = header
+        self.started = False
+
+    def __call__(self, token: str):
+        if not self.started:
+            self.started = True
+            if self.header is not None:
+                self.header()
+        self.io.write(token, end="")
 
 class HealthBotNodes:
     """Individual workflow nodes with single responsibilities"""
-    
-    def __init__(self, llm, llm_with_tools):
+
+    def __init__(self, llm, llm_with_tools, search_cache=None, summary_store=None,
+                 speculator: Optional[QuizSpeculator] = None, quiz_mode: str = "bundle",
+                 search_strategy: str = "planner", stream: bool = False,
+                 content_store: Optional[TopicContentStore] = None, search_tool=None,
+                 topic_index: Optional[TopicIndex] = None, quiz_pool_size: int = 5):
         self.llm = llm
         self.llm_with_tools = llm_with_tools
-        self.search_service = MedicalSearchService()
-        
-    def get_topic_node(self, state: HealthBotState) -> HealthBotState:
-        """Node: Get health topic from patient"""
-        print("\n" + "="*70)
-        print("HEALTHBOT - AI-POWERED PATIENT EDUCATION SYSTEM")
-        print("="*70)
-        print("I can help you learn about medical conditions, treatments, and health topics.")
-        print("All information comes from trusted medical sources like Mayo Clinic, NIH, and CDC.")
-        print("="*70)
-        
-        topic = input("\nWhat health topic or medical condition would you like to learn about?\n>>> ").strip()
-        
+        self.search_service = MedicalSearchService(cache=search_cache, strategy=search_strategy,
+                                                   search_tool=search_tool, content_store=content_store)
+        self.summary_store = summary_store
+        # When set, quiz generation starts as soon as the summary exists
+        self.speculator = speculator
+        # "bundle" generates per-option feedback up front so grading needs no LLM call;
+        # "pool" generates quiz_pool_size such questions at once and asks them locally
+        self.quiz_mode = quiz_mode
+        self.quiz_pool_size = quiz_pool_size
+        self._random = random.Random()
+        # Stream summary, quiz and feedback tokens to the patient as they arrive
+        self.stream = stream
+        # Pre-warmed content is consulted before any network call. Each session's entry is
+        # looked up (and decoded) once per topic; session_id -> (topic key, entry or None)
+        self.content_store = content_store
+        self._session_entries = LRUCacheTier(max_entries=4096)
+        # Maps the patient's wording to one canonical topic before anything is keyed by it
+        self.topic_index = topic_index
+
+    # Shared display and state-transition helpers for the sync and async nodes
+
+    def _printer(self, io: SessionIO, header: Optional[Callable[[], None]] = None) -> Optional[TokenPrinter]:
+        return TokenPrinter(io, header) if self.stream else None
+
+    @staticmethod
+    def _topic_key(state: HealthBotState) -> Optional[str]:
+        """The canonical topic that keys caches and shared calls (the patient's wording if none)"""
+        return state.get('topic_key') or state.get('current_topic')
+
+    def _precomputed(self, state: HealthBotState) -> Optional[dict]:
+        topic_key = self._topic_key(state)
+        if self.content_store is None or not topic_key:
+            return None
+        held = self._session_entries.get(state["session_id"])
+        if held is not None and held[0][0] == topic_key:
+            return held[0][1]
+        entry = self.content_store.get(topic_key)
+        self._session_entries.set(state["session_id"], (topic_key, entry), float("inf"))
+        return entry
+
+    def _precomputed_summary(self, state: HealthBotState) -> Optional[str]:
+        """Pre-warmed summary, if it was built from exactly this session's search results"""
+        entry = self._precomputed(state)
+        if entry is None or entry["search_results"] != state['search_results']:
+            return None
+        return entry["summary"]
+
+    def _precomputed_quiz(self, state: HealthBotState) -> Optional[tuple]:
+        """Pre-warmed (quiz_content, correct_answer, quiz_bundle) for this session's summary"""
+        entry = self._precomputed(state)
+        if entry is None or entry["summary"] != state['summary'] or not entry["quiz_content"]:
+            return None
+        return entry["quiz_content"], entry["correct_answer"], entry["quiz_bundle"]
+
+    def _precomputed_pool(self, state: HealthBotState) -> Optional[List[list]]:
+        """Pre-warmed question pool for this session's summary"""
+        entry = self._precomputed(state)
+        if entry is None or entry["summary"] != state['summary']:
+            return None
+        return entry.get("quiz_pool")
+
+    @property
+    def _single_quiz_mode(self) -> str:
+        """Mode for generating one question, when a pool is not wanted or could not be built"""
+        return "bundle" if self.quiz_mode == "pool" else self.quiz_mode
+
+    def _speculate_quiz(self, state: HealthBotState, summary: str):
+        if self.quiz_mode == "pool":
+            self.speculator.start(state["session_id"], summary, QuizService.get_quiz_pool, self.llm,
+                state['current_topic'], summary, self.quiz_pool_size, self.summary_store, self._topic_key(state))
+        else:
+            self.speculator.start(state["session_id"], summary, QuizService.generate_quiz, self.llm,
+                state['current_topic'], summary, self.quiz_mode, None, self._topic_key(state))
+
+    def _aspeculate_quiz(self, state: HealthBotState, summary: str):
+        if self.quiz_mode == "pool":
+            self.speculator.astart(state["session_id"], summary, QuizService.aget_quiz_pool(self.llm,
+                state['current_topic'], summary, self.quiz_pool_size, self.summary_store,
+                key_topic=self._topic_key(state)))
+        else:
+            self.speculator.astart(state["session_id"], summary, QuizService.agenerate_quiz(self.llm,
+                state['current_topic'], summary, self.quiz_mode, key_topic=self._topic_key(state)))
+
+    @staticmethod
+    def _pool_failed(io: SessionIO, error: ValueError):
+        io.write(f"Could not build a question pool ({error}); generating a single question instead.")
+
+    @staticmethod
+    def _was_streamed(state: HealthBotState, msg_type: str) -> bool:
+        """Whether the latest message of this type was already streamed to the patient"""
+        for message in reversed(state["messages"]):
+            if message["type"] == msg_type:
+                return bool(message.get("streamed"))
+        return False
+
+    @staticmethod
+    def _show_welcome(io: SessionIO):
+        io.write("\n" + "="*70)
+        io.write("HEALTHBOT - AI-POWERED PATIENT EDUCATION SYSTEM")
+        io.write("="*70)
+        io.write("I can help you learn about medical conditions, treatments, and health topics.")
+        io.write("All information comes from trusted medical sources like Mayo Clinic, NIH, and CDC.")
+        io.write("="*70)
+
+    def _topic_entered(self, io: SessionIO, state: HealthBotState, topic: str) -> HealthBotState:
         if not topic:
-            print("Please enter a valid health topic.")
+            io.write("Please enter a valid health topic.")
             return state
-        
-        # Update state
-        new_state = StateManager.update_state(state, 
+
+        # The patient's wording is what is shown to them; everything shared between sessions
+        # (searches, summaries, quizzes) is built and keyed from the canonical topic instead
+        canonical, how = topic, "new"
+        if self.topic_index is not None:
+            canonical, how = self.topic_index.resolve(topic)
+        if how == "fuzzy":
+            io.write(f"Treating '{topic}' as a misspelling of '{canonical}'.")
+        elif how == "synonym":
+            io.write(f"Treating '{topic}' as another name for '{canonical}'.")
+
+        new_state = StateManager.update_state(state,
             current_topic=topic,
+            topic_key=canonical,
             workflow_step="search"
         )
-        new_state = StateManager.add_message(new_state, "user_input", f"Learning topic: {topic}")
-        
+        new_state = StateManager.add_message(new_state, "user_input", f"Learning topic: {topic}",
+                                             topic_key=canonical)
+        return new_state
+
+    @staticmethod
+    def _search_done(io: SessionIO, state: HealthBotState, search_results: List[dict]) -> HealthBotState:
+        io.write(f"Found {len(search_results)} relevant medical sources!")
+
+        new_state = StateManager.update_state(state,
+            search_results=search_results,
+            workflow_step="summarize"
+        )
+        new_state = StateManager.add_message(new_state, "search_completed",
+            f"OpenAI called Tavily and found {len(search_results)} sources",
+            results_count=len(search_results)
+        )
+        return new_state
+
+    @staticmethod
+    def _summary_done(io: SessionIO, state: HealthBotState, summary: str, cached: bool,
+                      printer: Optional[TokenPrinter] = None) -> HealthBotState:
+        streamed = printer is not None and printer.started
+        if streamed:
+            io.write("\n" + "="*70)
+        if cached:
+            io.write("Patient-friendly summary served from the summary store!")
+        else:
+            io.write("Patient-friendly summary created from search results!")
+
+        new_state = StateManager.update_state(state,
+            summary=summary,
+            workflow_step="present_info"
+        )
+        new_state = StateManager.add_message(new_state, "summary_created",
+            "3-4 paragraph summary generated using only search results",
+            summary=summary,
+            cached=cached,
+            streamed=streamed
+        )
+        return new_state
+
+    @staticmethod
+    def _show_info_header(io: SessionIO, state: HealthBotState):
+        io.write("\n" + "="*70)
+        io.write(f"HEALTH EDUCATION: {state['current_topic'].upper()}")
+        io.write("="*70)
+
+    def _show_info(self, io: SessionIO, state: HealthBotState):
+        if self._was_streamed(state, "summary_created"):
+            return
+        self._show_info_header(io, state)
+        io.write(state["summary"])
+        io.write("="*70)
+
+    @staticmethod
+    def _info_read(state: HealthBotState) -> HealthBotState:
+        new_state = StateManager.update_state(state, workflow_step="generate_quiz")
+        new_state = StateManager.add_message(new_state, "info_presented",
+            "Patient has read the health information")
+        return new_state
+
+    @staticmethod
+    def _quiz_done(io: SessionIO, state: HealthBotState, quiz_content: str, correct_answer: str,
+                   quiz_bundle: Optional[dict] = None, printer: Optional[TokenPrinter] = None,
+                   note: str = "Quiz question generated from summary!") -> HealthBotState:
+        streamed = printer is not None and printer.started
+        if streamed:
+            io.write()
+        else:
+            io.write(note)
+
+        new_state = StateManager.update_state(state,
+            quiz_question=quiz_content,
+            correct_answer=correct_answer,
+            quiz_bundle=quiz_bundle,
+            workflow_step="present_quiz"
+        )
+        new_state = StateManager.add_message(new_state, "quiz_generated",
+            "Quiz question created using only summary data",
+            quiz=quiz_content,
+            streamed=streamed
+        )
+        return new_state
+
+    def _ask_from_pool(self, io: SessionIO, state: HealthBotState, pool: List[list],
+                       again: bool = False) -> HealthBotState:
+        """Pick a question from the pool the patient has not been asked yet; no model call"""
+        asked = state.get('quiz_asked') or []
+        if len(asked) >= len(pool):
+            # Every question has been asked: go round again
+            asked = []
+        index = self._random.choice([index for index in range(len(pool)) if index not in asked])
+        bundle = QuizService.unpack_question(pool[index])
+        # Replace rather than append to the list, so the checkpointer sees the change
+        new_state = StateManager.update_state(state, quiz_pool=pool, quiz_asked=asked + [index])
+        return self._quiz_done(io, new_state, QuizService.format_quiz_bundle(bundle), bundle["correct_answer"],
+                               bundle, note="\nHere is another question on this topic." if again
+                               else "Quiz question generated from summary!")
+
+    @staticmethod
+    def _more_questions(state: HealthBotState) -> bool:
+        pool = state.get('quiz_pool')
+        return bool(pool) and len(state.get('quiz_asked') or []) < len(pool)
+
+    @staticmethod
+    def _show_quiz_header(io: SessionIO):
+        io.write("\n" + "="*60)
+        io.write("COMPREHENSION CHECK")
+        io.write("="*60)
+
+    def _show_quiz(self, io: SessionIO, state: HealthBotState):
+        if self._was_streamed(state, "quiz_generated"):
+            return
+        self._show_quiz_header(io)
+
+        # Display quiz without showing correct answer
+        lines = state["quiz_question"].split('\n')
+        quiz_display = ""
+
+        for line in lines:
+            if not line.startswith('Correct Answer:'):
+                quiz_display += line + '\n'
+
+        io.write(quiz_display)
+
+    @staticmethod
+    def _answer_given(state: HealthBotState, patient_answer: str) -> HealthBotState:
+        new_state = StateManager.update_state(state,
+            patient_answer=patient_answer,
+            workflow_step="grade_quiz"
+        )
+        new_state = StateManager.add_message(new_state, "patient_answer",
+            f"Patient answered: {patient_answer}")
+        return new_state
+
+    @staticmethod
+    def _show_grade_header(io: SessionIO, grade: str):
+        io.write("\n" + "="*60)
+        io.write("QUIZ RESULTS & FEEDBACK")
+        io.write("="*60)
+        io.write(f"Grade: {grade}")
+        if grade == "A":
+            io.write("CORRECT!")
+        else:
+            io.write("INCORRECT - Let's learn from this!")
+        io.write("-" * 60)
+
+    def _feedback_printer(self, io: SessionIO, state: HealthBotState) -> Optional[TokenPrinter]:
+        # The grade is decided locally, so its header can be shown before any feedback token
+        grade = "A" if state['patient_answer'] == state['correct_answer'] else "F"
+        return self._printer(io, lambda: self._show_grade_header(io, grade))
+
+    @staticmethod
+    def _grade_done(io: SessionIO, state: HealthBotState, grade: str, feedback: str,
+                    printer: Optional[TokenPrinter] = None) -> HealthBotState:
+        is_correct = grade == "A"
+
+        if printer is not None and printer.started:
+            io.write()
+        else:
+            HealthBotNodes._show_grade_header(io, grade)
+            io.write(feedback)
+        io.write("="*60)
+
+        new_state = StateManager.update_state(state,
+            quiz_feedback=feedback,
+            workflow_step="check_continue"
+        )
+        new_state = StateManager.add_message(new_state, "quiz_graded",
+            f"Grade: {grade} - Justified using only summary content",
+            feedback=feedback,
+            correct=is_correct,
+            grade=grade
+        )
         return new_state
-    
-    def search_node(self, state: HealthBotState) -> HealthBotState:
+
+    @staticmethod
+    def _show_continue_menu(io: SessionIO, state: HealthBotState):
+        io.write("\n" + "="*50)
+        io.write("What would you like to do next?")
+        io.write("1. Learn about another health topic")
+        io.write("2. Exit HealthBot")
+        if HealthBotNodes._more_questions(state):
+            io.write("3. Try another question on this topic")
+
+    @staticmethod
+    def _continue_prompt(state: HealthBotState) -> str:
+        return "1, 2 or 3" if HealthBotNodes._more_questions(state) else "1 or 2"
+
+    def _continue_chosen(self, io: SessionIO, state: HealthBotState, choice: str) -> HealthBotState:
+        if choice in ("1", "2"):
+            self._session_entries.delete(state["session_id"])
+        if choice == "1":
+            io.write("\nResetting state for new learning session...")
+            # Reset state for new topic (maintains privacy)
+            new_state = StateManager.reset_state_for_new_topic(state["session_id"])
+            return new_state
+        elif choice == "2":
+            new_state = StateManager.update_state(state,
+                should_continue=False,
+                workflow_step="end"
+            )
+            new_state = StateManager.add_message(new_state, "session_end", "Patient chose to exit")
+            return new_state
+        elif choice == "3" and self._more_questions(state):
+            new_state = StateManager.add_message(state, "another_question",
+                "Patient asked for another question on this topic")
+            return self._ask_from_pool(io, new_state, state['quiz_pool'], again=True)
+        else:
+            io.write(f"Please enter {self._continue_prompt(state)}.")
+            return state
+
+    # Synchronous nodes
+
+    def get_topic_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Node: Get health topic from patient"""
+        self._show_welcome(io)
+        topic = io.read("\nWhat health topic or medical condition would you like to learn about?\n>>> ").strip()
+        return self._topic_entered(io, state, topic)
+
+    def search_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Search medical information using OpenAI + Tavily integration"""
-        print(f"\nUsing AI to search trusted medical sources for: '{state['current_topic']}'")
-        
+        io.write(f"\nUsing AI to search trusted medical sources for: '{state['current_topic']}'")
+
+        entry = self._precomputed(state)
+        if entry is not None:
+            io.write("Serving pre-warmed results from trusted medical sources...")
+            return self._search_done(io, state, entry["search_results"])
+
         try:
             search_results = self.search_service.search_medical_info(
-                state['current_topic'], 
-                self.llm_with_tools
-            )
-            
-            print(f"Found {len(search_results)} relevant medical sources!")
-            
-            # Update state
-            new_state = StateManager.update_state(state,
-                search_results=search_results,
-                workflow_step="summarize"
-            )
-            new_state = StateManager.add_message(new_state, "search_completed",
-                f"OpenAI called Tavily and found {len(search_results)} sources",
-                results_count=len(search_results)
+                state['current_topic'],
+                self.llm_with_tools,
+                self._topic_key(state)
             )
-            
-            return new_state
-            
+            return self._search_done(io, state, search_results)
+
         except Exception as e:
-            print(f"Error in search: {str(e)}")
+            io.write(f"Error in search: {str(e)}")
             new_state = StateManager.update_state(state, workflow_step="get_topic")
             return new_state
-    
-    def summarize_node(self, state: HealthBotState) -> HealthBotState:
+
+    def summarize_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Summarize search results into patient-friendly format"""
-        print("\nCreating patient-friendly summary from search results...")
-        
+        io.write("\nCreating patient-friendly summary from search results...")
+
+        precomputed = self._precomputed_summary(state)
+        if precomputed is not None:
+            return self._summary_done(io, state, precomputed, True)
+
         try:
-            summary = MedicalSummarizationService.create_patient_summary(
+            printer = self._printer(io, lambda: self._show_info_header(io, state))
+            summary, cached = MedicalSummarizationService.create_patient_summary_cached(
                 self.llm,
                 state['current_topic'],
-                state['search_results']
-            )
-            
-            print("Patient-friendly summary created from search results!")
-            
-            # Update state
-            new_state = StateManager.update_state(state,
-                summary=summary,
-                workflow_step="present_info"
-            )
-            new_state = StateManager.add_message(new_state, "summary_created",
-                "3-4 paragraph summary generated using only search results",
-                summary=summary
+                state['search_results'],
+                self.summary_store,
+                printer,
+                self._topic_key(state)
             )
-            
-            return new_state
-            
+            new_state = self._summary_done(io, state, summary, cached, printer)
+
         except Exception as e:
-            print(f"Error creating summary: {str(e)}")
+            io.write(f"Error creating summary: {str(e)}")
             new_state = StateManager.update_state(state, workflow_step="get_topic")
             return new_state
-    
-    def present_info_node(self, state: HealthBotState) -> HealthBotState:
-        """Node: Present information to patient"""
-        print("\n" + "="*70)
-        print(f"HEALTH EDUCATION: {state['current_topic'].upper()}")
-        print("="*70)
-        print(state["summary"])
-        print("="*70)
-        
-        input("\nPlease read the information above carefully.\nPress Enter when you're ready for a comprehension check: ")
-        
-        # Update state
-        new_state = StateManager.update_state(state, workflow_step="generate_quiz")
-        new_state = StateManager.add_message(new_state, "info_presented", 
-            "Patient has read the health information")
-        
+
+        if self.speculator is not None:
+            self._speculate_quiz(state, summary)
         return new_state
-    
-    def generate_quiz_node(self, state: HealthBotState) -> HealthBotState:
+
+    def present_info_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Node: Present information to patient"""
+        self._show_info(io, state)
+        io.read("\nPlease read the information above carefully.\nPress Enter when you're ready for a comprehension check: ")
+        return self._info_read(state)
+
+    def generate_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Generate quiz question based ONLY on summary"""
-        print("\nGenerating comprehension question from the summary...")
-        
+        io.write("\nGenerating comprehension question from the summary...")
+
         try:
-            quiz_content, correct_answer = QuizService.generate_quiz_question(
-                self.llm,
-                state['current_topic'],
-                state['summary']
-            )
-            
-            print("Quiz question generated from summary!")
-            
-            # Update state
-            new_state = StateManager.update_state(state,
-                quiz_question=quiz_content,
-                correct_answer=correct_answer,
-                workflow_step="present_quiz"
-            )
-            new_state = StateManager.add_message(new_state, "quiz_generated",
-                "Quiz question created using only summary data",
-                quiz=quiz_content
-            )
-            
-            return new_state
-            
+            if self.quiz_mode == "pool":
+                pool = self._quiz_pool(io, state)
+                if pool is not None:
+                    return self._ask_from_pool(io, state, pool)
+
+            precomputed = self._precomputed_quiz(state)
+            if precomputed is not None:
+                return self._quiz_done(io, state, *precomputed)
+
+            speculated = None
+            printer = None
+            if self.speculator is not None:
+                speculated = self.speculator.collect(state["session_id"], state['summary'])
+            if speculated is not None:
+                quiz_content, correct_answer, quiz_bundle = speculated
+            else:
+                printer = self._printer(io, lambda: self._show_quiz_header(io))
+                quiz_content, correct_answer, quiz_bundle = QuizService.generate_quiz(
+                    self.llm,
+                    state['current_topic'],
+                    state['summary'],
+                    self._single_quiz_mode,
+                    printer,
+                    self._topic_key(state)
+                )
+            return self._quiz_done(io, state, quiz_content, correct_answer, quiz_bundle, printer)
+
         except Exception as e:
-            print(f"Error generating quiz: {str(e)}")
+            io.write(f"Error generating quiz: {str(e)}")
             new_state = StateManager.update_state(state, workflow_step="check_continue")
             return new_state
-    
-    def present_quiz_node(self, state: HealthBotState) -> HealthBotState:
+
+    def _quiz_pool(self, io: SessionIO, state: HealthBotState) -> Optional[List[list]]:
+        """The summary's question pool: pre-warmed, speculated, stored or generated; None if unusable"""
+        pool = self._precomputed_pool(state)
+        if pool is None and self.speculator is not None:
+            pool = self.speculator.collect(state["session_id"], state['summary'])
+        if pool is None:
+            try:
+                pool = QuizService.get_quiz_pool(self.llm, state['current_topic'], state['summary'],
+                                                 self.quiz_pool_size, self.summary_store,
+                                                 self._topic_key(state))
+            except ValueError as e:
+                self._pool_failed(io, e)
+        return pool
+
+    def present_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Present quiz to patient and collect answer"""
-        print("\n" + "="*60)
-        print("COMPREHENSION CHECK")
-        print("="*60)
-        
-        # Display quiz without showing correct answer
-        lines = state["quiz_question"].split('\n')
-        quiz_display = ""
-        
-        for line in lines:
-            if not line.startswith('Correct Answer:'):
-                quiz_display += line + '\n'
-                
-        print(quiz_display)
-        
-        patient_answer = input("Please enter your answer (A, B, C, or D): ").strip().upper()
-        
+        self._show_quiz(io, state)
+
+        patient_answer = io.read("Please enter your answer (A, B, C, or D): ").strip().upper()
+
         while patient_answer not in ['A', 'B', 'C', 'D']:
-            patient_answer = input("Please enter A, B, C, or D: ").strip().upper()
-        
-        # Update state
-        new_state = StateManager.update_state(state,
-            patient_answer=patient_answer,
-            workflow_step="grade_quiz"
-        )
-        new_state = StateManager.add_message(new_state, "patient_answer",
-            f"Patient answered: {patient_answer}")
-        
-        return new_state
-    
-    def grade_quiz_node(self, state: HealthBotState) -> HealthBotState:
+            patient_answer = io.read("Please enter A, B, C, or D: ").strip().upper()
+
+        return self._answer_given(state, patient_answer)
+
+    def grade_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Grade patient's quiz answer using ONLY the summary"""
-        print("\nGrading your answer using the health summary...")
-        
+        io.write("\nGrading your answer using the health summary...")
+
         try:
+            if state.get('quiz_bundle'):
+                grade, feedback = QuizService.grade_from_bundle(state['quiz_bundle'], state['patient_answer'])
+                return self._grade_done(io, state, grade, feedback)
+
+            printer = self._feedback_printer(io, state)
             grade, feedback = QuizService.grade_quiz_answer(
                 self.llm,
                 state['current_topic'],
                 state['quiz_question'],
                 state['patient_answer'],
                 state['correct_answer'],
-                state['summary']
-            )
-            
-            is_correct = grade == "A"
-            
-            print("\n" + "="*60)
-            print("QUIZ RESULTS & FEEDBACK")
-            print("="*60)
-            print(f"Grade: {grade}")
-            if is_correct:
-                print("CORRECT!")
-            else:
-                print("INCORRECT - Let's learn from this!")
-            print("-" * 60)
-            print(feedback)
-            print("="*60)
-            
-            # Update state
-            new_state = StateManager.update_state(state,
-                quiz_feedback=feedback,
-                workflow_step="check_continue"
+                state['summary'],
+                printer
             )
-            new_state = StateManager.add_message(new_state, "quiz_graded",
-                f"Grade: {grade} - Justified using only summary content",
-                feedback=feedback,
-                correct=is_correct,
-                grade=grade
-            )
-            
-            return new_state
-            
+            return self._grade_done(io, state, grade, feedback, printer)
+
         except Exception as e:
-            print(f"Error grading quiz: {str(e)}")
+            io.write(f"Error grading quiz: {str(e)}")
             new_state = StateManager.update_state(state, workflow_step="check_continue")
             return new_state
-    
-    def check_continue_node(self, state: HealthBotState) -> HealthBotState:
+
+    def check_continue_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
         """Node: Check if patient wants to continue with new topic"""
-        print("\n" + "="*50)
-        print("What would you like to do next?")
-        print("1. Learn about another health topic")
-        print("2. Exit HealthBot")
-        
-        choice = input("\nEnter 1 or 2: ").strip()
-        
-        if choice == "1":
-            print("\nResetting state for new learning session...")
-            # Reset state for new topic (maintains privacy)
-            new_state = StateManager.reset_state_for_new_topic()
-            return new_state
-        elif choice == "2":
-            new_state = StateManager.update_state(state,
-                should_continue=False,
-                workflow_step="end"
+        self._show_continue_menu(io, state)
+        choice = io.read(f"\nEnter {self._continue_prompt(state)}: ").strip()
+        return self._continue_chosen(io, state, choice)
+
+    # Async nodes: same transitions, using ainvoke and each session's own IO
+
+    async def aget_topic_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Get health topic from patient"""
+        self._show_welcome(io)
+        topic = (await io.aread("\nWhat health topic or medical condition would you like to learn about?\n>>> ")).strip()
+        return self._topic_entered(io, state, topic)
+
+    async def asearch_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Search medical information using OpenAI + Tavily integration"""
+        io.write(f"\nUsing AI to search trusted medical sources for: '{state['current_topic']}'")
+
+        entry = self._precomputed(state)
+        if entry is not None:
+            io.write("Serving pre-warmed results from trusted medical sources...")
+            return self._search_done(io, state, entry["search_results"])
+
+        try:
+            search_results = await self.search_service.asearch_medical_info(
+                state['current_topic'],
+                self.llm_with_tools,
+                self._topic_key(state)
             )
-            new_state = StateManager.add_message(new_state, "session_end", "Patient chose to exit")
-            return new_state
-        else:
-            print("Please enter 1 or 2.")
-            return state
\ No newline at end of file
+            return self._search_done(io, state, search_results)
+
+        except Exception as e:
+            io.write(f"Error in search: {str(e)}")
+            return StateManager.update_state(state, workflow_step="get_topic")
+
+    async def asummarize_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Summarize search results into patient-friendly format"""
+        io.write("\nCreating patient-friendly summary from search results...")
+
+        precomputed = self._precomputed_summary(state)
+        if precomputed is not None:
+            return self._summary_done(io, state, precomputed, True)
+
+        try:
+            printer = self._printer(io, lambda: self._show_info_header(io, state))
+            summary, cached = await MedicalSummarizationService.acreate_patient_summary_cached(
+                self.llm,
+                state['current_topic'],
+                state['search_results'],
+                self.summary_store,
+                printer,
+                self._topic_key(state)
+            )
+            new_state = self._summary_done(io, state, summary, cached, printer)
+
+        except Exception as e:
+            io.write(f"Error creating summary: {str(e)}")
+            return StateManager.update_state(state, workflow_step="get_topic")
+
+        if self.speculator is not None:
+            self._aspeculate_quiz(state, summary)
+        return new_state
+
+    async def apresent_info_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Present information to patient"""
+        self._show_info(io, state)
+        await io.aread("\nPlease read the information above carefully.\nPress Enter when you're ready for a comprehension check: ")
+        return self._info_read(state)
+
+    async def agenerate_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Generate quiz question based ONLY on summary"""
+        io.write("\nGenerating comprehension question from the summary...")
+
+        try:
+            if self.quiz_mode == "pool":
+                pool = await self._aquiz_pool(io, state)
+                if pool is not None:
+                    return self._ask_from_pool(io, state, pool)
+
+            precomputed = self._precomputed_quiz(state)
+            if precomputed is not None:
+                return self._quiz_done(io, state, *precomputed)
+
+            speculated = None
+            printer = None
+            if self.speculator is not None:
+                speculated = await self.speculator.acollect(state["session_id"], state['summary'])
+            if speculated is not None:
+                quiz_content, correct_answer, quiz_bundle = speculated
+            else:
+                printer = self._printer(io, lambda: self._show_quiz_header(io))
+                quiz_content, correct_answer, quiz_bundle = await QuizService.agenerate_quiz(
+                    self.llm,
+                    state['current_topic'],
+                    state['summary'],
+                    self._single_quiz_mode,
+                    printer,
+                    self._topic_key(state)
+                )
+            return self._quiz_done(io, state, quiz_content, correct_answer, quiz_bundle, printer)
+
+        except Exception as e:
+            io.write(f"Error generating quiz: {str(e)}")
+            return StateManager.update_state(state, workflow_step="check_continue")
+
+    async def _aquiz_pool(self, io: SessionIO, state: HealthBotState) -> Optional[List[list]]:
+        """Async variant of _quiz_pool"""
+        pool = self._precomputed_pool(state)
+        if pool is None and self.speculator is not None:
+            pool = await self.speculator.acollect(state["session_id"], state['summary'])
+        if pool is None:
+            try:
+                pool = await QuizService.aget_quiz_pool(self.llm, state['current_topic'], state['summary'],
+                                                        self.quiz_pool_size, self.summary_store,
+                                                        self._topic_key(state))
+            except ValueError as e:
+                self._pool_failed(io, e)
+        return pool
+
+    async def apresent_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Present quiz to patient and collect answer"""
+        self._show_quiz(io, state)
+
+        patient_answer = (await io.aread("Please enter your answer (A, B, C, or D): ")).strip().upper()
+
+        while patient_answer not in ['A', 'B', 'C', 'D']:
+            patient_answer = (await io.aread("Please enter A, B, C, or D: ")).strip().upper()
+
+        return self._answer_given(state, patient_answer)
+
+    async def agrade_quiz_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Grade patient's quiz answer using ONLY the summary"""
+        io.write("\nGrading your answer using the health summary...")
+
+        try:
+            if state.get('quiz_bundle'):
+                grade, feedback = QuizService.grade_from_bundle(state['quiz_bundle'], state['patient_answer'])
+                return self._grade_done(io, state, grade, feedback)
+
+            printer = self._feedback_printer(io, state)
+            grade, feedback = await QuizService.agrade_quiz_answer(
+                self.llm,
+                state['current_topic'],
+                state['quiz_question'],
+                state['patient_answer'],
+                state['correct_answer'],
+                state['summary'],
+                printer
+            )
+            return self._grade_done(io, state, grade, feedback, printer)
+
+        except Exception as e:
+            io.write(f"Error grading quiz: {str(e)}")
+            return StateManager.update_state(state, workflow_step="check_continue")
+
+    async def acheck_continue_node(self, state: HealthBotState, io: SessionIO = CONSOLE) -> HealthBotState:
+        """Async node: Check if patient wants to continue with new topic"""
+        self._show_continue_menu(io, state)
+        choice = (await io.aread(f"\nEnter {self._continue_prompt(state)}: ")).strip()
+        return self._continue_chosen(io, state, choice)
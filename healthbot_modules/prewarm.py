@@ -0,0 +1,172 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .admission import PREWARM, admission_priority
+from .cache import normalize_topic
+from .quiz import QuizService
+from .search import MedicalSummarizationService
+from .upstream import batch_llm
+
+class PrewarmPipeline:
+    """Precomputes search results, summaries and quizzes for popular topics
+
+    Topics are processed in chunks of `concurrency`: searches run on a thread pool,
+    then the chunk's summaries and quizzes each go to the model as one batch. Every
+    finished topic is written to the content store straight away, so an interrupted
+    run resumes where it stopped and fresh topics are skipped.
+
+    The pipeline is the content store's single writer. Running servers see new
+    topics when it publishes, at most every publish_seconds and when it stops.
+    """
+
+    def __init__(self, nodes, concurrency: int = 4, publish_seconds: float = 30.0):
+        if nodes.content_store is None:
+            raise ValueError("Pre-warming needs a content store (set HEALTHBOT_CACHE_DIR)")
+        self.nodes = nodes
+        self.concurrency = concurrency
+        self.publish_seconds = publish_seconds
+
+    @staticmethod
+    def read_topics(path: str) -> List[str]:
+        """Read one topic per line, skipping blanks, '#' comments and duplicates"""
+        topics = []
+        seen = set()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                topic = line.strip()
+                if not topic or topic.startswith("#") or normalize_topic(topic) in seen:
+                    continue
+                seen.add(normalize_topic(topic))
+                topics.append(topic)
+        return topics
+
+    def run(self, topics: List[str], force: bool = False) -> Dict[str, int]:
+        """Warm every topic that is not already fresh (or all of them with force)
+
+        Upstream calls run in the pre-warm admission class, so pre-warming alongside
+        live sessions only uses quota the sessions leave over.
+        """
+        store = self.nodes.content_store
+        # Fails fast if another pre-warm run is writing
+        store.acquire_writer()
+        try:
+            with admission_priority(PREWARM):
+                return self._run(topics, force)
+        finally:
+            store.publish()
+            store.release_writer()
+
+    def _run(self, topics: List[str], force: bool) -> Dict[str, int]:
+        if self.nodes.topic_index is not None:
+            # Warm under the canonical topic, which is what sessions will look up
+            topics = list(dict.fromkeys(self.nodes.topic_index.canonical(topic) for topic in topics))
+        fresh = set() if force else set(self.nodes.content_store.fresh_topic_keys())
+        pending = [topic for topic in topics if normalize_topic(topic) not in fresh]
+        stats = {"requested": len(topics), "skipped": len(topics) - len(pending), "warmed": 0, "failed": 0}
+        print(f"Pre-warming {len(pending)} topics ({stats['skipped']} already fresh)...")
+
+        published = time.monotonic()
+        for start in range(0, len(pending), self.concurrency):
+            chunk = pending[start:start + self.concurrency]
+            warmed = self._warm_chunk(chunk)
+            stats["warmed"] += warmed
+            stats["failed"] += len(chunk) - warmed
+            print(f"Progress: {start + len(chunk)}/{len(pending)} topics processed")
+            if time.monotonic() - published >= self.publish_seconds:
+                self.nodes.content_store.publish()
+                published = time.monotonic()
+
+        return stats
+
+    def _search(self, topic: str):
+        # Runs on a worker thread, which does not inherit run()'s priority
+        try:
+            with admission_priority(PREWARM):
+                return self.nodes.search_service.search_medical_info(topic, self.nodes.llm_with_tools)
+        except Exception as e:
+            return e
+
+    def _warm_chunk(self, chunk: List[str]) -> int:
+        llm = self.nodes.llm
+        store = self.nodes.summary_store
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            searched = list(executor.map(self._search, chunk))
+        work = []
+        for topic, results in zip(chunk, searched):
+            if isinstance(results, Exception) or not results:
+                print(f"Skipping '{topic}': search failed ({results or 'no results'})")
+                continue
+            work.append({"topic": topic, "search_results": results})
+
+        # Summaries: reuse stored ones, batch the rest
+        to_summarize = []
+        for item in work:
+            key = MedicalSummarizationService.store_key(llm, item["topic"], item["search_results"], store)
+            item["summary_key"] = key
+            item["summary"] = store.get(key) if key is not None else None
+            if item["summary"] is None:
+                to_summarize.append(item)
+        responses = batch_llm(
+            llm,
+            [MedicalSummarizationService.build_messages(item["topic"], item["search_results"]) for item in to_summarize],
+            "summarize", self.concurrency
+        ) if to_summarize else []
+        for item, response in zip(to_summarize, responses):
+            if isinstance(response, Exception) or not response.content:
+                print(f"Skipping '{item['topic']}': summary failed ({response})")
+                continue
+            item["summary"] = response.content
+            if item["summary_key"] is not None:
+                store.set(item["summary_key"], item["summary"])
+        work = [item for item in work if item["summary"]]
+
+        # Quizzes in the same mode the interactive nodes use
+        responses = batch_llm(
+            llm, [self._quiz_messages(item) for item in work], "quiz", self.concurrency
+        ) if work else []
+
+        warmed = 0
+        for item, response in zip(work, responses):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                quiz, pool = self._parse_quiz(item, response.content)
+            except Exception as e:
+                print(f"Skipping '{item['topic']}': quiz failed ({str(e)})")
+                continue
+            self.nodes.content_store.put(item["topic"], item["search_results"], item["summary"], *quiz,
+                                         quiz_pool=pool)
+            warmed += 1
+        return warmed
+
+    def _quiz_messages(self, item: dict) -> list:
+        if self.nodes.quiz_mode == "pool":
+            return QuizService.build_pool_messages(item["topic"], item["summary"], self.nodes.quiz_pool_size)
+        if self.nodes.quiz_mode == "bundle":
+            return QuizService.build_bundle_messages(item["topic"], item["summary"])
+        return QuizService.build_quiz_messages(item["topic"], item["summary"])
+
+    def _parse_quiz(self, item: dict, content: str) -> Tuple[tuple, Optional[List[list]]]:
+        """(quiz_content, correct_answer, quiz_bundle) and, in pool mode, the question pool"""
+        if self.nodes.quiz_mode == "pool":
+            return self._parse_pool(item, content)
+        if self.nodes.quiz_mode != "bundle":
+            return QuizService.parse_quiz(content) + (None,), None
+        try:
+            bundle = QuizService.parse_quiz_bundle(content)
+        except ValueError:
+            return QuizService.generate_quiz(self.nodes.llm, item["topic"], item["summary"], "classic"), None
+        return (QuizService.format_quiz_bundle(bundle), bundle["correct_answer"], bundle), None
+
+    def _parse_pool(self, item: dict, content: str) -> Tuple[tuple, Optional[List[list]]]:
+        try:
+            pool = QuizService.parse_quiz_pool(content)
+        except ValueError:
+            return QuizService.generate_quiz(self.nodes.llm, item["topic"], item["summary"], "bundle"), None
+        # Stored next to the summary too, which the summary store may keep after this entry expires
+        if self.nodes.summary_store is not None:
+            key = QuizService.pool_key(self.nodes.llm, item["topic"], item["summary"], self.nodes.quiz_pool_size)
+            self.nodes.summary_store.set_quiz_pool(key, pool)
+        bundle = QuizService.unpack_question(pool[0])
+        return (QuizService.format_quiz_bundle(bundle), bundle["correct_answer"], bundle), pool
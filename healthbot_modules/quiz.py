@@ -1,17 +1,71 @@
-from langchain_openai import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
-from typing import Tuple
+import hashlib
+import json
+import logging
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from .cache import SummaryStore, make_cache_key
+from .clients import human_message, system_message
+from .coalesce import SingleFlight
+from .routing import ROUTER
+from .session_io import notify
+from .streaming import QuizStreamFilter, TokenCallback, acomplete, complete
+from .upstream import ainvoke_llm, invoke_llm
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+QUIZ_OPTIONS = ['A', 'B', 'C', 'D']
+
+QUIZ_POOL_SYSTEM_PROMPT = """You are creating educational quiz questions for patient comprehension testing. 
+        Use ONLY the provided summary to create the quiz questions and all feedback. Do not use external knowledge.
+        Respond with a single JSON object and nothing else."""
+
+QUIZ_POOL_HUMAN_TEMPLATE = """
+        Based ONLY on the following health information summary about "{topic}", 
+        create {size} different multiple choice questions to test patient understanding, 
+        each with the feedback a patient should see for each possible answer.
+        
+        Requirements:
+        - Every question must be answerable using the summary alone
+        - Each question must test a different key concept from the summary
+        - Each question has one clearly correct answer based on the summary
+        - Make incorrect options plausible but clearly wrong based on the summary
+        - Feedback for each option must say whether it is correct, justify why using 
+          specific references to the summary, and reinforce the key concept
+        - Feedback must be encouraging regardless of correctness
+        
+        Return JSON EXACTLY in this shape:
+        {{"questions": [
+          {{"question": "...",
+            "options": {{"A": "...", "B": "...", "C": "...", "D": "..."}},
+            "correct_answer": "A, B, C, or D",
+            "feedback": {{"A": "...", "B": "...", "C": "...", "D": "..."}}}}
+        ]}}
+        
+        Health Information Summary (your ONLY data source):
+        {summary}
+        """
+
+# Changes to either prompt change this hash, which keys stored quiz pools
+QUIZ_POOL_TEMPLATE_HASH = hashlib.sha256(
+    (QUIZ_POOL_SYSTEM_PROMPT + QUIZ_POOL_HUMAN_TEMPLATE).encode("utf-8")
+).hexdigest()[:16]
 
 class QuizService:
     """Handles quiz generation and grading"""
     
+    # Sessions quizzing on the same summary at the same time share one generation
+    flight = SingleFlight("quiz")
+    
     @staticmethod
-    def generate_quiz_question(llm: ChatOpenAI, topic: str, summary: str) -> Tuple[str, str]:
-        """Generate quiz question based ONLY on summary"""
-        system_message = SystemMessage(content="""You are creating educational quiz questions for patient comprehension testing. 
+    def build_quiz_messages(topic: str, summary: str) -> list:
+        """Build the quiz generation prompt based ONLY on summary"""
+        system = system_message("""You are creating educational quiz questions for patient comprehension testing. 
         Use ONLY the provided summary to create the quiz question. Do not use external knowledge.""")
         
-        human_message = HumanMessage(content=f"""
+        human = human_message(f"""
         Based ONLY on the following health information summary about "{topic}", 
         create ONE multiple choice question to test patient understanding.
         
@@ -35,10 +89,11 @@ class QuizService:
         {summary}
         """)
         
-        response = llm.invoke([system_message, human_message])
-        quiz_content = response.content
-        
-        # Parse the correct answer
+        return [system, human]
+    
+    @staticmethod
+    def parse_quiz(quiz_content: str) -> Tuple[str, str]:
+        """Parse the correct answer out of generated quiz text"""
         lines = quiz_content.split('\n')
         correct_answer = None
         for line in lines:
@@ -49,15 +104,308 @@ class QuizService:
         return quiz_content, correct_answer
     
     @staticmethod
-    def grade_quiz_answer(llm: ChatOpenAI, topic: str, quiz_question: str, 
-                         patient_answer: str, correct_answer: str, summary: str) -> Tuple[str, str]:
-        """Grade patient's quiz answer using ONLY the summary"""
+    def generate_quiz_question(llm: "ChatOpenAI", topic: str, summary: str,
+                               on_token: Optional[TokenCallback] = None) -> Tuple[str, str]:
+        """Generate quiz question based ONLY on summary
+        
+        When on_token is given the question is streamed to it as it is generated,
+        with the 'Correct Answer:' line withheld.
+        """
+        quiz_filter = QuizStreamFilter(on_token) if on_token else None
+        quiz_content = complete(llm, QuizService.build_quiz_messages(topic, summary), "quiz",
+                                quiz_filter.feed if quiz_filter else None)
+        if quiz_filter:
+            quiz_filter.close()
+        return QuizService.parse_quiz(quiz_content)
+    
+    @staticmethod
+    async def agenerate_quiz_question(llm: "ChatOpenAI", topic: str, summary: str,
+                                      on_token: Optional[TokenCallback] = None) -> Tuple[str, str]:
+        """Async variant of generate_quiz_question"""
+        quiz_filter = QuizStreamFilter(on_token) if on_token else None
+        quiz_content = await acomplete(llm, QuizService.build_quiz_messages(topic, summary), "quiz",
+                                       quiz_filter.feed if quiz_filter else None)
+        if quiz_filter:
+            quiz_filter.close()
+        return QuizService.parse_quiz(quiz_content)
+    
+    @staticmethod
+    def build_bundle_messages(topic: str, summary: str) -> list:
+        """Build a prompt for one question plus feedback for every option, as JSON"""
+        system = system_message("""You are creating educational quiz questions for patient comprehension testing. 
+        Use ONLY the provided summary to create the quiz question and all feedback. Do not use external knowledge.
+        Respond with a single JSON object and nothing else.""")
+        
+        human = human_message(f"""
+        Based ONLY on the following health information summary about "{topic}", 
+        create ONE multiple choice question to test patient understanding, together with 
+        the feedback a patient should see for each possible answer.
+        
+        Requirements:
+        - Question must be answerable using the summary alone
+        - Test understanding of key concepts from the summary
+        - Have one clearly correct answer based on the summary
+        - Make incorrect options plausible but clearly wrong based on the summary
+        - Feedback for each option must say whether it is correct, justify why using 
+          specific references to the summary, and reinforce the key concept
+        - Feedback must be encouraging regardless of correctness
+        
+        Return JSON EXACTLY in this shape:
+        {{"question": "...",
+          "options": {{"A": "...", "B": "...", "C": "...", "D": "..."}},
+          "correct_answer": "A, B, C, or D",
+          "feedback": {{"A": "...", "B": "...", "C": "...", "D": "..."}}}}
+        
+        Health Information Summary (your ONLY data source):
+        {summary}
+        """)
+        
+        return [system, human]
+    
+    @staticmethod
+    def _load_json(content: str, what: str):
+        text = content.strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            if text.startswith("json"):
+                text = text[len("json"):]
+        
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{what} is not valid JSON: {e}")
+    
+    @staticmethod
+    def parse_quiz_bundle(content: str) -> dict:
+        """Parse and validate a JSON quiz bundle, raising ValueError if it is malformed"""
+        return QuizService.validate_bundle(QuizService._load_json(content, "Quiz bundle"))
+    
+    @staticmethod
+    def validate_bundle(bundle) -> dict:
+        """Check a decoded quiz bundle and normalize it, raising ValueError if it is malformed"""
+        if not isinstance(bundle, dict) or not isinstance(bundle.get("question"), str) or not bundle["question"].strip():
+            raise ValueError("Quiz bundle has no question")
+        options = bundle.get("options") or {}
+        feedback = bundle.get("feedback") or {}
+        if not isinstance(options, dict) or not isinstance(feedback, dict) or any(
+                not isinstance(texts.get(letter), str) or not texts[letter].strip()
+                for texts in (options, feedback) for letter in QUIZ_OPTIONS):
+            raise ValueError("Quiz bundle must have an option and feedback for A, B, C and D")
+        correct_answer = str(bundle.get("correct_answer", "")).strip().upper()[:1]
+        if correct_answer not in QUIZ_OPTIONS:
+            raise ValueError(f"Quiz bundle has invalid correct answer: {bundle.get('correct_answer')}")
+        
+        return {
+            "question": bundle["question"].strip(),
+            "options": {letter: options[letter].strip() for letter in QUIZ_OPTIONS},
+            "correct_answer": correct_answer,
+            "feedback": {letter: feedback[letter].strip() for letter in QUIZ_OPTIONS},
+        }
+    
+    @staticmethod
+    def format_quiz_bundle(bundle: dict) -> str:
+        """Render a bundle in the classic quiz text format"""
+        lines = [f"Question: {bundle['question']}"]
+        lines += [f"{letter}) {bundle['options'][letter]}" for letter in QUIZ_OPTIONS]
+        lines.append(f"Correct Answer: {bundle['correct_answer']}")
+        return '\n'.join(lines)
+    
+    @staticmethod
+    def generate_quiz_bundle(llm: "ChatOpenAI", topic: str, summary: str) -> Tuple[str, str, dict]:
+        """Generate question, answer and per-option feedback in one call"""
+        response = invoke_llm(llm, QuizService.build_bundle_messages(topic, summary), "quiz")
+        bundle = QuizService.parse_quiz_bundle(response.content)
+        return QuizService.format_quiz_bundle(bundle), bundle['correct_answer'], bundle
+    
+    @staticmethod
+    async def agenerate_quiz_bundle(llm: "ChatOpenAI", topic: str, summary: str) -> Tuple[str, str, dict]:
+        """Async variant of generate_quiz_bundle"""
+        response = await ainvoke_llm(llm, QuizService.build_bundle_messages(topic, summary), "quiz")
+        bundle = QuizService.parse_quiz_bundle(response.content)
+        return QuizService.format_quiz_bundle(bundle), bundle['correct_answer'], bundle
+    
+    @staticmethod
+    def build_pool_messages(topic: str, summary: str, size: int) -> list:
+        """Build a prompt for `size` questions, each with feedback for every option, as JSON"""
+        return [
+            system_message(QUIZ_POOL_SYSTEM_PROMPT),
+            human_message(QUIZ_POOL_HUMAN_TEMPLATE.format(topic=topic, summary=summary, size=size))
+        ]
+    
+    @staticmethod
+    def pack_question(bundle: dict) -> list:
+        """A bundle as the compact row a pool stores: [question, correct answer, options A-D, feedback A-D]"""
+        return [bundle["question"], bundle["correct_answer"],
+                [bundle["options"][letter] for letter in QUIZ_OPTIONS],
+                [bundle["feedback"][letter] for letter in QUIZ_OPTIONS]]
+    
+    @staticmethod
+    def unpack_question(row: list) -> dict:
+        """The quiz bundle for a pool row"""
+        question, correct_answer, options, feedback = row
+        return {
+            "question": question,
+            "options": dict(zip(QUIZ_OPTIONS, options)),
+            "correct_answer": correct_answer,
+            "feedback": dict(zip(QUIZ_OPTIONS, feedback)),
+        }
+    
+    @staticmethod
+    def parse_quiz_pool(content: str) -> List[list]:
+        """Parse a JSON question pool into compact rows, dropping malformed or repeated questions
+        
+        Raises ValueError if no usable question is left.
+        """
+        data = QuizService._load_json(content, "Quiz pool")
+        questions = data.get("questions") if isinstance(data, dict) else data
+        if not isinstance(questions, list):
+            raise ValueError("Quiz pool has no list of questions")
+        
+        pool = []
+        seen = set()
+        for question in questions:
+            try:
+                bundle = QuizService.validate_bundle(question)
+            except ValueError:
+                continue
+            if bundle["question"].lower() in seen:
+                continue
+            seen.add(bundle["question"].lower())
+            pool.append(QuizService.pack_question(bundle))
+        if not pool:
+            raise ValueError("Quiz pool has no valid questions")
+        return pool
+    
+    @staticmethod
+    def pool_key(llm: "ChatOpenAI", topic: str, summary: str, size: int) -> str:
+        """Identity of a question pool, for storing it and coalescing identical in-flight calls"""
+        return make_cache_key("quiz_pool", topic, summary, QUIZ_POOL_TEMPLATE_HASH, size,
+                              ROUTER.model_for("quiz", llm), getattr(llm, 'temperature', None))
+    
+    @staticmethod
+    def get_quiz_pool(llm: "ChatOpenAI", topic: str, summary: str, size: int = 5,
+                      store: Optional[SummaryStore] = None, key_topic: Optional[str] = None) -> List[list]:
+        """The question pool for a summary: stored alongside it, or generated in one call and stored
+        
+        key_topic (the canonical topic, if different) is what the questions are about,
+        and keys the stored pool and the shared call. Raises ValueError if the model's
+        reply holds no usable question.
+        """
+        topic = key_topic or topic
+        key = QuizService.pool_key(llm, topic, summary, size)
+        if store is not None:
+            pool = store.get_quiz_pool(key)
+            if pool:
+                return pool
+        return QuizService.flight.do(key, QuizService._generate_quiz_pool, llm, topic, summary, size, store, key)
+    
+    @staticmethod
+    async def aget_quiz_pool(llm: "ChatOpenAI", topic: str, summary: str, size: int = 5,
+                             store: Optional[SummaryStore] = None, key_topic: Optional[str] = None) -> List[list]:
+        """Async variant of get_quiz_pool"""
+        topic = key_topic or topic
+        key = QuizService.pool_key(llm, topic, summary, size)
+        if store is not None:
+            pool = store.get_quiz_pool(key)
+            if pool:
+                return pool
+        return await QuizService.flight.ado(key, QuizService._agenerate_quiz_pool, llm, topic, summary, size,
+                                            store, key)
+    
+    @staticmethod
+    def _generate_quiz_pool(llm: "ChatOpenAI", topic: str, summary: str, size: int,
+                            store: Optional[SummaryStore], key: str) -> List[list]:
+        response = invoke_llm(llm, QuizService.build_pool_messages(topic, summary, size), "quiz")
+        pool = QuizService.parse_quiz_pool(response.content)
+        if store is not None:
+            store.set_quiz_pool(key, pool)
+        return pool
+    
+    @staticmethod
+    async def _agenerate_quiz_pool(llm: "ChatOpenAI", topic: str, summary: str, size: int,
+                                   store: Optional[SummaryStore], key: str) -> List[list]:
+        response = await ainvoke_llm(llm, QuizService.build_pool_messages(topic, summary, size), "quiz")
+        pool = QuizService.parse_quiz_pool(response.content)
+        if store is not None:
+            store.set_quiz_pool(key, pool)
+        return pool
+    
+    @staticmethod
+    def flight_key(llm: "ChatOpenAI", topic: str, summary: str, mode: str) -> str:
+        """Identity of a quiz request, for coalescing identical in-flight calls"""
+        return make_cache_key("quiz", mode, topic, summary,
+                              ROUTER.model_for("quiz", llm), getattr(llm, 'temperature', None))
+    
+    @staticmethod
+    def generate_quiz(llm: "ChatOpenAI", topic: str, summary: str, mode: str = "bundle",
+                      on_token: Optional[TokenCallback] = None,
+                      key_topic: Optional[str] = None) -> Tuple[str, str, Optional[dict]]:
+        """Generate a quiz in the given mode; classic mode (or a malformed bundle) returns no bundle
+        
+        Only classic questions are streamed; a bundle is JSON and is returned whole, as
+        is a quiz shared with an identical request already in flight. key_topic (the
+        canonical topic, if given) is what the quiz is about and keys the shared call.
+        """
+        topic = key_topic or topic
+        return QuizService.flight.do(QuizService.flight_key(llm, topic, summary, mode),
+                                     QuizService._generate_quiz, llm, topic, summary, mode, on_token)
+    
+    @staticmethod
+    async def agenerate_quiz(llm: "ChatOpenAI", topic: str, summary: str, mode: str = "bundle",
+                             on_token: Optional[TokenCallback] = None,
+                             key_topic: Optional[str] = None) -> Tuple[str, str, Optional[dict]]:
+        """Async variant of generate_quiz"""
+        topic = key_topic or topic
+        return await QuizService.flight.ado(QuizService.flight_key(llm, topic, summary, mode),
+                                            QuizService._agenerate_quiz, llm, topic, summary, mode, on_token)
+    
+    @staticmethod
+    def _generate_quiz(llm: "ChatOpenAI", topic: str, summary: str, mode: str,
+                       on_token: Optional[TokenCallback]) -> Tuple[str, str, Optional[dict]]:
+        if mode == "bundle":
+            try:
+                return QuizService.generate_quiz_bundle(llm, topic, summary)
+            except ValueError as e:
+                logger.warning("Falling back to a classic quiz question: %s", e)
+        quiz_content, correct_answer = QuizService.generate_quiz_question(llm, topic, summary, on_token)
+        return quiz_content, correct_answer, None
+    
+    @staticmethod
+    async def _agenerate_quiz(llm: "ChatOpenAI", topic: str, summary: str, mode: str,
+                              on_token: Optional[TokenCallback]) -> Tuple[str, str, Optional[dict]]:
+        if mode == "bundle":
+            try:
+                return await QuizService.agenerate_quiz_bundle(llm, topic, summary)
+            except ValueError as e:
+                logger.warning("Falling back to a classic quiz question: %s", e)
+        quiz_content, correct_answer = await QuizService.agenerate_quiz_question(llm, topic, summary, on_token)
+        return quiz_content, correct_answer, None
+    
+    @staticmethod
+    def grade_from_bundle(bundle: dict, patient_answer: str) -> Tuple[str, str]:
+        """Grade locally from a quiz bundle's precomputed feedback, with no LLM call"""
+        correct_answer = bundle['correct_answer']
+        if patient_answer == correct_answer:
+            return "A", bundle['feedback'][correct_answer]
+        
+        feedback = (
+            f"You answered {patient_answer}) {bundle['options'][patient_answer]}\n"
+            f"{bundle['feedback'][patient_answer]}\n\n"
+            f"The correct answer is {correct_answer}) {bundle['options'][correct_answer]}\n"
+            f"{bundle['feedback'][correct_answer]}"
+        )
+        return "F", feedback
+    
+    @staticmethod
+    def build_feedback_messages(topic: str, quiz_question: str, patient_answer: str,
+                                correct_answer: str, summary: str) -> list:
+        """Build the grading feedback prompt using ONLY the summary"""
         is_correct = patient_answer == correct_answer
         
-        system_message = SystemMessage(content="""You are providing educational feedback on a health quiz question. 
+        system = system_message("""You are providing educational feedback on a health quiz question. 
         Be encouraging and educational. Use ONLY the provided summary for all explanations and justifications.""")
         
-        human_message = HumanMessage(content=f"""
+        human = human_message(f"""
         Grade a patient's quiz answer about "{topic}".
         
         Patient answered: {patient_answer}
@@ -79,8 +427,54 @@ class QuizService:
         {summary}
         """)
         
-        response = llm.invoke([system_message, human_message])
-        feedback = response.content
-        grade = "A" if is_correct else "F"
-        
+        return [system, human]
+    
+    @staticmethod
+    def local_feedback(quiz_question: str, patient_answer: str, correct_answer: str) -> str:
+        """Plain feedback built from the question itself, for when the model cannot be reached"""
+        options = {}
+        for line in quiz_question.split('\n'):
+            line = line.strip()
+            if line[:2] in (f"{letter})" for letter in QUIZ_OPTIONS):
+                options[line[0]] = line[2:].strip()
+        answer = f"{correct_answer}) {options.get(correct_answer, '')}".rstrip()
+        if patient_answer == correct_answer:
+            return f"Correct! The answer is {answer}. Well done."
+        return (f"The correct answer is {answer}. "
+                f"Have another look at the summary above to see why.")
+    
+    @staticmethod
+    def _feedback_fallback(quiz_question: str, patient_answer: str, correct_answer: str,
+                           error: Exception) -> str:
+        if correct_answer not in QUIZ_OPTIONS:
+            raise error
+        notify(f"\nDetailed feedback is unavailable ({str(error)}); grading from the quiz itself...")
+        return QuizService.local_feedback(quiz_question, patient_answer, correct_answer)
+    
+    @staticmethod
+    def grade_quiz_answer(llm: "ChatOpenAI", topic: str, quiz_question: str, 
+                         patient_answer: str, correct_answer: str, summary: str,
+                         on_token: Optional[TokenCallback] = None) -> Tuple[str, str]:
+        """Grade patient's quiz answer using ONLY the summary, streaming feedback to on_token"""
+        try:
+            feedback = complete(llm, QuizService.build_feedback_messages(
+                topic, quiz_question, patient_answer, correct_answer, summary
+            ), "feedback", on_token)
+        except Exception as e:
+            feedback = QuizService._feedback_fallback(quiz_question, patient_answer, correct_answer, e)
+        grade = "A" if patient_answer == correct_answer else "F"
+        return grade, feedback
+    
+    @staticmethod
+    async def agrade_quiz_answer(llm: "ChatOpenAI", topic: str, quiz_question: str,
+                                 patient_answer: str, correct_answer: str, summary: str,
+                                 on_token: Optional[TokenCallback] = None) -> Tuple[str, str]:
+        """Async variant of grade_quiz_answer"""
+        try:
+            feedback = await acomplete(llm, QuizService.build_feedback_messages(
+                topic, quiz_question, patient_answer, correct_answer, summary
+            ), "feedback", on_token)
+        except Exception as e:
+            feedback = QuizService._feedback_fallback(quiz_question, patient_answer, correct_answer, e)
+        grade = "A" if patient_answer == correct_answer else "F"
         return grade, feedback
\ No newline at end of file
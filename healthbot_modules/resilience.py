@@ -0,0 +1,490 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from .admission import AdmissionRejected
+
+# Applied by upstream.py to every OpenAI and Tavily call, so the services only
+# see either a result or an error after the policy has been exhausted.
+
+class DeadlineExceeded(TimeoutError):
+    """An upstream call (with its retries and hedges) ran past its deadline"""
+
+class BudgetExceeded(DeadlineExceeded):
+    """A call ran past the latency budget its caller gave it (see routing.py), which
+    moves it to a faster model; it says nothing about the upstream's health"""
+
+class CircuitOpenError(Exception):
+    """Calls to an upstream are failing fast after repeated errors"""
+
+class ResiliencePolicy:
+    """How hard to try one upstream: deadline, retries, hedging and breaker thresholds"""
+
+    def __init__(self, deadline: float = 60.0, max_attempts: int = 3, backoff_base: float = 0.25,
+                 backoff_cap: float = 4.0, hedge_percentile: float = 95.0, hedge_min_samples: int = 20,
+                 max_hedges: int = 1, breaker_window: int = 20, breaker_failure_ratio: float = 0.5,
+                 breaker_reset: float = 30.0):
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # 0 disables hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedges = max_hedges
+        self.breaker_window = breaker_window
+        self.breaker_failure_ratio = breaker_failure_ratio
+        self.breaker_reset = breaker_reset
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number attempt + 1"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+class CircuitBreaker:
+    """Failure-ratio breaker: closed -> open -> half-open probe -> closed
+
+    The breaker opens when at least `failure_ratio` of the last `window` calls
+    failed (once `min_calls` have been seen). Counting a rolling window rather than
+    consecutive failures keeps a burst of fast failures among many slower successes
+    under concurrency from tripping it. While open, calls fail fast; after
+    `reset_timeout` seconds one probe call is let through, and its outcome closes
+    the breaker or opens it again.
+    """
+
+    def __init__(self, name: str, window: int = 20, failure_ratio: float = 0.5,
+                 min_calls: int = 10, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+        # Number of the probe call in flight while half-open, if any
+        self._probe: Optional[int] = None
+        self._probes = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def check(self) -> Optional[int]:
+        """Raise CircuitOpenError unless a call may go ahead
+
+        Returns the probe's number when the call is the half-open probe, else None.
+        Pass it to release() once the call is over, however it ended.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if time.monotonic() - self._opened_at >= self.reset_timeout and self._probe is None:
+                self._probes += 1
+                self._probe = self._probes
+                return self._probe
+        raise CircuitOpenError(f"{self.name} is unavailable (circuit open after repeated failures)")
+
+    def release(self, probe: Optional[int]):
+        """Free the probe slot if the probe ended without an outcome
+
+        A probe that was cancelled, shed by admission control or ran past its
+        caller's budget says nothing about the upstream, so the next call probes
+        instead. Does nothing once the probe's outcome has been recorded.
+        """
+        with self._lock:
+            if probe is not None and self._probe == probe:
+                self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            if self._probe is not None:
+                self._outcomes.clear()
+                self._opened_at = None
+                self._probe = None
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            if self._probe is not None:
+                self._open()
+            elif self._opened_at is None and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures >= self.failure_ratio * len(self._outcomes):
+                    self._open()
+
+    def _open(self):
+        self.trips += 1
+        self._opened_at = time.monotonic()
+        self._probe = None
+
+def _retryable(error: BaseException) -> bool:
+    # Malformed requests and programming errors fail the same way every time, and
+    # a request shed by admission control should not come straight back
+    return not isinstance(error, (CircuitOpenError, AdmissionRejected, ValueError, TypeError,
+                                  KeyError, AttributeError))
+
+def _upstream_failure(error: BaseException) -> bool:
+    """Whether an error says something about the upstream's health (shed requests never reached it)"""
+    return not isinstance(error, (CircuitOpenError, AdmissionRejected))
+
+class ResilientUpstream:
+    """Deadlines, hedged requests, jittered retries and a circuit breaker for one upstream
+
+    A call that has not answered by the `hedge_percentile` latency of recent calls
+    to the same site gets a duplicate request, and the first answer wins. Hedging
+    starts once `hedge_min_samples` latencies are known and only applies to whole
+    calls; a stream that has started is never duplicated, and is only retried if it
+    failed before its first chunk.
+
+    A caller may also give a call a latency budget tighter than the deadline: for
+    a whole call the time to answer, for a stream the time to its first chunk.
+    When it runs out, or a retry would no longer fit in it, BudgetExceeded is
+    raised instead of retrying further.
+
+    Sync calls run on a worker pool so the deadline can be enforced; a losing or
+    abandoned attempt cannot be interrupted and finishes in the background.
+    """
+
+    def __init__(self, name: str, policy: Optional[ResiliencePolicy] = None,
+                 enabled: bool = True, workers: int = 256, samples: int = 256):
+        self.name = name
+        self.policy = policy or ResiliencePolicy()
+        self.enabled = enabled
+        self.breaker = self._new_breaker()
+        # Hedges are only sent while this allows (e.g. while quota is not queued up)
+        self.hedge_allowed: Callable[[], bool] = lambda: True
+        self._workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._samples = samples
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,     # calls answered by a hedge rather than the original request
+            "deadlines": 0,
+            "over_budget": 0,    # calls handed back to the caller after running out of budget
+            "failures": 0,       # calls that failed after every attempt
+            "short_circuited": 0,
+        }
+
+    def configure(self, policy: ResiliencePolicy, enabled: bool = True):
+        with self._lock:
+            self.policy = policy
+            self.enabled = enabled
+            self.breaker = self._new_breaker()
+
+    def _new_breaker(self) -> CircuitBreaker:
+        policy = self.policy
+        return CircuitBreaker(self.name, policy.breaker_window, policy.breaker_failure_ratio,
+                              min(10, policy.breaker_window), policy.breaker_reset)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _observe(self, site: str, seconds: float):
+        with self._lock:
+            samples = self._latencies.get(site)
+            if samples is None:
+                samples = self._latencies[site] = deque(maxlen=self._samples)
+            samples.append(seconds)
+
+    def hedge_delay(self, site: str) -> Optional[float]:
+        """Seconds after which a call to this site gets a duplicate request, if hedging applies"""
+        policy = self.policy
+        if not policy.hedge_percentile or not policy.max_hedges:
+            return None
+        with self._lock:
+            samples = self._latencies.get(site)
+            if samples is None or len(samples) < policy.hedge_min_samples:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * policy.hedge_percentile / 100.0))
+        return ordered[index]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                    thread_name_prefix=f"{self.name}-upstream")
+            return self._executor
+
+    def _check_breaker(self) -> Optional[int]:
+        try:
+            return self.breaker.check()
+        except CircuitOpenError:
+            self._count("short_circuited")
+            raise
+
+    def _gave_up(self, error: BaseException):
+        self._count("failures")
+        if isinstance(error, DeadlineExceeded):
+            self._count("deadlines")
+
+    def _deadlines(self, budget: Optional[float]) -> Tuple[float, float]:
+        """Absolute (deadline, budget) for a call starting now; no budget is an infinite one"""
+        now = time.monotonic()
+        return now + self.policy.deadline, now + budget if budget is not None else float("inf")
+
+    def _failed(self, site: str, error: Exception, attempt: int, deadline: float, budget_at: float,
+                delivered: bool = False) -> float:
+        """Account for a failed attempt; returns the backoff before retrying, or raises to give up"""
+        now = time.monotonic()
+        over_budget = now >= budget_at
+        # Running out of the caller's budget says nothing about the upstream's health;
+        # a half-open probe that did is released by the call loop to let another probe
+        if _upstream_failure(error) and not over_budget:
+            self.breaker.record_failure()
+        delay = self.policy.backoff(attempt)
+        retryable = _retryable(error) and not delivered
+        if (not delivered and budget_at < deadline and now + delay >= budget_at
+                and (retryable or isinstance(error, DeadlineExceeded))):
+            self._count("over_budget")
+            raise BudgetExceeded(f"{self.name} call to {site} ran past its latency budget") from error
+        if not retryable or attempt + 1 >= self.policy.max_attempts or now + delay >= deadline:
+            self._gave_up(error)
+            raise error
+        self._count("retries")
+        return delay
+
+    # Whole calls
+
+    def _timed(self, site: str, fn: Callable[..., Any], args: tuple) -> Any:
+        started = time.perf_counter()
+        result = fn(*args)
+        self._observe(site, time.perf_counter() - started)
+        return result
+
+    def _hedged(self, site: str, fn: Callable[..., Any], args: tuple, deadline: float) -> Any:
+        pool = self._pool()
+        hedge_delay = self.hedge_delay(site)
+        started = time.monotonic()
+        attempts = [pool.submit(self._timed, site, fn, args)]
+        pending = set(attempts)
+        errors = []
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise DeadlineExceeded(f"{self.name} call to {site} exceeded {self.policy.deadline}s")
+                timeout = deadline - now
+                hedge_at = None
+                if hedge_delay is not None and len(attempts) <= self.policy.max_hedges:
+                    hedge_at = started + hedge_delay * len(attempts)
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not attempts[0]:
+                            self._count("hedge_wins")
+                        return future.result()
+                    errors.append(future.exception())
+                if not pending and (hedge_at is None or errors):
+                    raise errors[0]
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    if not self.hedge_allowed():
+                        hedge_delay = None
+                        continue
+                    self._count("hedges")
+                    future = pool.submit(self._timed, site, fn, args)
+                    attempts.append(future)
+                    pending.add(future)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def call(self, site: str, fn: Callable[..., Any], *args, budget: Optional[float] = None) -> Any:
+        """fn(*args) under the policy: hedged, retried with backoff, bounded by the deadline"""
+        if not self.enabled:
+            return fn(*args)
+        self._count("calls")
+        deadline, budget_at = self._deadlines(budget)
+        attempt = 0
+        while True:
+            probe = self._check_breaker()
+            try:
+                result = self._hedged(site, fn, args, min(deadline, budget_at))
+            except Exception as e:
+                delay = self._failed(site, e, attempt, deadline, budget_at)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release(probe)
+            attempt += 1
+            time.sleep(delay)
+
+    async def _atimed(self, site: str, coro_fn: Callable[..., Awaitable[Any]], args: tuple) -> Any:
+        started = time.perf_counter()
+        result = await coro_fn(*args)
+        self._observe(site, time.perf_counter() - started)
+        return result
+
+    async def _ahedged(self, site: str, coro_fn: Callable[..., Awaitable[Any]], args: tuple,
+                       deadline: float) -> Any:
+        hedge_delay = self.hedge_delay(site)
+        started = time.monotonic()
+        attempts = [asyncio.ensure_future(self._atimed(site, coro_fn, args))]
+        pending = set(attempts)
+        errors = []
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise DeadlineExceeded(f"{self.name} call to {site} exceeded {self.policy.deadline}s")
+                timeout = deadline - now
+                hedge_at = None
+                if hedge_delay is not None and len(attempts) <= self.policy.max_hedges:
+                    hedge_at = started + hedge_delay * len(attempts)
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is not attempts[0]:
+                            self._count("hedge_wins")
+                        return task.result()
+                    errors.append(asyncio.CancelledError() if task.cancelled() else task.exception())
+                if not pending and (hedge_at is None or errors):
+                    raise errors[0]
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    if not self.hedge_allowed():
+                        hedge_delay = None
+                        continue
+                    self._count("hedges")
+                    task = asyncio.ensure_future(self._atimed(site, coro_fn, args))
+                    attempts.append(task)
+                    pending.add(task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, site: str, coro_fn: Callable[..., Awaitable[Any]], *args,
+                    budget: Optional[float] = None) -> Any:
+        """Async variant of call; losing attempts are cancelled"""
+        if not self.enabled:
+            return await coro_fn(*args)
+        self._count("calls")
+        deadline, budget_at = self._deadlines(budget)
+        attempt = 0
+        while True:
+            probe = self._check_breaker()
+            try:
+                result = await self._ahedged(site, coro_fn, args, min(deadline, budget_at))
+            except Exception as e:
+                delay = self._failed(site, e, attempt, deadline, budget_at)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release(probe)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    # Streams
+
+    def stream(self, site: str, open_stream: Callable[[], Iterator[Any]], on_chunk: Callable[[Any], None],
+               budget: Optional[float] = None):
+        """Consume open_stream() into on_chunk, retrying only until the first chunk arrives
+
+        The deadline (and budget, for the first chunk) is checked as chunks arrive; a
+        read that blocks is bounded by the HTTP client's own timeout.
+        """
+        if not self.enabled:
+            for chunk in open_stream():
+                on_chunk(chunk)
+            return
+        self._count("calls")
+        deadline, budget_at = self._deadlines(budget)
+        attempt = 0
+        while True:
+            probe = self._check_breaker()
+            delivered = False
+            try:
+                for chunk in open_stream():
+                    now = time.monotonic()
+                    if now >= deadline or (not delivered and now >= budget_at):
+                        raise DeadlineExceeded(f"{self.name} stream from {site} exceeded {self.policy.deadline}s")
+                    delivered = True
+                    on_chunk(chunk)
+            except Exception as e:
+                delay = self._failed(site, e, attempt, deadline, budget_at, delivered)
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                self.breaker.release(probe)
+            attempt += 1
+            time.sleep(delay)
+
+    async def astream(self, site: str, open_stream: Callable[[], AsyncIterator[Any]],
+                      on_chunk: Callable[[Any], None], budget: Optional[float] = None):
+        """Async variant of stream; here the deadline and budget also interrupt a stalled read"""
+        if not self.enabled:
+            async for chunk in open_stream():
+                on_chunk(chunk)
+            return
+        self._count("calls")
+        deadline, budget_at = self._deadlines(budget)
+        attempt = 0
+        while True:
+            probe = self._check_breaker()
+            delivered = [False]
+
+            async def consume():
+                async for chunk in open_stream():
+                    delivered[0] = True
+                    on_chunk(chunk)
+
+            task = asyncio.ensure_future(consume())
+            try:
+                try:
+                    # Until the first chunk the budget applies too, then only the deadline
+                    limit = min(deadline, budget_at)
+                    while not task.done():
+                        now = time.monotonic()
+                        if now >= limit:
+                            raise DeadlineExceeded(f"{self.name} stream from {site} exceeded {self.policy.deadline}s")
+                        await asyncio.wait({task}, timeout=limit - now)
+                        if delivered[0]:
+                            limit = deadline
+                    task.result()
+                finally:
+                    if not task.done():
+                        task.cancel()
+            except Exception as e:
+                delay = self._failed(site, e, attempt, deadline, budget_at, delivered[0])
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                self.breaker.release(probe)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["breaker"] = self.breaker.state
+        stats["breaker_trips"] = self.breaker.trips
+        return stats
+
+# One per upstream, shared by every session; the workflow configures them from the environment
+UPSTREAMS: Dict[str, ResilientUpstream] = {
+    "llm": ResilientUpstream("OpenAI", ResiliencePolicy(deadline=60.0)),
+    "tavily": ResilientUpstream("Tavily", ResiliencePolicy(deadline=20.0)),
+}
+
+def resilience_stats() -> Dict[str, Dict[str, Any]]:
+    return {kind: upstream.stats() for kind, upstream in UPSTREAMS.items()}
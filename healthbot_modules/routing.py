@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .clients import DEFAULT_MODEL
+from .metrics import Histogram, current_node
+
+# Applied by upstream.py to every OpenAI call by its site. Sites map onto nodes:
+# search_planner (search), summarize, quiz (generate_quiz, or speculation in the
+# background) and feedback (grade_quiz).
+
+FAST_MODEL = "gpt-4o-mini"
+
+# site -> route; extend or override with HEALTHBOT_ROUTES
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    # Only picks Tavily queries, so the fast tier is plenty
+    "search_planner": {"model": FAST_MODEL, "max_tokens": 300, "timeout": 8.0},
+    "summarize": {"model": DEFAULT_MODEL, "max_tokens": 1000, "timeout": 20.0, "fallback": FAST_MODEL},
+    "quiz": {"model": FAST_MODEL, "max_tokens": 900, "timeout": 15.0},
+    "feedback": {"model": FAST_MODEL, "max_tokens": 500, "timeout": 10.0},
+}
+
+# USD per million (input, output) tokens, for the cost breakdown; other models are reported without a cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+def model_cost(model: Optional[str], input_tokens: int, output_tokens: int) -> Optional[float]:
+    """USD for a call's usage, or None for a model with no known price"""
+    if not model:
+        return None
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots, e.g. gpt-4o-mini-2024-07-18, cost what their model does
+        names = sorted((name for name in MODEL_PRICES if model.startswith(name + "-")), key=len, reverse=True)
+        if not names:
+            return None
+        prices = MODEL_PRICES[names[0]]
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1e6
+
+class Route:
+    """Model, completion cap and latency budget for one call site
+
+    With a fallback model, a call that has not answered within `timeout` seconds
+    (a stream: not started) moves to the fallback. Without one the timeout is only
+    the target the breakdown counts misses against.
+    """
+
+    def __init__(self, model: str, max_tokens: Optional[int] = None, timeout: Optional[float] = None,
+                 fallback: Optional[str] = None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.fallback = Route(fallback, max_tokens) if fallback and timeout else None
+        self.is_fallback = False
+        if self.fallback is not None:
+            self.fallback.is_fallback = True
+        self._bound: Dict[int, Tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "Route":
+        return cls(spec["model"], spec.get("max_tokens"), spec.get("timeout"), spec.get("fallback"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"model": self.model, "max_tokens": self.max_tokens, "timeout": self.timeout,
+                "fallback": self.fallback.model if self.fallback is not None else None}
+
+    @property
+    def budget(self) -> Optional[float]:
+        """The timeout, when it is enforced by falling back"""
+        return self.timeout if self.fallback is not None else None
+
+    def bind(self, llm: Any) -> Any:
+        """llm with this route's model and limits applied to each request
+
+        Binding keeps the shared client and its connection pools; only the request
+        parameters change. A budgeted route also sets the request timeout, so a
+        blocking read gives up when the budget does.
+        """
+        with self._lock:
+            entry = self._bound.get(id(llm))
+            if entry is None:
+                kwargs: Dict[str, Any] = {"model": self.model}
+                if self.max_tokens:
+                    kwargs["max_tokens"] = self.max_tokens
+                if self.budget:
+                    kwargs["timeout"] = self.budget
+                # Holding llm keeps its id from being reused
+                entry = self._bound[id(llm)] = (llm, llm.bind(**kwargs))
+            return entry[1]
+
+def load_routes(path: Optional[str] = None) -> Dict[str, Route]:
+    """Default routes, overridden per site by a JSON file of {site: {model, max_tokens, timeout, fallback}}"""
+    specs = {site: dict(spec) for site, spec in DEFAULT_ROUTES.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for site, spec in json.load(f).items():
+                specs[site] = dict(specs.get(site, {}), **spec)
+    return {site: Route.from_dict(spec) for site, spec in specs.items()}
+
+class ModelRouter:
+    """Picks the model for each OpenAI call site and keeps a per-node latency and cost ledger
+
+    plan(site) lists the attempts for one call: the site's route under its budget,
+    then the faster fallback. Once at least miss_ratio of the last `window`
+    budgeted calls to a site missed their budget, calls go straight to the
+    fallback, except every probe_every-th, which tries the route again so the site
+    can recover. Sites with no route, or routing disabled, use the client as it is.
+
+    Every call is recorded under its node, site and model; with log_path set each
+    is also appended there as a JSON line, for tuning the routes offline.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, Route]] = None, enabled: bool = True,
+                 window: int = 20, miss_ratio: float = 0.5, min_calls: int = 10, probe_every: int = 10,
+                 log_path: Optional[str] = None):
+        self.window = window
+        self.miss_ratio = miss_ratio
+        self.min_calls = min_calls
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._ledger: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._counters = {"rerouted": 0, "probes": 0}
+        self.configure(routes or {}, enabled, log_path)
+
+    def configure(self, routes: Dict[str, Route], enabled: bool = True, log_path: Optional[str] = None):
+        with self._lock:
+            self.routes = dict(routes)
+            self.enabled = enabled
+            self.log_path = log_path
+            self._misses: Dict[str, Deque[bool]] = {}
+            self._skipped: Dict[str, int] = {}
+
+    def route(self, site: str) -> Optional[Route]:
+        return self.routes.get(site) if self.enabled else None
+
+    def model_for(self, site: str, llm: Any) -> Optional[str]:
+        """The model calls to site are routed to (for cache and coalescing keys)"""
+        route = self.route(site)
+        return route.model if route is not None else getattr(llm, 'model_name', None)
+
+    def plan(self, site: str) -> List[Tuple[Optional[Route], Optional[float]]]:
+        """(route, budget) per attempt, in order; only the last attempt has no budget"""
+        route = self.route(site)
+        if route is None:
+            return [(None, None)]
+        if route.fallback is None:
+            return [(route, None)]
+        with self._lock:
+            misses = self._misses.get(site)
+            if (misses is not None and len(misses) >= self.min_calls
+                    and misses.count(True) >= self.miss_ratio * len(misses)):
+                skipped = self._skipped[site] = self._skipped.get(site, 0) + 1
+                if skipped % self.probe_every:
+                    self._counters["rerouted"] += 1
+                    return [(route.fallback, None)]
+                self._counters["probes"] += 1
+        return [(route, route.budget), (route.fallback, None)]
+
+    def record(self, site: str, route: Optional[Route], llm: Any, seconds: float,
+               usage: Tuple[int, int, int] = (0, 0, 0), abandoned: bool = False):
+        """Account for one attempt: answered with usage (input, output, total tokens), or abandoned over budget
+
+        seconds is the upstream's own time: for an answer, the request that answered
+        (not the wait for admission, retry backoff or a losing hedge); for an
+        abandoned attempt, the budget it ran through.
+        """
+        model = route.model if route is not None else getattr(llm, 'model_name', None) or "unknown"
+        node = current_node() or "background"
+        input_tokens, output_tokens, tokens = usage
+        cost = model_cost(model, input_tokens, output_tokens)
+        timeout = route.timeout if route is not None else None
+        over_budget = abandoned or (timeout is not None and seconds > timeout)
+        with self._lock:
+            if route is not None and route.fallback is not None:
+                self._misses.setdefault(site, deque(maxlen=self.window)).append(abandoned)
+            entry = self._ledger.get((node, site, model))
+            if entry is None:
+                entry = self._ledger[(node, site, model)] = {
+                    "latency": Histogram(), "calls": 0, "abandoned": 0, "over_budget": 0,
+                    "fallback": route is not None and route.is_fallback,
+                    "input_tokens": 0, "output_tokens": 0, "tokens": 0, "cost": None,
+                }
+            if abandoned:
+                entry["abandoned"] += 1
+            else:
+                entry["calls"] += 1
+                entry["latency"].observe(seconds)
+                entry["input_tokens"] += input_tokens
+                entry["output_tokens"] += output_tokens
+                entry["tokens"] += tokens
+                if cost is not None:
+                    entry["cost"] = (entry["cost"] or 0.0) + cost
+            entry["over_budget"] += over_budget
+        if self.log_path:
+            self._log({"time": time.time(), "node": node, "site": site, "model": model,
+                       "fallback": route is not None and route.is_fallback, "seconds": round(seconds, 4),
+                       "abandoned": abandoned, "over_budget": over_budget, "input_tokens": input_tokens,
+                       "output_tokens": output_tokens, "cost": cost})
+
+    def _log(self, record: Dict[str, Any]):
+        try:
+            with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError:
+            # The log is for tuning; a full disk must not fail the call it describes
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = [dict(node=node, site=site, model=model, **{
+                key: value.to_dict() if key == "latency" else value for key, value in entry.items()
+            }) for (node, site, model), entry in self._ledger.items()]
+            stats = dict(self._counters)
+        stats["enabled"] = self.enabled
+        stats["routes"] = {site: route.to_dict() for site, route in self.routes.items()}
+        stats["calls"] = calls
+        return stats
+
+    def report(self) -> List[str]:
+        """One line per node, site and model for the end-of-session summary"""
+        lines = [f"{'node':<15}{'site':<16}{'model':<18}{'calls':>6}{'p50':>9}{'p95':>9}"
+                 f"{'tokens':>9}{'cost':>11}{'missed':>8}"]
+        for row in self.stats()["calls"]:
+            latency = row["latency"]
+            model = row["model"] + (" (fb)" if row["fallback"] else "")
+            cost = f"${row['cost']:.5f}" if row["cost"] is not None else "-"
+            lines.append(
+                f"{row['node']:<15}{row['site']:<16}{model:<18}{row['calls']:>6}{latency['p50']:>8.2f}s"
+                f"{latency['p95']:>8.2f}s{row['tokens']:>9}{cost:>11}{row['over_budget']:>8}"
+            )
+        return lines
+
+# Shared by every session; the workflow loads the routes from the environment
+ROUTER = ModelRouter()
@@ -1,21 +1,140 @@
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+from .cache import SummaryStore, TieredCache, normalize_topic, make_cache_key
+from .coalesce import SingleFlight
+from .clients import (CLIENTS, SEARCH_DEPTH, SEARCH_MAX_RESULTS, TRUSTED_MEDICAL_DOMAINS,
+                      LazyClient, human_message, system_message)
+from .context import ContextPacker
+from .routing import ROUTER
+from .session_io import notify
+from .streaming import TokenCallback, acomplete, complete
+from .upstream import ainvoke_llm, ainvoke_tool, in_current_context, invoke_llm, invoke_tool
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+TAVILY_TOOL_NAME = "tavily_search_results_json"
+
+# planner: the model decides what to search; direct: templated queries go straight
+# to Tavily; hybrid: direct first, planner only when the direct results are thin
+SEARCH_STRATEGIES = ("planner", "direct", "hybrid")
+DIRECT_QUERY_TEMPLATES = ["{topic} medical information symptoms treatment causes"]
 
 class MedicalSearchService:
     """Handles medical information search using Tavily"""
     
-    def __init__(self):
-        self.search_tool = TavilySearchResults(
-            max_results=3,
-            search_depth="advanced",
-            include_domains=["mayoclinic.org", "webmd.com", "nih.gov", "cdc.gov", "healthline.com", "medlineplus.gov"]
+    def __init__(self, cache: Optional[TieredCache] = None, tool_call_workers: int = 4,
+                 tool_call_timeout: float = 20.0, strategy: str = "planner",
+                 hybrid_min_results: int = SEARCH_MAX_RESULTS, search_tool=None, content_store=None):
+        if strategy not in SEARCH_STRATEGIES:
+            raise ValueError(f"Unknown search strategy '{strategy}', expected one of {SEARCH_STRATEGIES}")
+        self.search_tool = search_tool or LazyClient(CLIENTS.search_tool)
+        self.cache = cache
+        self.tool_call_timeout = tool_call_timeout
+        self._tool_executor = ThreadPoolExecutor(max_workers=tool_call_workers, thread_name_prefix="tavily")
+        # One slot per worker, held until the call really returns: a timed-out call keeps
+        # its worker, and new calls are skipped rather than queued behind it
+        self._tool_slots = threading.BoundedSemaphore(tool_call_workers)
+        self.saturated = 0
+        self.strategy = strategy
+        self.hybrid_min_results = hybrid_min_results
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+        # Sessions searching the same topic at the same time share one search
+        self.flight = SingleFlight("search")
+        # Stale search results or pre-warmed content stand in when the search fails
+        self.content_store = content_store
+        self.fallbacks = 0
+    
+    def cache_key(self, topic: str) -> str:
+        """Cache key for a topic under the current search settings"""
+        return make_cache_key(
+            "search",
+            normalize_topic(topic),
+            sorted(TRUSTED_MEDICAL_DOMAINS),
+            SEARCH_MAX_RESULTS,
+            SEARCH_DEPTH
         )
     
-    def search_medical_info(self, topic: str, llm_with_tools: ChatOpenAI) -> List[dict]:
-        """Search for medical information using OpenAI + Tavily integration"""
-        search_prompt = f"""
+    def _cached_results(self, topic: str) -> Optional[List[dict]]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self.cache_key(topic))
+        if cached is not None:
+            notify("Serving cached results from trusted medical sources...")
+        return cached
+    
+    def _store_results(self, topic: str, search_results: List[dict]):
+        # Empty results are not cached so the next request retries the search
+        if self.cache is not None and search_results:
+            self.cache.set(self.cache_key(topic), search_results)
+    
+    def search_medical_info(self, topic: str, llm_with_tools: "ChatOpenAI",
+                            key_topic: Optional[str] = None) -> List[dict]:
+        """Search for medical information, serving repeated topics from the cache
+        
+        key_topic (the canonical topic, if different) is what is searched for, and keys
+        the cache and the shared in-flight search, so shared results never depend on
+        one patient's wording.
+        """
+        key_topic = key_topic or topic
+        cached = self._cached_results(key_topic)
+        if cached is not None:
+            return cached
+        
+        try:
+            return self.flight.do(self.cache_key(key_topic), self._search_and_store, key_topic, llm_with_tools)
+        except Exception as e:
+            return self._fallback_results(key_topic, e)
+    
+    async def asearch_medical_info(self, topic: str, llm_with_tools: "ChatOpenAI",
+                                   key_topic: Optional[str] = None) -> List[dict]:
+        """Async variant of search_medical_info"""
+        key_topic = key_topic or topic
+        cached = self._cached_results(key_topic)
+        if cached is not None:
+            return cached
+        
+        try:
+            return await self.flight.ado(self.cache_key(key_topic), self._asearch_and_store, key_topic,
+                                         llm_with_tools)
+        except Exception as e:
+            return self._fallback_results(key_topic, e)
+    
+    def _fallback_results(self, topic: str, error: Exception) -> List[dict]:
+        """Expired cached results or pre-warmed content for a failed search; re-raises without either"""
+        fallback = self.cache.get_stale(self.cache_key(topic)) if self.cache is not None else None
+        if fallback is None and self.content_store is not None:
+            entry = self.content_store.get(topic, allow_stale=True)
+            fallback = entry["search_results"] if entry is not None else None
+        if not fallback:
+            raise error
+        notify(f"Search is unavailable ({str(error)}); serving saved results from trusted medical sources...")
+        with self._latency_lock:
+            self.fallbacks += 1
+        return fallback
+    
+    def _search_and_store(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        search_results = self._search_uncached(topic, llm_with_tools)
+        self._store_results(topic, search_results)
+        return search_results
+    
+    async def _asearch_and_store(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        search_results = await self._asearch_uncached(topic, llm_with_tools)
+        self._store_results(topic, search_results)
+        return search_results
+    
+    @staticmethod
+    def _search_prompt(topic: str) -> str:
+        return f"""
         Search for comprehensive, reliable medical information about "{topic}".
         Find information covering:
         - What this condition/topic is
@@ -27,45 +146,183 @@ class MedicalSearchService:
         
         Use the search tool to find current, accurate information from reputable medical sources.
         """
-        
+    
+    @staticmethod
+    def _direct_query(topic: str) -> str:
+        return DIRECT_QUERY_TEMPLATES[0].format(topic=topic)
+    
+    @staticmethod
+    def _direct_tool_calls(topic: str) -> List[dict]:
+        return [{"name": TAVILY_TOOL_NAME, "args": {"query": template.format(topic=topic)}}
+                for template in DIRECT_QUERY_TEMPLATES]
+    
+    def _record_latency(self, strategy: str, seconds: float):
+        logger.info("Search completed in %.2fs (%s strategy)", seconds, strategy)
+        with self._latency_lock:
+            stats = self._latency.setdefault(strategy, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    
+    def latency_stats(self) -> dict:
+        """Return uncached search latency per strategy"""
+        with self._latency_lock:
+            return {
+                strategy: dict(stats, avg_seconds=stats["total_seconds"] / stats["count"])
+                for strategy, stats in self._latency.items()
+            }
+    
+    def _search_uncached(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        """Search using the configured strategy, recording its latency"""
+        started = time.perf_counter()
+        if self.strategy == "direct":
+            search_results = self._run_tool_calls(self._direct_tool_calls(topic))
+        elif self.strategy == "hybrid":
+            search_results = self._hybrid_search(topic, llm_with_tools)
+        else:
+            search_results = self._planner_search(topic, llm_with_tools)
+        self._record_latency(self.strategy, time.perf_counter() - started)
+        return search_results
+    
+    def _hybrid_search(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        try:
+            direct_results = self._run_tool_calls(self._direct_tool_calls(topic))
+        except Exception as e:
+            logger.warning("Direct search failed (%s), asking the search planner", e)
+            direct_results = []
+        if len(direct_results) >= self.hybrid_min_results:
+            return direct_results
+        return self._merge_tool_results([direct_results, self._planner_search(topic, llm_with_tools)])
+    
+    def _planner_search(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        """Search for medical information using OpenAI + Tavily integration"""
         # OpenAI will automatically call Tavily tool when needed
-        response = llm_with_tools.invoke([HumanMessage(content=search_prompt)])
+        response = invoke_llm(llm_with_tools, [human_message(self._search_prompt(topic))], "search_planner")
         
         # Check if tool was called and get results
         if hasattr(response, 'tool_calls') and response.tool_calls:
-            print("OpenAI successfully called Tavily search tool...")
-            search_results = []
-            for tool_call in response.tool_calls:
-                if tool_call['name'] == 'tavily_search_results_json':
-                    results = self.search_tool.invoke(tool_call['args'])
-                    search_results.extend(results)
+            notify("OpenAI successfully called Tavily search tool...")
+            search_results = self._run_tool_calls(response.tool_calls)
         else:
             # Direct search as fallback
-            search_query = f"{topic} medical information symptoms treatment causes"
-            search_results = self.search_tool.invoke({"query": search_query})
+            search_results = invoke_tool(self.search_tool, {"query": self._direct_query(topic)})
         
         return search_results
-
-class MedicalSummarizationService:
-    """Handles summarization of medical search results"""
+    
+    def _submit_tool_call(self, args: dict):
+        """A future for one Tavily call on the worker pool, or the error if every worker is busy"""
+        if not self._tool_slots.acquire(blocking=False):
+            with self._latency_lock:
+                self.saturated += 1
+            return TimeoutError("Tavily search is saturated by calls that have not returned yet")
+        try:
+            future = self._tool_executor.submit(in_current_context(invoke_tool), self.search_tool, args)
+        except BaseException:
+            self._tool_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._tool_slots.release())
+        return future
+    
+    def _run_tool_calls(self, tool_calls: List[dict]) -> List[dict]:
+        """Run Tavily tool calls concurrently on the worker pool, waiting at most tool_call_timeout
+        
+        A running call cannot be cancelled: one that times out is left to finish in
+        the background (within the Tavily deadline, see resilience.py) and keeps its
+        worker until then, so while every worker is taken new calls are skipped.
+        """
+        calls = [call for call in tool_calls if call['name'] == TAVILY_TOOL_NAME]
+        submitted = [self._submit_tool_call(call['args']) for call in calls]
+        futures = [future for future in submitted if not isinstance(future, BaseException)]
+        wait(futures, timeout=self.tool_call_timeout)
+        
+        outcomes = []
+        for future in submitted:
+            if isinstance(future, BaseException):
+                outcomes.append(future)
+            elif not future.done():
+                outcomes.append(TimeoutError(f"Tavily call exceeded {self.tool_call_timeout}s"))
+            elif future.exception() is not None:
+                outcomes.append(future.exception())
+            else:
+                outcomes.append(future.result())
+        return self._merge_tool_results(outcomes)
     
     @staticmethod
-    def create_patient_summary(llm: ChatOpenAI, topic: str, search_results: List[dict]) -> str:
-        """Create patient-friendly summary from search results"""
-        search_content = ""
-        sources = []
-        for result in search_results:
-            url = result.get('url', 'Unknown source')
-            sources.append(url)
-            search_content += f"Source: {url}\n"
-            search_content += f"Content: {result.get('content', '')}\n\n"
+    def _merge_tool_results(outcomes: list) -> List[dict]:
+        """Merge per-call results in tool-call order, dropping repeated URLs
         
+        Failed calls are skipped so the other calls still count; if every call
+        failed, the first error is raised.
+        """
+        merged = []
+        seen_urls = set()
+        errors = []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                errors.append(outcome)
+                continue
+            for result in outcome:
+                url = result.get('url') if isinstance(result, dict) else None
+                if url is not None and url in seen_urls:
+                    continue
+                seen_urls.add(url)
+                merged.append(result)
         
-        system_message = SystemMessage(content="""You are a medical education specialist creating patient education materials. 
-        Your goal is to make complex medical information accessible to patients while maintaining complete accuracy. 
-        Use ONLY the provided search results - do not add information from your training data.""")
+        if errors:
+            if len(errors) == len(outcomes):
+                raise errors[0]
+            logger.warning("%d of %d searches failed; using partial results", len(errors), len(outcomes))
+        return merged
+    
+    async def _asearch_uncached(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        """Async variant of _search_uncached"""
+        started = time.perf_counter()
+        if self.strategy == "direct":
+            search_results = await self._arun_tool_calls(self._direct_tool_calls(topic))
+        elif self.strategy == "hybrid":
+            search_results = await self._ahybrid_search(topic, llm_with_tools)
+        else:
+            search_results = await self._aplanner_search(topic, llm_with_tools)
+        self._record_latency(self.strategy, time.perf_counter() - started)
+        return search_results
+    
+    async def _ahybrid_search(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        try:
+            direct_results = await self._arun_tool_calls(self._direct_tool_calls(topic))
+        except Exception as e:
+            logger.warning("Direct search failed (%s), asking the search planner", e)
+            direct_results = []
+        if len(direct_results) >= self.hybrid_min_results:
+            return direct_results
+        planner_results = await self._aplanner_search(topic, llm_with_tools)
+        return self._merge_tool_results([direct_results, planner_results])
+    
+    async def _aplanner_search(self, topic: str, llm_with_tools: "ChatOpenAI") -> List[dict]:
+        """Async variant of _planner_search using ainvoke"""
+        response = await ainvoke_llm(llm_with_tools, [human_message(self._search_prompt(topic))], "search_planner")
         
-        human_message = HumanMessage(content=f"""
+        if hasattr(response, 'tool_calls') and response.tool_calls:
+            notify("OpenAI successfully called Tavily search tool...")
+            search_results = await self._arun_tool_calls(response.tool_calls)
+        else:
+            search_results = await ainvoke_tool(self.search_tool, {"query": self._direct_query(topic)})
+        
+        return search_results
+    
+    async def _arun_tool_calls(self, tool_calls: List[dict]) -> List[dict]:
+        """Async variant of _run_tool_calls using asyncio.gather"""
+        calls = [call for call in tool_calls if call['name'] == TAVILY_TOOL_NAME]
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(ainvoke_tool(self.search_tool, call['args']), self.tool_call_timeout) for call in calls),
+            return_exceptions=True
+        )
+        return self._merge_tool_results(list(outcomes))
+
+SUMMARY_SYSTEM_PROMPT = """You are a medical education specialist creating patient education materials. 
+        Your goal is to make complex medical information accessible to patients while maintaining complete accuracy. 
+        Use ONLY the provided search results - do not add information from your training data."""
+
+SUMMARY_HUMAN_TEMPLATE = """
         Create a comprehensive patient education summary about "{topic}" using ONLY 
         the provided search results. Do not use any other knowledge sources.
         
@@ -87,8 +344,143 @@ class MedicalSummarizationService:
         Search Results from Trusted Medical Sources:
         {search_content}
         
-        Sources used: {', '.join(sources)}
-        """)
+        Sources used: {sources}
+        """
+
+# Changes to either prompt change this hash, which keys and tags stored summaries
+SUMMARY_TEMPLATE_HASH = hashlib.sha256(
+    (SUMMARY_SYSTEM_PROMPT + SUMMARY_HUMAN_TEMPLATE).encode("utf-8")
+).hexdigest()[:16]
+
+class MedicalSummarizationService:
+    """Handles summarization of medical search results"""
+    
+    # Trims and ranks search content before it reaches the prompt (see context.py)
+    packer = ContextPacker()
+    # Sessions summarizing identical results at the same time share one LLM call
+    flight = SingleFlight("summary")
+    
+    @staticmethod
+    def create_patient_summary(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                               store: Optional[SummaryStore] = None) -> str:
+        """Create patient-friendly summary from search results"""
+        summary, _ = MedicalSummarizationService.create_patient_summary_cached(
+            llm, topic, search_results, store
+        )
+        return summary
+    
+    @staticmethod
+    def store_key(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                   store: Optional[SummaryStore]) -> Optional[str]:
+        """Summary store key for these inputs, or None without a store"""
+        if store is None:
+            return None
+        return store.key(topic, search_results,
+                         ROUTER.model_for("summarize", llm), getattr(llm, 'temperature', None),
+                         MedicalSummarizationService.packer.params())
+    
+    @staticmethod
+    def flight_key(llm: "ChatOpenAI", topic: str, search_results: List[dict]) -> str:
+        """Identity of a summary request, for coalescing identical in-flight calls"""
+        bundle = [(result.get('url'), result.get('content')) for result in search_results]
+        return make_cache_key("summary", topic, bundle, SUMMARY_TEMPLATE_HASH,
+                              ROUTER.model_for("summarize", llm), getattr(llm, 'temperature', None),
+                              MedicalSummarizationService.packer.params())
+    
+    @staticmethod
+    def create_patient_summary_cached(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                                      store: Optional[SummaryStore] = None,
+                                      on_token: Optional[TokenCallback] = None,
+                                      key_topic: Optional[str] = None) -> Tuple[str, bool]:
+        """Create a summary, reusing a stored one for identical inputs; returns (summary, cached)
+        
+        Freshly generated summaries are streamed to on_token as they arrive; stored
+        summaries, and summaries shared with an identical request already in flight,
+        are returned whole. The prompt is built from key_topic (the canonical topic, if
+        different), which also keys the store and the shared call, so a stored summary
+        never names the first patient's wording.
+        """
+        key_topic = key_topic or topic
+        key = MedicalSummarizationService.store_key(llm, key_topic, search_results, store)
+        if key is not None:
+            cached = store.get(key)
+            if cached is not None:
+                return cached, True
+        
+        try:
+            summary = MedicalSummarizationService.flight.do(
+                MedicalSummarizationService.flight_key(llm, key_topic, search_results),
+                MedicalSummarizationService._summarize_and_store, llm, key_topic, search_results, store, key, on_token
+            )
+        except Exception as e:
+            return MedicalSummarizationService._fallback_summary(store, key, e), True
+        return summary, False
+    
+    @staticmethod
+    def _fallback_summary(store: Optional[SummaryStore], key: Optional[str], error: Exception) -> str:
+        """An expired stored summary of the same inputs for a failed call; re-raises without one"""
+        fallback = store.get_stale(key) if key is not None else None
+        if fallback is None:
+            raise error
+        notify(f"Summarizer is unavailable ({str(error)}); using a saved summary of these sources...")
+        return fallback
+    
+    @staticmethod
+    def _summarize_and_store(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                             store: Optional[SummaryStore], key: Optional[str],
+                             on_token: Optional[TokenCallback]) -> str:
+        summary = complete(llm, MedicalSummarizationService.build_messages(topic, search_results), "summarize", on_token)
+        if key is not None and summary:
+            store.set(key, summary)
+        return summary
+    
+    @staticmethod
+    async def _asummarize_and_store(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                                    store: Optional[SummaryStore], key: Optional[str],
+                                    on_token: Optional[TokenCallback]) -> str:
+        summary = await acomplete(llm, MedicalSummarizationService.build_messages(topic, search_results), "summarize", on_token)
+        if key is not None and summary:
+            store.set(key, summary)
+        return summary
+    
+    @staticmethod
+    async def acreate_patient_summary_cached(llm: "ChatOpenAI", topic: str, search_results: List[dict],
+                                             store: Optional[SummaryStore] = None,
+                                             on_token: Optional[TokenCallback] = None,
+                                             key_topic: Optional[str] = None) -> Tuple[str, bool]:
+        """Async variant of create_patient_summary_cached"""
+        key_topic = key_topic or topic
+        key = MedicalSummarizationService.store_key(llm, key_topic, search_results, store)
+        if key is not None:
+            cached = store.get(key)
+            if cached is not None:
+                return cached, True
+        
+        try:
+            summary = await MedicalSummarizationService.flight.ado(
+                MedicalSummarizationService.flight_key(llm, key_topic, search_results),
+                MedicalSummarizationService._asummarize_and_store, llm, key_topic, search_results, store, key, on_token
+            )
+        except Exception as e:
+            return MedicalSummarizationService._fallback_summary(store, key, e), True
+        return summary, False
+    
+    @staticmethod
+    def build_messages(topic: str, search_results: List[dict]) -> list:
+        """Build the summarization prompt from the packed search results"""
+        search_content = ""
+        sources = []
+        for result in MedicalSummarizationService.packer.pack(topic, search_results):
+            url = result.get('url', 'Unknown source')
+            sources.append(url)
+            search_content += f"Source: {url}\n"
+            search_content += f"Content: {result.get('content', '')}\n\n"
         
-        response = llm.invoke([system_message, human_message])
-        return response.content
\ No newline at end of file
+        return [
+            system_message(SUMMARY_SYSTEM_PROMPT),
+            human_message(SUMMARY_HUMAN_TEMPLATE.format(
+                topic=topic,
+                search_content=search_content,
+                sources=', '.join(sources)
+            ))
+        ]
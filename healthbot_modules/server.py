@@ -0,0 +1,329 @@
+import asyncio
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+from .session_io import QueueIO, SessionClosed
+from .state import StateManager
+from .workflow import AsyncHealthBotWorkflow
+
+# Workers reach each other over loopback; only the shared port faces clients
+WORKER_HOST = "127.0.0.1"
+# Marks a request one worker forwarded to another, which must handle it itself
+FORWARDED_HEADER = "X-HealthBot-Worker"
+
+class ServerSession:
+    """One remote patient session: its IO queues and the task running it"""
+
+    __slots__ = ("session_id", "io", "task", "last_active", "busy")
+
+    def __init__(self, session_id: str, io: QueueIO, task: "asyncio.Task"):
+        self.session_id = session_id
+        self.io = io
+        self.task = task
+        self.last_active = time.monotonic()
+        # A request or socket is currently attached; such sessions are never evicted
+        self.busy = 0
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+class HealthBotServer:
+    """HTTP/WebSocket front end running many sessions through the async workflow
+
+    HTTP:
+        POST   /sessions                  start a session ({"session_id": ...} resumes a checkpoint)
+        POST   /sessions/{id}/input       send {"text": ...}; returns output up to the next prompt
+        GET    /sessions/{id}             session status
+        DELETE /sessions/{id}             end a session
+    WebSocket:
+        GET    /sessions/{id}/ws          output and prompts stream as JSON events as they are
+                                          written; each text frame from the client is one input line
+    Sessions idle for longer than idle_timeout seconds are evicted. Evicted and
+    deleted sessions are dropped from the checkpoint journal; sessions still
+    running when the server stops stay resumable.
+
+    When one of several worker processes (see workers.py), each session belongs
+    to the worker its id hashes to, which also listens on WORKER_HOST at
+    worker_ports[index]. Clients only ever use the shared port: a request (or
+    WebSocket) for another worker's session is proxied to its owner, so nothing
+    behind a proxy or load balancer needs to reach the worker ports.
+    """
+
+    def __init__(self, workflow: AsyncHealthBotWorkflow, max_sessions: int = 500,
+                 idle_timeout: float = 15 * 60, sweep_interval: float = 30.0,
+                 worker_index: int = 0, worker_ports: Optional[List[int]] = None):
+        self.workflow = workflow
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.worker_index = worker_index
+        self.worker_ports = worker_ports or []
+        self.sessions: Dict[str, ServerSession] = {}
+        self.evicted = 0
+        self.proxied = 0
+        self._sweeper: Optional["asyncio.Task"] = None
+        self._client: Optional[aiohttp.ClientSession] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._route_to_owner])
+        app.add_routes([
+            web.post("/sessions", self.handle_create),
+            web.get("/sessions/{session_id}", self.handle_status),
+            web.delete("/sessions/{session_id}", self.handle_delete),
+            web.post("/sessions/{session_id}/input", self.handle_input),
+            web.get("/sessions/{session_id}/ws", self.handle_websocket),
+        ])
+        app.on_startup.append(self._start_sweeper)
+        app.on_cleanup.append(self._shutdown)
+        return app
+
+    # Session ownership across worker processes
+
+    def owner(self, session_id: str) -> int:
+        """Index of the worker that runs a session"""
+        if len(self.worker_ports) < 2:
+            return self.worker_index
+        return zlib.crc32(session_id.encode("utf-8")) % len(self.worker_ports)
+
+    def _new_session_id(self) -> str:
+        # Drawn until this worker owns it, so the session stays where it was created
+        while True:
+            session_id = uuid.uuid4().hex
+            if self.owner(session_id) == self.worker_index:
+                return session_id
+
+    @web.middleware
+    async def _route_to_owner(self, request: web.Request, handler) -> web.StreamResponse:
+        session_id = request.match_info.get("session_id")
+        if session_id is None and request.method == "POST" and request.body_exists:
+            # Resuming a checkpoint names the session in the body (read once, cached for the handler)
+            try:
+                body = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest(text="Request body must be JSON")
+            session_id = body.get("session_id") if isinstance(body, dict) else None
+        owner = self.owner(session_id) if session_id else self.worker_index
+        if owner == self.worker_index:
+            return await handler(request)
+        if request.headers.get(FORWARDED_HEADER) is not None:
+            # Workers disagree about ownership (different worker counts); never forward twice
+            raise web.HTTPMisdirectedRequest(text="Session belongs to another worker")
+        self.proxied += 1
+        url = f"http://{WORKER_HOST}:{self.worker_ports[owner]}{request.rel_url}"
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return await self._proxy_websocket(request, url)
+        return await self._proxy_http(request, url)
+
+    async def _proxy_http(self, request: web.Request, url: str) -> web.Response:
+        headers = {FORWARDED_HEADER: str(self.worker_index)}
+        if request.content_type:
+            headers["Content-Type"] = request.content_type
+        try:
+            async with self._client.request(request.method, url, data=await request.read(),
+                                            headers=headers) as upstream:
+                return web.Response(status=upstream.status, body=await upstream.read(),
+                                    content_type=upstream.content_type, charset=upstream.charset)
+        except aiohttp.ClientError as e:
+            raise web.HTTPBadGateway(text=f"Session worker is unavailable: {str(e)}")
+
+    async def _proxy_websocket(self, request: web.Request, url: str) -> web.StreamResponse:
+        try:
+            upstream = await self._client.ws_connect(url, headers={FORWARDED_HEADER: str(self.worker_index)})
+        except aiohttp.WSServerHandshakeError as e:
+            # The owner refused the upgrade (e.g. an unknown session): pass its status on
+            return web.Response(status=e.status, text=e.message)
+        except aiohttp.ClientError as e:
+            raise web.HTTPBadGateway(text=f"Session worker is unavailable: {str(e)}")
+
+        ws = web.WebSocketResponse()
+        async with upstream:
+            await ws.prepare(request)
+
+            async def relay(source, target):
+                async for message in source:
+                    if message.type == WSMsgType.TEXT:
+                        await target.send_str(message.data)
+                    elif message.type == WSMsgType.BINARY:
+                        await target.send_bytes(message.data)
+                    else:
+                        return
+
+            relays = [asyncio.ensure_future(relay(ws, upstream)), asyncio.ensure_future(relay(upstream, ws))]
+            try:
+                # Either side closing ends the pair
+                await asyncio.wait(relays, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in relays:
+                    task.cancel()
+                await ws.close()
+        return ws
+
+    # Session lifecycle
+
+    def start_session(self, session_id: Optional[str] = None) -> ServerSession:
+        state = None
+        if session_id and self.workflow.checkpointer is not None:
+            state = self.workflow.checkpointer.resume(session_id)
+        if state is None:
+            state = StateManager.create_initial_state(session_id or self._new_session_id())
+
+        io = QueueIO()
+        task = asyncio.ensure_future(self._run(io, state))
+        session = ServerSession(state["session_id"], io, task)
+        self.sessions[session.session_id] = session
+        return session
+
+    async def _run(self, io: QueueIO, state):
+        try:
+            await self.workflow.execute_session(io, state)
+            io.finish("ended")
+        except SessionClosed:
+            io.finish("closed")
+        except asyncio.CancelledError:
+            io.finish("closed")
+            raise
+        except Exception as e:
+            io.write(f"\nAn unexpected error occurred: {str(e)}")
+            io.finish("error")
+        finally:
+            self.sessions.pop(state["session_id"], None)
+
+    async def end_session(self, session: ServerSession, discard: bool = False):
+        """Stop a session's task; with discard, its checkpoint goes too, so it cannot be resumed"""
+        session.io.close()
+        session.task.cancel()
+        try:
+            await session.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if discard and self.workflow.checkpointer is not None:
+            self.workflow.checkpointer.discard(session.session_id)
+
+    async def evict_idle(self) -> int:
+        """End sessions nobody has touched for idle_timeout seconds"""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [session for session in self.sessions.values()
+                if not session.busy and session.last_active < cutoff]
+        for session in idle:
+            await self.end_session(session, discard=True)
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.evict_idle()
+
+    async def _start_sweeper(self, app: web.Application):
+        self._sweeper = asyncio.ensure_future(self._sweep())
+        if len(self.worker_ports) > 1:
+            # Forwarded calls wait as long as the owner takes to reach its next prompt
+            self._client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5))
+
+    async def _shutdown(self, app: web.Application):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._client is not None:
+            await self._client.close()
+        for session in list(self.sessions.values()):
+            await self.end_session(session)
+
+    @staticmethod
+    async def _drain_until_prompt(io: QueueIO) -> Dict[str, Any]:
+        """Collect output events up to the next prompt or the end of the session"""
+        output: List[str] = []
+        while True:
+            event = await io.outbound.get()
+            if event["type"] == "output":
+                output.append(event["text"])
+            else:
+                return {"output": "".join(output), event["type"]: event["text"]}
+
+    def _lookup(self, request: web.Request) -> ServerSession:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text="Unknown or expired session")
+        return session
+
+    # HTTP handlers
+
+    async def handle_create(self, request: web.Request) -> web.Response:
+        body = await request.json() if request.body_exists else {}
+        session_id = body.get("session_id")
+        if session_id in self.sessions:
+            raise web.HTTPConflict(text="Session is already active")
+        if len(self.sessions) >= self.max_sessions:
+            raise web.HTTPServiceUnavailable(text="Too many active sessions")
+
+        session = self.start_session(session_id)
+        session.busy += 1
+        try:
+            reply = await self._drain_until_prompt(session.io)
+        finally:
+            session.busy -= 1
+            session.touch()
+        return web.json_response({"session_id": session.session_id, **reply})
+
+    async def handle_input(self, request: web.Request) -> web.Response:
+        session = self._lookup(request)
+        body = await request.json()
+        session.busy += 1
+        try:
+            session.io.send(str(body.get("text", "")))
+            reply = await self._drain_until_prompt(session.io)
+        finally:
+            session.busy -= 1
+            session.touch()
+        return web.json_response({"session_id": session.session_id, **reply})
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        session = self._lookup(request)
+        return web.json_response({
+            "session_id": session.session_id,
+            "idle_seconds": time.monotonic() - session.last_active,
+            "attached": bool(session.busy),
+        })
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        await self.end_session(self._lookup(request), discard=True)
+        return web.json_response({"ended": True})
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        session = self._lookup(request)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session.busy += 1
+
+        async def pump():
+            # Forward every event as it is written so streamed tokens arrive live
+            while True:
+                event = await session.io.outbound.get()
+                await ws.send_json(event)
+                if event["type"] == "end":
+                    await ws.close()
+                    return
+
+        pump_task = asyncio.ensure_future(pump())
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.TEXT:
+                    session.touch()
+                    session.io.send(message.data)
+                elif message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            pump_task.cancel()
+            session.busy -= 1
+            session.touch()
+        return ws
+
+def run_server(host: str = "127.0.0.1", port: int = 8080, **kwargs):
+    """Serve HealthBot sessions over HTTP/WebSocket until interrupted"""
+    server = HealthBotServer(AsyncHealthBotWorkflow(), **kwargs)
+    server.workflow.warm_clients()
+    web.run_app(server.create_app(), host=host, port=port)
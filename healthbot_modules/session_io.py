@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+class SessionIO:
+    """How a session talks to its patient: the nodes write text and read answers through this
+
+    write() mirrors print(); read() is used by the sync nodes and aread() by the async ones.
+    """
+
+    def write(self, text: str = "", end: str = "\n"):
+        raise NotImplementedError
+
+    def read(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def aread(self, prompt: str) -> str:
+        raise NotImplementedError
+
+class ConsoleIO(SessionIO):
+    """The interactive terminal: print() and input()"""
+
+    def write(self, text: str = "", end: str = "\n"):
+        print(text, end=end, flush=True)
+
+    def read(self, prompt: str) -> str:
+        return input(prompt)
+
+    async def aread(self, prompt: str) -> str:
+        # input() blocks, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, input, prompt)
+
+CONSOLE = ConsoleIO()
+
+_session_io: contextvars.ContextVar = contextvars.ContextVar("healthbot_session_io", default=None)
+
+@contextmanager
+def session_notices(io: SessionIO):
+    """Send the services' notices (see notify) raised in the enclosed code, in this context, to io"""
+    token = _session_io.set(io)
+    try:
+        yield
+    finally:
+        _session_io.reset(token)
+
+def notify(text: str):
+    """Tell the patient of the session running in this context something the services did
+
+    For patient-facing notices, such as saved results being served while search is
+    down; operator diagnostics go to logging instead. Outside a session (e.g.
+    pre-warming) notices go to the console.
+    """
+    (_session_io.get() or CONSOLE).write(text)
+
+class SessionClosed(Exception):
+    """Raised inside a session whose remote side has gone away"""
+
+class QueueIO(SessionIO):
+    """Event-loop IO for remote sessions
+
+    Everything the nodes write becomes an {"type": "output"} event on `outbound`;
+    a read emits a {"type": "prompt"} event and waits for the next line put on
+    `inbound`. The async nodes only; there is no blocking read().
+    """
+
+    def __init__(self):
+        self.outbound: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.inbound: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    def write(self, text: str = "", end: str = "\n"):
+        self.outbound.put_nowait({"type": "output", "text": text + end})
+
+    def read(self, prompt: str) -> str:
+        raise RuntimeError("QueueIO only serves the async nodes")
+
+    async def aread(self, prompt: str) -> str:
+        self.outbound.put_nowait({"type": "prompt", "text": prompt})
+        line = await self.inbound.get()
+        if line is None:
+            raise SessionClosed()
+        return line
+
+    def send(self, line: str):
+        """Deliver one line of patient input"""
+        self.inbound.put_nowait(line)
+
+    def close(self):
+        """Wake a pending read so the session can finish"""
+        self.inbound.put_nowait(None)
+
+    def finish(self, reason: str = "ended"):
+        self.outbound.put_nowait({"type": "end", "text": reason})
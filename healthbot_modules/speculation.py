@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from .admission import SPECULATIVE, admission_priority
+
+class QuizSpeculator:
+    """Runs quiz generation in the background while the patient reads the summary
+
+    At most one speculation is pending per session. Each one is tagged with a hash
+    of the summary it was started for, so a result is only ever handed back for the
+    exact summary the session is presenting.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz-speculation")
+        self._pending: Dict[str, Tuple[str, Union[Future, "asyncio.Task"]]] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "started": 0,     # speculations launched
+            "ready": 0,       # finished before the quiz node asked for them
+            "waited": 0,      # still running when the quiz node asked, so it waited for them
+            "failed": 0,      # raised; the quiz node generated the quiz itself
+            "cancelled": 0,   # session ended or moved on before collecting
+            "missed": 0,      # quiz node found no matching speculation
+        }
+        self._wait_seconds = 0.0
+
+    @staticmethod
+    def token(summary: str) -> str:
+        return hashlib.sha256(summary.encode("utf-8")).hexdigest()[:16]
+
+    def _count(self, name: str, wait_seconds: float = 0.0):
+        with self._lock:
+            self._counters[name] += 1
+            self._wait_seconds += wait_seconds
+
+    def _register(self, session_id: str, summary: str, work: Union[Future, "asyncio.Task"]):
+        self.cancel(session_id)
+        with self._lock:
+            self._pending[session_id] = (self.token(summary), work)
+            self._counters["started"] += 1
+
+    def _take(self, session_id: str, summary: str) -> Optional[Union[Future, "asyncio.Task"]]:
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is None:
+            self._count("missed")
+            return None
+        token, work = entry
+        if token != self.token(summary):
+            work.cancel()
+            self._count("cancelled")
+            self._count("missed")
+            return None
+        return work
+
+    @staticmethod
+    def _speculative(fn: Callable[..., Any], *args) -> Any:
+        with admission_priority(SPECULATIVE):
+            return fn(*args)
+
+    @staticmethod
+    async def _aspeculative(coro: Awaitable[Any]) -> Any:
+        with admission_priority(SPECULATIVE):
+            return await coro
+
+    def start(self, session_id: str, summary: str, fn: Callable[..., Any], *args):
+        """Start fn(*args) on the speculation thread pool for this session
+
+        Speculative upstream calls queue behind those of patients who are waiting.
+        """
+        self._register(session_id, summary, self._executor.submit(self._speculative, fn, *args))
+
+    def astart(self, session_id: str, summary: str, coro: Awaitable[Any]):
+        """Start a coroutine as a background task on the running event loop"""
+        self._register(session_id, summary, asyncio.ensure_future(self._aspeculative(coro)))
+
+    def collect(self, session_id: str, summary: str) -> Optional[Any]:
+        """Wait for this session's speculation; None means the caller must generate the quiz"""
+        work = self._take(session_id, summary)
+        if work is None:
+            return None
+
+        was_ready = work.done()
+        started = time.perf_counter()
+        try:
+            result = work.result()
+        except Exception:
+            self._count("failed")
+            return None
+        self._count("ready" if was_ready else "waited", time.perf_counter() - started)
+        return result
+
+    async def acollect(self, session_id: str, summary: str) -> Optional[Any]:
+        """Async variant of collect for speculations started with astart"""
+        work = self._take(session_id, summary)
+        if work is None:
+            return None
+
+        was_ready = work.done()
+        started = time.perf_counter()
+        try:
+            result = await work
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._count("failed")
+            return None
+        self._count("ready" if was_ready else "waited", time.perf_counter() - started)
+        return result
+
+    def cancel(self, session_id: str):
+        """Cancel any pending speculation for the session
+
+        Async tasks are cancelled outright. A thread that is already running its
+        LLM call cannot be interrupted, so its result is simply discarded.
+        """
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is not None:
+            entry[1].cancel()
+            self._count("cancelled")
+
+    def shutdown(self):
+        """Cancel every pending speculation and stop the thread pool"""
+        with self._lock:
+            session_ids = list(self._pending)
+        for session_id in session_ids:
+            self.cancel(session_id)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return speculation counters, the payoff rate and the average wait"""
+        with self._lock:
+            stats = dict(self._counters)
+            wait_seconds = self._wait_seconds
+        collected = stats["ready"] + stats["waited"]
+        stats["payoff_rate"] = stats["ready"] / stats["started"] if stats["started"] else 0.0
+        stats["avg_wait_seconds"] = wait_seconds / collected if collected else 0.0
+        return stats
@@ -1,13 +1,117 @@
-from typing import TypedDict, List, Optional, Literal
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, TypedDict, List, Optional, Literal
+
+logger = logging.getLogger(__name__)
+
+class Event:
+    """One entry in a session's event log, readable like the old message dicts"""
+    
+    __slots__ = ("type", "content", "extra")
+    
+    def __init__(self, msg_type: str, content: str, extra: tuple = ()):
+        self.type = msg_type
+        self.content = content
+        # (key, value) pairs; values such as summaries are held by reference, never copied
+        self.extra = extra
+    
+    def __getitem__(self, key: str) -> Any:
+        if key == "type":
+            return self.type
+        if key == "content":
+            return self.content
+        for extra_key, value in self.extra:
+            if extra_key == key:
+                return value
+        raise KeyError(key)
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def to_dict(self) -> dict:
+        message = {"type": self.type, "content": self.content}
+        message.update(self.extra)
+        return message
+
+class EventLog:
+    """Append-only message log with an optional size cap
+    
+    When max_events is set the oldest events roll off as new ones arrive;
+    `dropped` counts how many have gone.
+    """
+    
+    __slots__ = ("_events", "dropped")
+    
+    def __init__(self, max_events: Optional[int] = None):
+        self._events = deque(maxlen=max_events)
+        self.dropped = 0
+    
+    def append(self, msg_type: str, content: str, extra: dict):
+        if self._events.maxlen is not None and len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        pairs = tuple((sys.intern(key), value) for key, value in extra.items())
+        self._events.append(Event(sys.intern(msg_type), content, pairs))
+    
+    @property
+    def total(self) -> int:
+        """Events ever appended, including those that rolled off"""
+        return len(self._events) + self.dropped
+    
+    def __len__(self) -> int:
+        return len(self._events)
+    
+    def __iter__(self) -> Iterator[Event]:
+        return iter(self._events)
+    
+    def __reversed__(self) -> Iterator[Event]:
+        return reversed(self._events)
+    
+    def __getitem__(self, index: int) -> Event:
+        return self._events[index]
+    
+    def to_dicts(self) -> List[dict]:
+        return [event.to_dict() for event in self._events]
+    
+    def since(self, total: int) -> List[dict]:
+        """Events appended after the log held `total` events (as far as they are retained)"""
+        new_count = min(self.total - total, len(self._events))
+        if new_count <= 0:
+            return []
+        return [self._events[index].to_dict() for index in range(len(self._events) - new_count, len(self._events))]
+    
+    @staticmethod
+    def from_dicts(messages: List[dict], max_events: Optional[int] = None) -> "EventLog":
+        log = EventLog(max_events)
+        for message in messages:
+            extra = {key: value for key, value in message.items() if key not in ("type", "content")}
+            log.append(message["type"], message["content"], extra)
+        return log
 
 class HealthBotState(TypedDict):
     """LangGraph-style state object for HealthBot workflow"""
-    messages: List[dict]
+    session_id: str
+    messages: EventLog
+    # The topic in the patient's words, and the canonical topic that keys caches and shared calls
     current_topic: Optional[str]
+    topic_key: Optional[str]
     search_results: Optional[List[dict]]
     summary: Optional[str]
     quiz_question: Optional[str]
     correct_answer: Optional[str]
+    quiz_bundle: Optional[dict]
+    # Compact question rows generated from the summary in one call, and the indexes already asked
+    quiz_pool: Optional[List[list]]
+    quiz_asked: Optional[List[int]]
     patient_answer: Optional[str]
     quiz_feedback: Optional[str]
     should_continue: Optional[bool]
@@ -19,16 +123,24 @@ class HealthBotState(TypedDict):
 class StateManager:
     """Manages workflow state creation and transitions"""
     
+    # Cap on events kept per session; older events roll off (None keeps everything)
+    MAX_MESSAGES: Optional[int] = 500
+    
     @staticmethod
-    def create_initial_state() -> HealthBotState:
+    def create_initial_state(session_id: Optional[str] = None) -> HealthBotState:
         """Create initial state for the workflow"""
         return HealthBotState(
-            messages=[],
+            session_id=session_id or uuid.uuid4().hex,
+            messages=EventLog(StateManager.MAX_MESSAGES),
             current_topic=None,
+            topic_key=None,
             search_results=None,
             summary=None,
             quiz_question=None,
             correct_answer=None,
+            quiz_bundle=None,
+            quiz_pool=None,
+            quiz_asked=None,
             patient_answer=None,
             quiz_feedback=None,
             should_continue=True,
@@ -36,24 +148,190 @@ class StateManager:
         )
     
     @staticmethod
-    def reset_state_for_new_topic() -> HealthBotState:
-        """Reset state for new topic while maintaining workflow structure"""
-        return StateManager.create_initial_state()
+    def reset_state_for_new_topic(session_id: Optional[str] = None) -> HealthBotState:
+        """Reset state for new topic while maintaining workflow structure (and session identity)"""
+        return StateManager.create_initial_state(session_id)
     
     @staticmethod
     def update_state(state: HealthBotState, **kwargs) -> HealthBotState:
-        """Update state with new values"""
-        new_state = state.copy()
+        """Update state with new values in place (each session owns its state)"""
         for key, value in kwargs.items():
-            if key in new_state:
-                new_state[key] = value
-        return new_state
+            if key in state:
+                state[key] = value
+        return state
     
     @staticmethod
     def add_message(state: HealthBotState, msg_type: str, content: str, **extra_data) -> HealthBotState:
-        """Add a message to the state"""
-        new_state = state.copy()
-        message = {"type": msg_type, "content": content}
-        message.update(extra_data)
-        new_state["messages"].append(message)
-        return new_state
\ No newline at end of file
+        """Append a message to the state's event log"""
+        state["messages"].append(msg_type, content, extra_data)
+        return state
+
+class StateCheckpointer:
+    """Journals HealthBotState changes so sessions survive a process restart
+    
+    After each node, save() appends one JSON line holding only the fields that
+    changed and the events added since the last save. A new state object for the
+    same session (a topic reset) is written as a full snapshot instead. Sessions
+    that end, or that the server evicts or deletes (discard()), get an end record
+    and are forgotten. Every `compact_every` records a background thread rewrites
+    the journal as one snapshot per live session, dropping ended ones, so saves
+    (which run on the event loop) never wait for it. resume() rebuilds a session
+    at its last workflow_step, so completed LLM and Tavily work is not repeated.
+    """
+    
+    def __init__(self, path: str, compact_every: int = 1000, fsync: bool = False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # session_id -> (state object, {field: value saved}, messages total saved)
+        self._saved: Dict[str, tuple] = {}
+        self._records_since_compaction = 0
+        self._compactor: Optional[threading.Thread] = None
+        self.compactions = 0
+        self._file = open(path, "a", encoding="utf-8")
+    
+    @staticmethod
+    def _fields(state: HealthBotState) -> Dict[str, Any]:
+        return {key: value for key, value in state.items() if key != "messages"}
+    
+    def save(self, state: HealthBotState):
+        """Append the changes to this session's state since its last save"""
+        session_id = state["session_id"]
+        with self._lock:
+            saved = self._saved.get(session_id)
+            fields = self._fields(state)
+            if saved is None or saved[0] is not state:
+                record = {"s": session_id, "full": True, "d": fields, "m": state["messages"].to_dicts()}
+            else:
+                previous = saved[1]
+                changed = {key: value for key, value in fields.items()
+                           if previous.get(key) is not value and previous.get(key) != value}
+                new_messages = state["messages"].since(saved[2])
+                if not changed and not new_messages:
+                    return
+                record = {"s": session_id, "d": changed, "m": new_messages}
+            
+            if state["workflow_step"] == "end":
+                record = {"s": session_id, "end": True}
+                self._saved.pop(session_id, None)
+            else:
+                self._saved[session_id] = (state, fields, state["messages"].total)
+            self._append(record)
+    
+    def discard(self, session_id: str):
+        """Forget a session that will not be resumed (evicted, or deleted by its patient)"""
+        with self._lock:
+            self._saved.pop(session_id, None)
+            self._append({"s": session_id, "end": True})
+    
+    def post_node(self, record, state: HealthBotState):
+        """Graph post-node hook"""
+        self.save(state)
+    
+    # Callers hold self._lock
+    
+    def _append(self, record: dict):
+        self._write(record)
+        self._records_since_compaction += 1
+        if self._records_since_compaction >= self.compact_every and self._compactor is None:
+            self._records_since_compaction = 0
+            self._file.flush()
+            self._compactor = threading.Thread(target=self._compact, args=(self._file.tell(),),
+                                               name="healthbot-journal-compaction", daemon=True)
+            self._compactor.start()
+    
+    def _write(self, record: dict):
+        record["t"] = time.time()
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+    
+    def _compact(self, offset: int):
+        """Rewrite the journal up to offset as one full snapshot per live session
+        
+        Runs on its own thread; only copying over the records appended meanwhile and
+        swapping the files hold the lock.
+        """
+        temp_path = self.path + ".compact"
+        try:
+            with open(self.path, "rb") as f:
+                sessions = self._fold(f.read(offset).decode("utf-8").splitlines())
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for session_id, (fields, messages) in sessions.items():
+                    f.write(json.dumps({"s": session_id, "full": True, "d": fields, "m": messages,
+                                        "t": time.time()}, separators=(",", ":")) + "\n")
+            with self._lock:
+                self._file.flush()
+                with open(self.path, "rb") as source, open(temp_path, "ab") as target:
+                    source.seek(offset)
+                    shutil.copyfileobj(source, target)
+                self._file.close()
+                os.replace(temp_path, self.path)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self.compactions += 1
+        except OSError as e:
+            # The journal is still complete, just longer; the next compaction tries again
+            logger.warning("Could not compact the session journal: %s", e)
+        finally:
+            with self._lock:
+                self._compactor = None
+    
+    @staticmethod
+    def _fold(lines: Iterable[str]) -> Dict[str, tuple]:
+        """Fold journal lines into {session_id: (fields, messages)} for live sessions"""
+        sessions: Dict[str, tuple] = {}
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write
+                continue
+            session_id = record["s"]
+            if record.get("end"):
+                sessions.pop(session_id, None)
+            elif record.get("full") or session_id not in sessions:
+                sessions[session_id] = (dict(record["d"]), list(record["m"]))
+            else:
+                fields, messages = sessions[session_id]
+                fields.update(record["d"])
+                messages.extend(record["m"])
+        return sessions
+    
+    def _replay(self) -> Dict[str, tuple]:
+        """The live sessions in the whole journal"""
+        self._file.flush()
+        with open(self.path, encoding="utf-8") as f:
+            return self._fold(f)
+    
+    def sessions(self) -> List[str]:
+        """IDs of sessions that can be resumed"""
+        with self._lock:
+            return list(self._replay())
+    
+    def resume(self, session_id: str) -> Optional[HealthBotState]:
+        """Rebuild a session's state at its last saved workflow_step, or None if unknown"""
+        with self._lock:
+            entry = self._replay().get(session_id)
+        if entry is None:
+            return None
+        fields, messages = entry
+        state = StateManager.create_initial_state(session_id)
+        state.update(fields)
+        # What was streamed was shown by the process that streamed it; a resumed session
+        # is a new run, so its nodes must show the summary and question again
+        messages = [{key: value for key, value in message.items() if key != "streamed"}
+                    for message in messages]
+        state["messages"] = EventLog.from_dicts(messages, StateManager.MAX_MESSAGES)
+        return state
+    
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,78 @@
+from typing import Callable, Optional
+
+from .upstream import ainvoke_llm, astream_llm, invoke_llm, stream_llm
+
+TokenCallback = Callable[[str], None]
+
+def _collector(parts: list, on_token: TokenCallback) -> Callable:
+    def on_chunk(chunk):
+        if chunk.content:
+            parts.append(chunk.content)
+            on_token(chunk.content)
+    return on_chunk
+
+def complete(llm, messages: list, site: str, on_token: Optional[TokenCallback] = None) -> str:
+    """Run a chat completion, streaming tokens to on_token when it is given"""
+    if on_token is None:
+        return invoke_llm(llm, messages, site).content
+
+    parts = []
+    stream_llm(llm, messages, site, _collector(parts, on_token))
+    return "".join(parts)
+
+async def acomplete(llm, messages: list, site: str, on_token: Optional[TokenCallback] = None) -> str:
+    """Async variant of complete using ainvoke/astream"""
+    if on_token is None:
+        return (await ainvoke_llm(llm, messages, site)).content
+
+    parts = []
+    await astream_llm(llm, messages, site, _collector(parts, on_token))
+    return "".join(parts)
+
+class QuizStreamFilter:
+    """Forwards streamed quiz text line by line, never emitting the 'Correct Answer:' line
+
+    A partial line is held back only while it could still turn into the hidden
+    line; anything else is passed through as soon as it arrives.
+    """
+
+    HIDDEN_PREFIX = 'Correct Answer:'
+
+    def __init__(self, on_token: TokenCallback):
+        self.on_token = on_token
+        self._pending = ""
+        self._line_open = False   # the current line has already been partly emitted
+        self._hiding = False      # the current line is the hidden one
+
+    def feed(self, token: str):
+        for char in token:
+            if self._line_open:
+                self.on_token(char)
+                if char == '\n':
+                    self._line_open = False
+            elif self._hiding:
+                if char == '\n':
+                    self._hiding = False
+            else:
+                self._pending += char
+                self._check_pending()
+
+    def _check_pending(self):
+        if self._pending.startswith(self.HIDDEN_PREFIX):
+            self._hiding = not self._pending.endswith('\n')
+            self._pending = ""
+        elif self._pending.endswith('\n'):
+            self.on_token(self._pending)
+            self._pending = ""
+        elif not self.HIDDEN_PREFIX.startswith(self._pending):
+            self.on_token(self._pending)
+            self._pending = ""
+            self._line_open = True
+
+    def close(self):
+        """Flush a trailing partial line unless it is the hidden one"""
+        if self._pending and not self._pending.startswith(self.HIDDEN_PREFIX):
+            self.on_token(self._pending)
+        self._pending = ""
+        self._line_open = False
+        self._hiding = False
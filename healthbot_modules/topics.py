@@ -0,0 +1,188 @@
+import json
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# canonical topic -> other ways patients write it; extend with HEALTHBOT_TOPIC_SYNONYMS.
+# Only unambiguous names belong here: an alias that can mean another condition
+# (or another word, like "add") would show a patient the wrong information.
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "heart attack": ["myocardial infarction", "heart infarction"],
+    "high blood pressure": ["hypertension", "htn", "elevated blood pressure"],
+    "high cholesterol": ["hypercholesterolemia", "hyperlipidemia", "elevated cholesterol"],
+    "diabetes": ["diabetes mellitus", "sugar diabetes"],
+    "type 2 diabetes": ["type ii diabetes", "t2d", "adult onset diabetes"],
+    "type 1 diabetes": ["type i diabetes", "t1d", "juvenile diabetes"],
+    "stroke": ["cerebrovascular accident", "cva", "brain attack"],
+    "flu": ["influenza", "the flu", "grippe"],
+    "common cold": ["head cold"],
+    "covid-19": ["covid", "coronavirus", "sars-cov-2", "covid 19"],
+    "acid reflux": ["gerd", "gastroesophageal reflux disease", "reflux disease"],
+    "copd": ["chronic obstructive pulmonary disease", "emphysema and chronic bronchitis"],
+    "urinary tract infection": ["uti", "bladder infection"],
+    "chronic kidney disease": ["ckd", "chronic renal disease"],
+    "alzheimer's disease": ["alzheimers", "alzheimer disease", "alzheimer's"],
+    "adhd": ["attention deficit hyperactivity disorder", "attention deficit disorder"],
+    "ptsd": ["post-traumatic stress disorder", "post traumatic stress disorder"],
+    "depression": ["major depressive disorder", "clinical depression", "mdd"],
+    "anxiety": ["anxiety disorder", "generalized anxiety disorder", "gad"],
+    "underactive thyroid": ["hypothyroidism"],
+    "overactive thyroid": ["hyperthyroidism"],
+    "anemia": ["anaemia"],
+    "chickenpox": ["varicella", "chicken pox"],
+    "shingles": ["herpes zoster", "zoster"],
+    "irritable bowel syndrome": ["ibs"],
+    "hiv": ["human immunodeficiency virus"],
+    "osteoarthritis": ["degenerative joint disease", "wear and tear arthritis"],
+    "migraine": ["migraine headache", "migraine headaches"],
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9'+\-/ ]+")
+
+# Prefixes that turn a condition into a different (often opposite) one: words
+# differing only here are never typos of each other
+_MEANING_PREFIXES = ("hypo", "hyper", "tachy", "brady", "micro", "macro", "intra", "extra",
+                     "pre", "post", "sub", "supra", "anti", "poly", "oligo")
+# Numbers, including the roman numerals of "type ii diabetes", tell topics apart too
+_NUMBERS = re.compile(r"\b(?:\d+|i{1,3}|iv|v|vi{1,3})\b")
+
+def fold_topic(topic: str) -> str:
+    """Lowercase, drop stray punctuation and collapse spaces
+
+    Plurals are not folded: too many names end in "s" ("rickets", "Graves
+    disease"). Plurals of known topics are matched as misspellings instead.
+    """
+    text = _NON_WORD.sub(" ", topic.lower().replace("’", "'"))
+    return " ".join(text.split())
+
+def _markers(key: str) -> Tuple[Set[str], List[str]]:
+    """The meaning prefixes and the numbers in a folded key"""
+    prefixes = {prefix for word in key.split() for prefix in _MEANING_PREFIXES if word.startswith(prefix)}
+    return prefixes, _NUMBERS.findall(key)
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+def _within_edits(a: str, b: str, limit: int) -> bool:
+    """Whether the Levenshtein distance between a and b is at most limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+class TopicIndex:
+    """Maps what a patient typed to a canonical topic, before anything is keyed by it
+
+    Lookup is exact on the folded form (case and punctuation), then through the
+    synonym table, then fuzzy for misspellings: known keys sharing most of their
+    character trigrams (Dice coefficient of at least fuzzy_threshold) are candidates,
+    and the best one within one typing edit (two for long names) wins, so
+    "arthritis" stays distinct from "osteoarthritis". A candidate with different
+    meaning prefixes or numbers ("hypotension" and "hypertension", "type 3" and
+    "type 1 diabetes") is never a match. Only curated topics (the synonym table and
+    add_topics, e.g. the pre-warm list) are matched fuzzily; anything else is used
+    in its folded form, so one patient's typo never becomes the spelling everyone
+    else is corrected to.
+
+    Everything shared between sessions (searches, summaries and quizzes, their
+    caches and in-flight calls) is built and keyed from the canonical topic, so it
+    never carries one patient's wording; what the patient is shown keeps their own.
+    """
+
+    def __init__(self, synonyms: Optional[Dict[str, List[str]]] = None, fuzzy_threshold: float = 0.75,
+                 fuzzy_min_length: int = 5, fuzzy_candidates: int = 5):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_min_length = fuzzy_min_length
+        self.fuzzy_candidates = fuzzy_candidates
+        self._lock = threading.Lock()
+        self._canonical: Dict[str, str] = {}           # folded key -> canonical topic
+        self._trigrams: Dict[str, Set[str]] = {}       # folded key -> its trigrams
+        self._postings: Dict[str, List[str]] = defaultdict(list)  # trigram -> folded keys
+        self._counters = {"exact": 0, "synonym": 0, "fuzzy": 0, "new": 0}
+        self.add_synonyms(DEFAULT_SYNONYMS if synonyms is None else synonyms)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None, **kwargs) -> "TopicIndex":
+        """Default synonyms plus any from a JSON file of {canonical: [aliases]}"""
+        index = cls(**kwargs)
+        if path:
+            with open(path, encoding="utf-8") as f:
+                index.add_synonyms(json.load(f))
+        return index
+
+    def _add_key(self, key: str, canonical: str):
+        if key in self._canonical:
+            return
+        self._canonical[key] = canonical
+        grams = _trigrams(key)
+        self._trigrams[key] = grams
+        for gram in grams:
+            self._postings[gram].append(key)
+
+    def add_synonyms(self, synonyms: Dict[str, Iterable[str]]):
+        with self._lock:
+            for canonical, aliases in synonyms.items():
+                self._add_key(fold_topic(canonical), canonical)
+                for alias in aliases:
+                    self._add_key(fold_topic(alias), canonical)
+
+    def add_topics(self, topics: Iterable[str]):
+        """Known topics with no aliases, each its own canonical form"""
+        with self._lock:
+            for topic in topics:
+                key = fold_topic(topic)
+                if key:
+                    self._add_key(key, key)
+
+    def _fuzzy(self, key: str) -> Optional[str]:
+        grams = _trigrams(key)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] += 1
+        scored = []
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._trigrams[candidate]))
+            if score >= self.fuzzy_threshold:
+                scored.append((score, candidate))
+        # One edit is a typo (two in a long name); more is another topic
+        limit = 1 if len(key) < 12 else 2
+        markers = _markers(key)
+        for _, candidate in sorted(scored, reverse=True)[:self.fuzzy_candidates]:
+            if _markers(candidate) == markers and _within_edits(key, candidate, limit):
+                return candidate
+        return None
+
+    def resolve(self, topic: str) -> Tuple[str, str]:
+        """(canonical topic, how it was found: "exact", "synonym", "fuzzy" or "new")"""
+        key = fold_topic(topic)
+        if not key:
+            return key, "new"
+        with self._lock:
+            canonical = self._canonical.get(key)
+            if canonical is not None:
+                how = "exact" if fold_topic(canonical) == key else "synonym"
+            else:
+                match = self._fuzzy(key) if len(key) >= self.fuzzy_min_length else None
+                canonical, how = (self._canonical[match], "fuzzy") if match is not None else (key, "new")
+            self._counters[how] += 1
+            return canonical, how
+
+    def canonical(self, topic: str) -> str:
+        """The canonical topic for what was typed (or its folded form if it is new)"""
+        return self.resolve(topic)[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["keys"] = len(self._canonical)
+        return stats
@@ -0,0 +1,236 @@
+import contextvars
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from .admission import ADMISSION
+from .context import estimate_tokens
+from .metrics import record_upstream_call
+from .resilience import UPSTREAMS, BudgetExceeded
+from .routing import ROUTER, Route
+
+# Every OpenAI and Tavily call in the services goes through this module, so
+# cross-cutting concerns (timing, token accounting, per-site model routing,
+# admission against the API quotas, deadlines, hedging, retries and circuit
+# breaking; see routing.py, admission.py and resilience.py) live in one place.
+# `site` names the call site, e.g. "search_planner", "summarize", "quiz", "feedback".
+
+# Tokens reserved for a completion on top of the prompt, until the API reports usage
+COMPLETION_TOKENS_ESTIMATE = 500
+
+# A hedged duplicate would only take quota from requests already queued for it
+UPSTREAMS["llm"].hedge_allowed = ADMISSION["llm"].has_headroom
+UPSTREAMS["tavily"].hedge_allowed = ADMISSION["tavily"].has_headroom
+
+def response_usage(response: Any) -> Tuple[int, int, int]:
+    """(input, output, total) tokens reported on an LLM response or chunk, zeros when unknown"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return (usage.get("input_tokens", 0), usage.get("output_tokens", 0), usage.get("total_tokens", 0))
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or {}
+    return (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("total_tokens", 0))
+
+def response_tokens(response: Any) -> int:
+    """Total tokens reported on an LLM response or chunk, or 0 when unknown"""
+    return response_usage(response)[2]
+
+def request_tokens(messages: list) -> int:
+    """Tokens to reserve for a chat request before it is sent"""
+    return sum(estimate_tokens(str(getattr(message, "content", message))) for message in messages) \
+        + COMPLETION_TOKENS_ESTIMATE
+
+def _routed(llm, route: Optional[Route]):
+    return llm if route is None else route.bind(llm)
+
+def _answered(site: str, llm, route: Optional[Route], started: float, seconds: float,
+              reserved: int, usage: Tuple[int, int, int]):
+    """Account for an answered call; seconds is the request that answered, without backoff or losers"""
+    ADMISSION["llm"].settle(reserved, usage[2])
+    ROUTER.record(site, route, llm, seconds, usage)
+    record_upstream_call("llm", time.perf_counter() - started, usage[2])
+
+def _abandoned(site: str, llm, route: Optional[Route], attempt_started: float):
+    ROUTER.record(site, route, llm, time.perf_counter() - attempt_started, abandoned=True)
+
+class _RequestTimer:
+    """Times each request a call sends, keeping the duration of the one that answered"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args):
+            started = time.perf_counter()
+            result = fn(*args)
+            self.seconds = time.perf_counter() - started
+            return result
+        return timed
+
+    def awrap(self, coro_fn: Callable[..., Any]) -> Callable[..., Any]:
+        async def timed(*args):
+            started = time.perf_counter()
+            result = await coro_fn(*args)
+            self.seconds = time.perf_counter() - started
+            return result
+        return timed
+
+class _StreamUsage:
+    """Passes chunks on while summing the usage reported on them, and times the stream that delivered them"""
+
+    def __init__(self, on_chunk: Callable[[Any], None]):
+        self.on_chunk = on_chunk
+        self.usage = (0, 0, 0)
+        self.opened = time.perf_counter()
+
+    def open(self):
+        # A retried stream starts over
+        self.usage = (0, 0, 0)
+        self.opened = time.perf_counter()
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.opened
+
+    def deliver(self, chunk: Any):
+        self.usage = tuple(total + part for total, part in zip(self.usage, response_usage(chunk)))
+        self.on_chunk(chunk)
+
+# Each LLM call tries the attempts ROUTER.plan(site) lists: the site's model under
+# its latency budget, then (if that runs out) the faster fallback with no budget.
+# A call is admitted against the quota once, before its deadline, budget and
+# hedging clocks start; what it sends after that is charged without waiting.
+# Running out of budget on the last attempt raises rather than returning nothing.
+
+def invoke_llm(llm, messages: list, site: str) -> Any:
+    reserved = request_tokens(messages)
+    admitted = ADMISSION["llm"].admit(reserved)
+    started = time.perf_counter()
+    plan = ROUTER.plan(site)
+    for index, (route, budget) in enumerate(plan):
+        attempt_started = time.perf_counter()
+        timer = _RequestTimer()
+        try:
+            response = UPSTREAMS["llm"].call(
+                site, timer.wrap(admitted.wrap(_routed(llm, route).invoke)), messages, budget=budget)
+        except BudgetExceeded:
+            _abandoned(site, llm, route, attempt_started)
+            if index + 1 == len(plan):
+                raise
+            continue
+        _answered(site, llm, route, started, timer.seconds, reserved, response_usage(response))
+        return response
+
+async def ainvoke_llm(llm, messages: list, site: str) -> Any:
+    reserved = request_tokens(messages)
+    admitted = await ADMISSION["llm"].aadmit(reserved)
+    started = time.perf_counter()
+    plan = ROUTER.plan(site)
+    for index, (route, budget) in enumerate(plan):
+        attempt_started = time.perf_counter()
+        timer = _RequestTimer()
+        try:
+            response = await UPSTREAMS["llm"].acall(
+                site, timer.awrap(admitted.awrap(_routed(llm, route).ainvoke)), messages, budget=budget)
+        except BudgetExceeded:
+            _abandoned(site, llm, route, attempt_started)
+            if index + 1 == len(plan):
+                raise
+            continue
+        _answered(site, llm, route, started, timer.seconds, reserved, response_usage(response))
+        return response
+
+def stream_llm(llm, messages: list, site: str, on_chunk: Callable[[Any], None]):
+    """Stream a completion, passing each chunk to on_chunk"""
+    reserved = request_tokens(messages)
+    admitted = ADMISSION["llm"].admit(reserved)
+    started = time.perf_counter()
+    plan = ROUTER.plan(site)
+    for index, (route, budget) in enumerate(plan):
+        attempt_started = time.perf_counter()
+        counter = _StreamUsage(on_chunk)
+        client = _routed(llm, route)
+
+        def open_stream():
+            admitted.sent()
+            counter.open()
+            return client.stream(messages)
+
+        try:
+            UPSTREAMS["llm"].stream(site, open_stream, counter.deliver, budget=budget)
+        except BudgetExceeded:
+            _abandoned(site, llm, route, attempt_started)
+            if index + 1 == len(plan):
+                raise
+            continue
+        _answered(site, llm, route, started, counter.seconds, reserved, counter.usage)
+        return
+
+async def astream_llm(llm, messages: list, site: str, on_chunk: Callable[[Any], None]):
+    """Async variant of stream_llm"""
+    reserved = request_tokens(messages)
+    admitted = await ADMISSION["llm"].aadmit(reserved)
+    started = time.perf_counter()
+    plan = ROUTER.plan(site)
+    for index, (route, budget) in enumerate(plan):
+        attempt_started = time.perf_counter()
+        counter = _StreamUsage(on_chunk)
+        client = _routed(llm, route)
+
+        async def open_stream():
+            admitted.sent()
+            counter.open()
+            async for chunk in client.astream(messages):
+                yield chunk
+
+        try:
+            await UPSTREAMS["llm"].astream(site, open_stream, counter.deliver, budget=budget)
+        except BudgetExceeded:
+            _abandoned(site, llm, route, attempt_started)
+            if index + 1 == len(plan):
+                raise
+            continue
+        _answered(site, llm, route, started, counter.seconds, reserved, counter.usage)
+        return
+
+def batch_llm(llm, batch: List[list], site: str, max_concurrency: Optional[int] = None) -> list:
+    """Send many prompts as one batch; failed prompts come back as exceptions in their place
+
+    The whole batch is admitted at once and sent to the site's routed model. It is
+    not retried, hedged or budgeted here, since callers deal with each failed
+    prompt themselves; each answer is recorded with the batch's wall time.
+    """
+    reserved = sum(request_tokens(messages) for messages in batch)
+    route = ROUTER.route(site)
+    ADMISSION["llm"].acquire(reserved, requests=len(batch))
+    started = time.perf_counter()
+    responses = _routed(llm, route).batch(batch, config={"max_concurrency": max_concurrency},
+                                          return_exceptions=True)
+    seconds = time.perf_counter() - started
+    tokens = 0
+    for response in responses:
+        if not isinstance(response, Exception):
+            usage = response_usage(response)
+            tokens += usage[2]
+            ROUTER.record(site, route, llm, seconds, usage)
+    ADMISSION["llm"].settle(reserved, tokens)
+    record_upstream_call("llm", seconds, tokens)
+    return responses
+
+def invoke_tool(tool, args: dict, site: str = "tavily") -> Any:
+    admitted = ADMISSION["tavily"].admit()
+    started = time.perf_counter()
+    results = UPSTREAMS["tavily"].call(site, admitted.wrap(tool.invoke), args)
+    record_upstream_call("tavily", time.perf_counter() - started)
+    return results
+
+async def ainvoke_tool(tool, args: dict, site: str = "tavily") -> Any:
+    admitted = await ADMISSION["tavily"].aadmit()
+    started = time.perf_counter()
+    results = await UPSTREAMS["tavily"].acall(site, admitted.awrap(tool.ainvoke), args)
+    record_upstream_call("tavily", time.perf_counter() - started)
+    return results
+
+def in_current_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap fn so it runs in a copy of the caller's context (for worker threads)"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
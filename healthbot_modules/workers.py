@@ -0,0 +1,162 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from .content_store import ContentStoreLocked, create_content_store
+from .search import SUMMARY_TEMPLATE_HASH
+from .server import WORKER_HOST, HealthBotServer
+from .workflow import AsyncHealthBotWorkflow
+
+async def _serve(server: HealthBotServer, sock: socket.socket, port: int):
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    try:
+        # Clients connect to the shared socket; other workers forward their requests for our sessions
+        await web.SockSite(runner, sock).start()
+        await web.TCPSite(runner, WORKER_HOST, port).start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except NotImplementedError:  # Windows
+                pass
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def _worker_main(index: int, ports: List[int], sock: socket.socket, options: Dict[str, Any]):
+    """Entry point of one worker process: its own workflow, clients and sessions"""
+    # A forked worker inherits the runner's handler
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        workflow = AsyncHealthBotWorkflow(worker=index)
+    except Exception as e:
+        print(f"Worker {index} failed to start: {str(e)}")
+        raise SystemExit(1)
+    server = HealthBotServer(workflow, worker_index=index, worker_ports=ports, **options)
+    workflow.warm_clients()
+    try:
+        asyncio.run(_serve(server, sock, ports[index]))
+    except KeyboardInterrupt:
+        pass
+
+class WorkerRunner:
+    """Serves HealthBot sessions from `workers` processes sharing one listening socket
+
+    Each worker runs its own AsyncHealthBotWorkflow, so prompt assembly, quiz
+    parsing and state handling use every core. New sessions are spread over the
+    workers by the kernel as it hands out connections. Each worker also listens on
+    loopback at port + 1 + its index, and a worker handed a request for another
+    worker's session proxies it (HTTP or WebSocket) there. All
+    workers read pre-warmed content from the one published content image, which
+    the runner refreshes at startup and then every publish_seconds whenever the
+    store holds entries the image lacks (unless a pre-warm run is writing it), so
+    long-running workers pick up content written since they started.
+
+    A worker that exits is restarted, unless it exits within min_uptime seconds
+    of starting, which stops the runner instead of restarting it in a loop.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, workers: Optional[int] = None,
+                 min_uptime: float = 10.0, publish_seconds: float = 30.0, **options):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.min_uptime = min_uptime
+        self.publish_seconds = publish_seconds
+        self.options = options
+        self.ports = [port + 1 + index for index in range(self.workers)]
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self._started: Dict[int, float] = {}
+        self._sock: Optional[socket.socket] = None
+        self._published = float("-inf")
+
+    def _publish_content(self, startup: bool = False):
+        """Publish the pre-warmed topics for the workers if the image lacks any of them"""
+        self._published = time.monotonic()
+        cache_dir = os.getenv('HEALTHBOT_CACHE_DIR', '.healthbot_cache')
+        if not cache_dir:
+            return
+        # Opened for each publish, so no SQLite connection is inherited by a worker forked later
+        store = create_content_store(cache_dir, SUMMARY_TEMPLATE_HASH)
+        if not store.unpublished():
+            return
+        try:
+            count = store.publish()
+        except ContentStoreLocked:
+            if startup:
+                print("A pre-warm run is writing the content store; workers will use its next image.")
+            return
+        finally:
+            store.release_writer()
+        print(f"Published {count} pre-warmed topics for the workers")
+
+    def _start(self, index: int):
+        process = multiprocessing.Process(target=_worker_main, name=f"healthbot-worker-{index}",
+                                          args=(index, self.ports, self._sock, self.options))
+        process.start()
+        self.processes[index] = process
+        self._started[index] = time.monotonic()
+
+    def _supervise(self):
+        while self.processes:
+            sentinels = {process.sentinel: index for index, process in self.processes.items()}
+            if time.monotonic() - self._published >= self.publish_seconds:
+                self._publish_content()
+            for sentinel in wait(list(sentinels), timeout=self.publish_seconds):
+                index = sentinels[sentinel]
+                process = self.processes.pop(index)
+                process.join()
+                if time.monotonic() - self._started[index] < self.min_uptime:
+                    raise RuntimeError(f"worker {index} exited during startup (exit code {process.exitcode})")
+                print(f"Worker {index} exited (exit code {process.exitcode}); restarting it")
+                self._start(index)
+
+    def _stop(self, timeout: float = 10.0):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.processes.clear()
+
+    def run(self):
+        """Start the workers and keep them running until interrupted"""
+        load_dotenv('config.env')
+        self._publish_content(startup=True)
+        self._sock = socket.create_server((self.host, self.port), backlog=1024)
+        # Stopping the runner stops its workers rather than orphaning them
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            for index in range(self.workers):
+                self._start(index)
+            print(f"Serving HealthBot on http://{self.host}:{self.port} with {self.workers} workers "
+                  f"(worker ports {self.ports[0]}-{self.ports[-1]})")
+            self._supervise()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Ctrl-C also reached the workers; a second one must not cut their shutdown short
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            self._stop()
+            self._sock.close()
+
+def run_workers(host: str = "127.0.0.1", port: int = 8080, workers: Optional[int] = None, **kwargs):
+    """Serve HealthBot sessions over HTTP/WebSocket from several processes until interrupted"""
+    WorkerRunner(host, port, workers, **kwargs).run()
@@ -1,75 +1,360 @@
+import asyncio
 import os
+from typing import List, Optional
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
 
-from .state import StateManager
+from .state import HealthBotState, StateCheckpointer, StateManager
 from .nodes import HealthBotNodes
+from .session_io import CONSOLE, SessionIO, session_notices
+from .cache import create_search_cache, create_summary_store
+from .clients import CLIENTS, STARTUP, LazyClient, resolve_client
+from .speculation import QuizSpeculator
+from .content_store import create_content_store
+from .graph import NodeGraph
+from .metrics import WorkflowMetrics
+from .context import ContextPacker
+from .quiz import QuizService
+from .search import SUMMARY_TEMPLATE_HASH, MedicalSummarizationService
+from .topics import TopicIndex
+from .resilience import UPSTREAMS, ResiliencePolicy, resilience_stats
+from .admission import ADMISSION, admission_stats
+from .routing import ROUTER, load_routes
 
 class HealthBotWorkflow:
-    """Main workflow orchestrator for HealthBot"""
+    """Main workflow orchestrator for HealthBot
     
-    def __init__(self):
-        self._setup_environment()
-        self._initialize_llm_and_tools()
-        self.nodes = HealthBotNodes(self.llm, self.llm_with_tools)
+    `llm` and `search_tool` replace ChatOpenAI and TavilySearchResults (e.g. the
+    stand-ins in fakes.py); when both are given no API keys are needed.
+    """
     
-    def _setup_environment(self):
+    def __init__(self, llm=None, search_tool=None, worker: Optional[int] = None):
+        # Index of this process among the server's workers (see workers.py), if it is one
+        self.worker = worker
+        self._setup_environment(require_keys=llm is None or search_tool is None)
+        self._configure_resilience()
+        self._configure_admission()
+        self._configure_routing()
+        self._initialize_llm_and_tools(llm, search_tool)
+        self._initialize_caches()
+        self.speculator = None
+        if os.getenv('HEALTHBOT_SPECULATIVE_QUIZ', '1') == '1':
+            self.speculator = QuizSpeculator()
+        self.nodes = HealthBotNodes(self.llm, self.llm_with_tools,
+            search_cache=self.search_cache,
+            summary_store=self.summary_store,
+            speculator=self.speculator,
+            quiz_mode=os.getenv('HEALTHBOT_QUIZ_MODE', 'bundle'),
+            quiz_pool_size=int(os.getenv('HEALTHBOT_QUIZ_POOL_SIZE', '5')),
+            search_strategy=os.getenv('HEALTHBOT_SEARCH_STRATEGY', 'planner'),
+            stream=os.getenv('HEALTHBOT_STREAM', '1') == '1',
+            content_store=self.content_store,
+            search_tool=self.search_tool,
+            topic_index=self.topic_index
+        )
+        self.metrics = WorkflowMetrics()
+        self.graph = self._build_graph()
+        STARTUP.mark("workflow ready")
+    
+    def _setup_environment(self, require_keys: bool = True):
         """Load environment variables and validate API keys"""
         load_dotenv('config.env')
+        if not require_keys:
+            return
         
         assert os.getenv('OPENAI_API_KEY') is not None, "OPENAI_API_KEY not found in config.env"
         assert os.getenv('TAVILY_API_KEY') is not None, "TAVILY_API_KEY not found in config.env"
     
-    def _initialize_llm_and_tools(self):
-        """Initialize OpenAI LLM and bind Tavily tool"""
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.3)
+    def _initialize_llm_and_tools(self, llm=None, search_tool=None):
+        """Initialize OpenAI LLM and bind Tavily tool
         
-        search_tool = TavilySearchResults(
-            max_results=3,
-            search_depth="advanced",
-            include_domains=["mayoclinic.org", "webmd.com", "nih.gov", "cdc.gov", "healthline.com", "medlineplus.gov"]
-        )
+        The shared clients are only built (and langchain only imported) on first use;
+        warm_clients() gets that done while the patient is still typing. Each call
+        site's model and limits are applied per request by the routing table.
+        """
+        self.llm = llm or LazyClient(CLIENTS.llm)
+        self.search_tool = search_tool or LazyClient(CLIENTS.search_tool)
         
         # Bind Tavily tool to OpenAI for function calling
-        self.llm_with_tools = self.llm.bind_tools([search_tool])
+        self.llm_with_tools = LazyClient(
+            lambda: resolve_client(self.llm).bind_tools([resolve_client(self.search_tool)])
+        )
+    
+    def _configure_resilience(self):
+        """Deadlines, hedging, retries and circuit breaking for OpenAI and Tavily calls (see resilience.py)"""
+        enabled = os.getenv('HEALTHBOT_RESILIENCE', '1') == '1'
+        hedge_percentile = float(os.getenv('HEALTHBOT_HEDGE_PERCENTILE', 95))
+        UPSTREAMS["llm"].configure(ResiliencePolicy(
+            deadline=float(os.getenv('HEALTHBOT_LLM_DEADLINE', 60)),
+            hedge_percentile=hedge_percentile
+        ), enabled)
+        UPSTREAMS["tavily"].configure(ResiliencePolicy(
+            deadline=float(os.getenv('HEALTHBOT_TAVILY_DEADLINE', 20)),
+            hedge_percentile=hedge_percentile
+        ), enabled)
+    
+    def _configure_admission(self):
+        """Request and token quotas for OpenAI and Tavily, shared by every session (see admission.py)"""
+        max_queue = int(os.getenv('HEALTHBOT_ADMISSION_QUEUE', 1000))
+        max_wait = float(os.getenv('HEALTHBOT_ADMISSION_MAX_WAIT', 0)) or float("inf")
+        # Waiting for quota longer than the call itself may take is never worth it
+        ADMISSION["llm"].configure(
+            rpm=float(os.getenv('HEALTHBOT_OPENAI_RPM', 500)),
+            tpm=float(os.getenv('HEALTHBOT_OPENAI_TPM', 200000)),
+            max_queue=max_queue, max_wait=min(max_wait, UPSTREAMS["llm"].policy.deadline)
+        )
+        ADMISSION["tavily"].configure(
+            rpm=float(os.getenv('HEALTHBOT_TAVILY_RPM', 100)),
+            max_queue=max_queue, max_wait=min(max_wait, UPSTREAMS["tavily"].policy.deadline)
+        )
     
-    def execute_workflow(self):
+    def _configure_routing(self):
+        """Model, max_tokens and latency budget per OpenAI call site (see routing.py)"""
+        ROUTER.configure(
+            load_routes(os.getenv('HEALTHBOT_ROUTES') or None),
+            enabled=os.getenv('HEALTHBOT_ROUTING', '1') == '1',
+            log_path=os.getenv('HEALTHBOT_ROUTE_LOG') or None
+        )
+    
+    def warm_clients(self):
+        """Build the clients in the background so the first search does not pay for it"""
+        CLIENTS.warm_in_background(self.llm_with_tools.resolve)
+    
+    def _initialize_caches(self):
+        """Create the search cache and summary store (HEALTHBOT_CACHE_DIR="" keeps them in memory only)"""
+        self.cache_dir = os.getenv('HEALTHBOT_CACHE_DIR', '.healthbot_cache')
+        # Expired entries are kept this much longer to serve when OpenAI or Tavily is down
+        stale_seconds = float(os.getenv('HEALTHBOT_STALE_TTL', 7 * 24 * 3600))
+        self.search_cache = create_search_cache(
+            self.cache_dir,
+            ttl_seconds=float(os.getenv('HEALTHBOT_SEARCH_TTL', 24 * 3600)),
+            stale_seconds=stale_seconds
+        )
+        self.summary_store = create_summary_store(
+            SUMMARY_TEMPLATE_HASH,
+            self.cache_dir,
+            ttl_seconds=float(os.getenv('HEALTHBOT_SUMMARY_TTL', 7 * 24 * 3600)),
+            stale_seconds=stale_seconds
+        )
+        # Summaries written under an older prompt template can never be hit again
+        self.summary_store.invalidate()
+        
+        MedicalSummarizationService.packer = ContextPacker(
+            token_budget=int(os.getenv('HEALTHBOT_CONTEXT_TOKENS', 1200))
+        )
+        
+        # Pre-warmed topics (see prewarm.py) live alongside the caches
+        self.content_store = None
+        if self.cache_dir:
+            self.content_store = create_content_store(
+                self.cache_dir,
+                SUMMARY_TEMPLATE_HASH,
+                ttl_seconds=float(os.getenv('HEALTHBOT_CONTENT_TTL', 7 * 24 * 3600))
+            )
+        
+        # Synonyms, plural folding and spelling fixes, so equivalent topics share cache entries
+        self.topic_index = None
+        if os.getenv('HEALTHBOT_TOPIC_INDEX', '1') == '1':
+            self.topic_index = TopicIndex.from_file(os.getenv('HEALTHBOT_TOPIC_SYNONYMS') or None)
+            if self.content_store is not None:
+                # Misspellings of pre-warmed topics are corrected to them
+                self.topic_index.add_topics(self.content_store.fresh_topic_keys())
+        
+        # Session checkpoints hold patient answers, so they are opt-in
+        self.checkpointer = None
+        if self.cache_dir and os.getenv('HEALTHBOT_CHECKPOINT', '0') == '1':
+            # One journal per worker: each compacts its own, and always runs the same sessions
+            journal = ('healthbot_sessions.journal' if self.worker is None
+                       else f'healthbot_sessions.{self.worker}.journal')
+            self.checkpointer = StateCheckpointer(
+                os.path.join(self.cache_dir, journal),
+                compact_every=int(os.getenv('HEALTHBOT_CHECKPOINT_COMPACT_EVERY', 1000))
+            )
+    
+    def _build_graph(self) -> NodeGraph:
+        """Register every node with its allowed transitions (LangGraph-style edges)"""
+        graph = NodeGraph(entry="get_topic")
+        nodes = self.nodes
+        graph.register("get_topic", nodes.get_topic_node, {"get_topic", "search"}, nodes.aget_topic_node)
+        graph.register("search", nodes.search_node, {"summarize", "get_topic"}, nodes.asearch_node)
+        graph.register("summarize", nodes.summarize_node, {"present_info", "get_topic"}, nodes.asummarize_node)
+        graph.register("present_info", nodes.present_info_node, {"generate_quiz"}, nodes.apresent_info_node)
+        graph.register("generate_quiz", nodes.generate_quiz_node, {"present_quiz", "check_continue"},
+                       nodes.agenerate_quiz_node)
+        graph.register("present_quiz", nodes.present_quiz_node, {"grade_quiz"}, nodes.apresent_quiz_node)
+        graph.register("grade_quiz", nodes.grade_quiz_node, {"check_continue"}, nodes.agrade_quiz_node)
+        graph.register("check_continue", nodes.check_continue_node, {"get_topic", "check_continue", "present_quiz", "end"},
+                       nodes.acheck_continue_node)
+        graph.post_hooks.append(self.metrics.post_node)
+        if self.checkpointer is not None:
+            graph.post_hooks.append(self.checkpointer.post_node)
+        graph.validate()
+        return graph
+    
+    def _starting_state(self, resume_session_id: Optional[str] = None) -> HealthBotState:
+        """A fresh state, or a checkpointed session rebuilt at its last step"""
+        if resume_session_id:
+            if self.checkpointer is None:
+                print("Session checkpointing is disabled (set HEALTHBOT_CHECKPOINT=1); starting a new session.")
+            else:
+                state = self.checkpointer.resume(resume_session_id)
+                if state is not None:
+                    print(f"Resuming session {resume_session_id} at step '{state['workflow_step']}'.")
+                    return state
+                print(f"No saved session {resume_session_id}; starting a new session.")
+        
+        state = StateManager.create_initial_state()
+        if self.checkpointer is not None:
+            print(f"Session ID: {state['session_id']} (resume with --resume {state['session_id']})")
+        return state
+    
+    def execute_workflow(self, resume_session_id: Optional[str] = None):
         """Execute the complete LangGraph-style workflow with state management"""
         print("Initializing HealthBot LangGraph workflow...")
         
         # Initialize state
-        state = StateManager.create_initial_state()
+        state = self._starting_state(resume_session_id)
+        self.warm_clients()
+        STARTUP.mark("ready for input")
         
         try:
             # Main workflow loop with LangGraph-style node execution
             while state["should_continue"] and state["workflow_step"] != "end":
-                
-                # Node execution based on workflow step (LangGraph-style edges)
-                if state["workflow_step"] == "get_topic":
-                    state = self.nodes.get_topic_node(state)
-                    
-                elif state["workflow_step"] == "search":
-                    state = self.nodes.search_node(state)
-                    
-                elif state["workflow_step"] == "summarize":
-                    state = self.nodes.summarize_node(state)
-                    
-                elif state["workflow_step"] == "present_info":
-                    state = self.nodes.present_info_node(state)
-                    
-                elif state["workflow_step"] == "generate_quiz":
-                    state = self.nodes.generate_quiz_node(state)
-                    
-                elif state["workflow_step"] == "present_quiz":
-                    state = self.nodes.present_quiz_node(state)
-                    
-                elif state["workflow_step"] == "grade_quiz":
-                    state = self.nodes.grade_quiz_node(state)
-                    
-                elif state["workflow_step"] == "check_continue":
-                    state = self.nodes.check_continue_node(state)
+                state = self.graph.run_step(state, CONSOLE)
                     
+        except KeyboardInterrupt:
+            print("\n\nHealthBot session ended by user. Stay healthy!")
+        except Exception as e:
+            print(f"\nAn unexpected error occurred: {str(e)}")
+            print("Please check your API keys and try again.")
+        finally:
+            if self.speculator is not None:
+                self.speculator.cancel(state["session_id"])
+            print("\nThank you for using HealthBot!")
+            self._print_session_summary()
+    
+    def coalescing_stats(self) -> dict:
+        """Single-flight counters for the search, summary and quiz calls"""
+        return {
+            "search": self.nodes.search_service.flight.stats(),
+            "summary": MedicalSummarizationService.flight.stats(),
+            "quiz": QuizService.flight.stats(),
+        }
+    
+    def _print_session_summary(self):
+        print("\nSession Summary:")
+        for line in self.metrics.report():
+            print(line)
+        self._print_cache_stats()
+        self._print_routing_stats()
+        for line in STARTUP.report():
+            print(f"Startup: {line}")
+    
+    def _print_routing_stats(self):
+        stats = ROUTER.stats()
+        if not stats["calls"]:
+            return
+        print("Model routing (latency and cost per node):")
+        for line in ROUTER.report():
+            print(line)
+        if stats["rerouted"]:
+            print(f"Sent straight to the fallback model while over budget: {stats['rerouted']} calls "
+                  f"({stats['probes']} probes of the routed model)")
+    
+    def _print_cache_stats(self):
+        for strategy, stats in self.nodes.search_service.latency_stats().items():
+            print(f"Search latency ({strategy}): {stats['count']} searches, "
+                  f"avg {stats['avg_seconds']:.2f}s, max {stats['max_seconds']:.2f}s")
+        stats = self.search_cache.stats()
+        print(f"Search cache: {stats['memory_hits'] + stats['disk_hits']} hits, "
+              f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        stats = self.summary_store.stats()
+        print(f"Summary store: {stats['memory_hits'] + stats['disk_hits']} hits, "
+              f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        for kind, stats in resilience_stats().items():
+            if stats["retries"] or stats["hedges"] or stats["failures"] or stats["short_circuited"]:
+                print(f"Resilience ({kind}): {stats['retries']} retries, {stats['hedges']} hedged "
+                      f"({stats['hedge_wins']} won), {stats['deadlines']} deadlines missed, "
+                      f"{stats['short_circuited']} failed fast, circuit {stats['breaker']}")
+        for kind, stats in admission_stats().items():
+            if stats["wait"] or stats["shed"] or stats["expired"]:
+                waits = ", ".join(f"{name} p95 {wait['p95']:.2f}s" for name, wait in stats["wait"].items())
+                print(f"Admission ({kind}): {stats['admitted']} admitted, max queue {stats['max_queue_depth']}, "
+                      f"{stats['shed'] + stats['expired']} shed; wait {waits}")
+        if self.nodes.search_service.fallbacks:
+            print(f"Search fallbacks to saved results: {self.nodes.search_service.fallbacks}")
+        if self.nodes.search_service.saturated:
+            print(f"Tavily calls skipped while every search worker was busy: {self.nodes.search_service.saturated}")
+        flights = self.coalescing_stats()
+        if any(stats["coalesced"] for stats in flights.values()):
+            print("Coalesced duplicate calls: " + ", ".join(
+                f"{name} {stats['coalesced']}" for name, stats in flights.items()))
+        stats = MedicalSummarizationService.packer.stats()
+        if stats["packed"]:
+            print(f"Context packing: {stats['input_tokens']} -> {stats['packed_tokens']} prompt tokens "
+                  f"({stats['reduction']:.0%} smaller, {stats['duplicates']} duplicate passages dropped)")
+        if self.topic_index is not None:
+            stats = self.topic_index.stats()
+            if stats["synonym"] or stats["fuzzy"]:
+                print(f"Topic canonicalization: {stats['synonym']} synonyms resolved, "
+                      f"{stats['fuzzy']} spellings corrected")
+        if self.content_store is not None:
+            stats = self.content_store.stats()
+            print(f"Pre-warmed content: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['entries']} topics stored)")
+        if self.speculator is not None:
+            stats = self.speculator.stats()
+            print(f"Quiz speculation: {stats['ready']}/{stats['started']} ready in time "
+                  f"({stats['payoff_rate']:.0%}), {stats['waited']} waited, "
+                  f"avg wait {stats['avg_wait_seconds']:.2f}s")
+
+class AsyncHealthBotWorkflow(HealthBotWorkflow):
+    """Asyncio workflow engine serving many isolated sessions on one event loop"""
+    
+    def __init__(self, max_concurrent_sessions: int = 500, llm=None, search_tool=None,
+                 worker: Optional[int] = None):
+        super().__init__(llm, search_tool, worker)
+        self.max_concurrent_sessions = max_concurrent_sessions
+    
+    async def execute_session(self, io: SessionIO = CONSOLE,
+                              state: Optional[HealthBotState] = None) -> HealthBotState:
+        """Run one session to completion; every session owns its own state object and IO"""
+        if state is None:
+            state = StateManager.create_initial_state()
+        
+        try:
+            with session_notices(io):
+                while state["should_continue"] and state["workflow_step"] != "end":
+                    state = await self.graph.arun_step(state, io)
+        finally:
+            # A session that ends or is cancelled must not leave speculative work behind
+            if self.speculator is not None:
+                self.speculator.cancel(state["session_id"])
+        
+        return state
+    
+    async def run_sessions(self, ios: List[SessionIO]) -> list:
+        """Run one session per IO concurrently, bounded by max_concurrent_sessions
+        
+        Returns each session's final state, or the exception that ended it, in input order.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_sessions)
+        
+        async def run(io: SessionIO) -> HealthBotState:
+            async with semaphore:
+                return await self.execute_session(io)
+        
+        return await asyncio.gather(*(run(io) for io in ios), return_exceptions=True)
+    
+    def execute_workflow(self, resume_session_id: Optional[str] = None):
+        """Execute a single console session on the async engine"""
+        print("Initializing HealthBot async workflow...")
+        
+        state = self._starting_state(resume_session_id)
+        self.warm_clients()
+        STARTUP.mark("ready for input")
+        
+        try:
+            state = asyncio.run(self.execute_session(CONSOLE, state))
         except KeyboardInterrupt:
             print("\n\nHealthBot session ended by user. Stay healthy!")
         except Exception as e:
@@ -77,4 +362,4 @@ class HealthBotWorkflow:
             print("Please check your API keys and try again.")
         finally:
             print("\nThank you for using HealthBot!")
-            print(f"\nSession Summary: Processed {len(state['messages'])} workflow steps")
\ No newline at end of file
+            self._print_session_summary()
\ No newline at end of file
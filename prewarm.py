@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+HealthBot pre-warming: precompute search results, summaries and quizzes
+for popular topics so interactive sessions can be served from local data
+"""
+
+import argparse
+
+from healthbot_modules.prewarm import PrewarmPipeline
+from healthbot_modules.workflow import HealthBotWorkflow
+
+def main():
+    """Entry point for offline topic pre-warming"""
+    parser = argparse.ArgumentParser(description="Pre-warm HealthBot content for a list of topics")
+    parser.add_argument("topics_file", help="file with one health topic per line")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="topics searched and summarized at once (default 4)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild topics that are still fresh")
+    args = parser.parse_args()
+    
+    try:
+        workflow = HealthBotWorkflow()
+        pipeline = PrewarmPipeline(workflow.nodes, args.concurrency)
+        stats = pipeline.run(PrewarmPipeline.read_topics(args.topics_file), args.force)
+    except KeyboardInterrupt:
+        print("\nPre-warming interrupted. Run it again to resume where it stopped.")
+        return
+    except Exception as e:
+        print(f"Pre-warming failed: {str(e)}")
+        return
+    
+    print(f"\nPre-warming complete: {stats['warmed']} warmed, {stats['skipped']} already fresh, "
+          f"{stats['failed']} failed")
+
+if __name__ == "__main__":
+    main()
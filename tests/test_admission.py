@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from healthbot_modules.admission import (INTERACTIVE, PREWARM, SPECULATIVE, AdmissionRejected,
+                                         AdmissionScheduler, TokenBucket)
+
+
+def test_token_bucket_starts_full_and_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60, burst_seconds=10)
+    start = bucket._updated
+    assert bucket.capacity == 10
+    assert bucket.wait_time(10, start) == 0.0
+    bucket.take(10)
+    assert bucket.wait_time(1, start) == pytest.approx(1.0)
+    assert bucket.wait_time(1, start + 1.0) == 0.0
+    # Never refills past its capacity
+    assert bucket.wait_time(10, start + 60) == 0.0
+    assert bucket.level == 10
+
+
+def test_token_bucket_debt_delays_later_requests():
+    bucket = TokenBucket(per_minute=60, burst_seconds=10)
+    start = bucket._updated
+    bucket.take(15)
+    assert bucket.wait_time(1, start) == pytest.approx(6.0)
+
+
+def test_token_bucket_oversized_requests_wait_for_a_full_bucket():
+    bucket = TokenBucket(per_minute=60, burst_seconds=10)
+    start = bucket._updated
+    bucket.take(10)
+    assert bucket.wait_time(50, start) == pytest.approx(10.0)
+
+
+def test_unlimited_scheduler_admits_immediately():
+    scheduler = AdmissionScheduler("test")
+    assert not scheduler.limited
+    for _ in range(100):
+        scheduler.acquire(tokens=10_000)
+    assert scheduler.stats()["admitted"] == 0
+
+
+def test_requests_per_minute_allow_a_burst_then_queue():
+    scheduler = AdmissionScheduler("test", rpm=60, burst_seconds=3, max_wait=0.2)
+    for _ in range(3):
+        scheduler.acquire()
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        scheduler.acquire()
+    assert time.monotonic() - started == pytest.approx(0.2, abs=0.1)
+    stats = scheduler.stats()
+    assert (stats["admitted"], stats["expired"], stats["queue_depth"]) == (3, 1, 0)
+
+
+def test_tokens_are_settled_against_reported_usage():
+    scheduler = AdmissionScheduler("test", tpm=600, burst_seconds=10, max_wait=0.1)
+    scheduler.acquire(tokens=50)
+    # The call used 90 tokens, not 50: the extra 40 leave too little for another 50
+    scheduler.settle(50, 90)
+    with pytest.raises(AdmissionRejected):
+        scheduler.acquire(tokens=50)
+    scheduler.settle(50, 10)
+    scheduler.acquire(tokens=50)
+
+
+def test_full_queue_sheds_less_urgent_waiters():
+    scheduler = AdmissionScheduler("test", rpm=60, burst_seconds=1, max_queue=1, max_wait=5)
+    scheduler.acquire()
+    outcome = {}
+
+    def prewarm():
+        try:
+            scheduler.acquire(priority=PREWARM)
+        except AdmissionRejected as e:
+            outcome["prewarm"] = e
+
+    thread = threading.Thread(target=prewarm)
+    thread.start()
+    while scheduler.stats()["queue_depth"] == 0:
+        time.sleep(0.01)
+    # A speculative call cannot displace an interactive one, but displaces pre-warming
+    waiter = threading.Thread(target=lambda: scheduler.acquire(priority=SPECULATIVE))
+    waiter.start()
+    thread.join(2)
+    assert "shed for more urgent work" in str(outcome["prewarm"])
+    with pytest.raises(AdmissionRejected, match="queue is full"):
+        scheduler.acquire(priority=SPECULATIVE)
+    waiter.join(3)
+    assert not waiter.is_alive()
+
+
+def test_interactive_requests_are_admitted_before_background_ones():
+    scheduler = AdmissionScheduler("test", rpm=600, burst_seconds=0.1, max_wait=5)
+    scheduler.acquire()
+    order = []
+
+    async def call(name, priority):
+        await scheduler.aacquire(priority=priority)
+        order.append(name)
+
+    async def main():
+        background = asyncio.ensure_future(call("prewarm", PREWARM))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(call("interactive", INTERACTIVE), background)
+
+    asyncio.run(main())
+    assert order == ["interactive", "prewarm"]
+
+
+def test_admitted_call_charges_only_its_extra_requests():
+    scheduler = AdmissionScheduler("test", rpm=60, tpm=6000, burst_seconds=10)
+    admitted = scheduler.admit(tokens=100)
+    call = admitted.wrap(lambda value: value)
+    assert call("first") == "first"
+    assert scheduler.stats()["charged"] == 0
+    # A hedge or retry is sent at once and charged, even into debt
+    call("hedge")
+    assert scheduler.stats()["charged"] == 1
+    assert scheduler._requests.level == pytest.approx(8, abs=0.1)
+    assert scheduler._tokens.level == pytest.approx(800, abs=5)
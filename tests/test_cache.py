@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from healthbot_modules import cache as cache_module
+from healthbot_modules.cache import LRUCacheTier, SQLiteCacheTier, create_search_cache, make_cache_key
+
+RESULTS = [{"url": "https://www.cdc.gov/asthma", "content": "Asthma narrows the airways."}]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("HEALTHBOT_CACHE_DIR", str(tmp_path / "cache"))
+    return os.environ["HEALTHBOT_CACHE_DIR"]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache_module, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    tier = LRUCacheTier(max_entries=2)
+    for key in ("a", "b"):
+        tier.set(key, key, float("inf"))
+    tier.get("a")
+    tier.set("c", "c", float("inf"))
+    assert tier.get("b") is None
+    assert tier.get("a") == ("a", float("inf"))
+    assert len(tier) == 2
+
+
+def test_entries_expire_after_their_ttl(cache_dir, clock):
+    cache = create_search_cache(cache_dir, ttl_seconds=60)
+    cache.set("key", RESULTS)
+    clock[0] += 59
+    assert cache.get("key") == RESULTS
+    clock[0] += 1
+    assert cache.get("key") is None
+    assert len(cache.disk) == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_hits_are_promoted_into_memory(cache_dir):
+    create_search_cache(cache_dir).set("key", RESULTS)
+    # A new process starts with an empty memory tier over the same directory
+    cache = create_search_cache(cache_dir)
+    assert cache.get("key") == RESULTS
+    assert cache.get("key") == RESULTS
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["memory_entries"]) == (1, 1, 1)
+
+
+def test_expired_disk_entries_are_kept_as_stale_fallbacks(cache_dir, clock):
+    cache = create_search_cache(cache_dir, ttl_seconds=60, stale_seconds=600)
+    cache.set("key", RESULTS)
+    clock[0] += 120
+    assert cache.get("key") is None
+    assert cache.get_stale("key") == RESULTS
+    clock[0] += 600
+    assert cache.get_stale("key") is None
+
+
+def test_disk_tier_evicts_least_recently_read_rows_over_its_size(cache_dir, clock):
+    tier = SQLiteCacheTier(os.path.join(cache_dir, "cache.sqlite3"), max_bytes=250)
+    for index in range(3):
+        clock[0] += 1
+        tier.set(f"key{index}", "x" * 100, float("inf"))
+        if index == 1:
+            clock[0] += 1
+            tier.get("key0")
+    assert tier.get("key1") is None
+    assert tier.get("key0") is not None and tier.get("key2") is not None
+
+
+def test_cache_keys_are_stable_across_processes():
+    key = make_cache_key("search", "asthma", {"depth": "advanced", "max": 3})
+    assert key == make_cache_key("search", "asthma", {"max": 3, "depth": "advanced"})
+    assert key != make_cache_key("search", "asthma ", {"max": 3, "depth": "advanced"})
+    code = ("from healthbot_modules.cache import make_cache_key; "
+            "print(make_cache_key('search', 'asthma', {'depth': 'advanced', 'max': 3}))")
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=repo, env=dict(os.environ, PYTHONHASHSEED="123")).stdout
+    assert output.strip() == key
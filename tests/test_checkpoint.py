@@ -0,0 +1,88 @@
+from healthbot_modules.nodes import HealthBotNodes, TokenPrinter
+from healthbot_modules.session_io import SessionIO
+from healthbot_modules.state import StateCheckpointer, StateManager
+
+
+class RecordingIO(SessionIO):
+    def __init__(self, answers=()):
+        self.output = []
+        self.answers = list(answers)
+
+    def write(self, text="", end="\n"):
+        self.output.append(text + end)
+
+    def read(self, prompt):
+        return self.answers.pop(0)
+
+
+def _step(state, index):
+    StateManager.update_state(state, current_topic=f"topic {index}", workflow_step="search")
+    StateManager.add_message(state, "user_input", f"message {index}")
+
+
+def test_discarded_sessions_cannot_be_resumed(tmp_path):
+    checkpointer = StateCheckpointer(str(tmp_path / "sessions.journal"))
+    kept, evicted = StateManager.create_initial_state(), StateManager.create_initial_state()
+    for state in (kept, evicted):
+        _step(state, 1)
+        checkpointer.save(state)
+    checkpointer.discard(evicted["session_id"])
+
+    assert checkpointer.sessions() == [kept["session_id"]]
+    assert checkpointer.resume(evicted["session_id"]) is None
+    assert evicted["session_id"] not in checkpointer._saved
+    checkpointer.close()
+
+
+def test_compaction_keeps_every_live_session(tmp_path):
+    path = tmp_path / "sessions.journal"
+    checkpointer = StateCheckpointer(str(path), compact_every=25)
+    states = [StateManager.create_initial_state() for _ in range(10)]
+    for index in range(20):
+        for state in states:
+            _step(state, index)
+            checkpointer.save(state)
+    for state in states[:5]:
+        checkpointer.discard(state["session_id"])
+    checkpointer.close()
+
+    assert checkpointer.compactions > 0
+    assert len(path.read_text().splitlines()) < 20 * 10
+    reopened = StateCheckpointer(str(path))
+    assert sorted(reopened.sessions()) == sorted(state["session_id"] for state in states[5:])
+    resumed = reopened.resume(states[7]["session_id"])
+    assert resumed["current_topic"] == "topic 19"
+    assert [event["content"] for event in resumed["messages"].to_dicts()] == \
+        [f"message {index}" for index in range(20)]
+    reopened.close()
+
+
+def test_resumed_sessions_show_streamed_content_again(tmp_path):
+    checkpointer = StateCheckpointer(str(tmp_path / "sessions.journal"))
+    nodes = HealthBotNodes(llm=None, llm_with_tools=None, stream=True)
+    state = StateManager.create_initial_state()
+    StateManager.update_state(state, current_topic="asthma", search_results=[])
+    printer = TokenPrinter(RecordingIO())
+    printer("## What is asthma?")
+    nodes._summary_done(printer.io, state, "## What is asthma?", False, printer)
+    checkpointer.save(state)
+
+    # In the run that streamed it the summary is not repeated
+    io = RecordingIO([""])
+    nodes.present_info_node(state, io)
+    assert "## What is asthma?\n" not in io.output
+
+    resumed = checkpointer.resume(state["session_id"])
+    assert resumed["workflow_step"] == "present_info"
+    io = RecordingIO([""])
+    nodes.present_info_node(resumed, io)
+    assert "## What is asthma?\n" in io.output
+
+    StateManager.update_state(resumed, quiz_question="Question: Why?\nA) a\nB) b\nC) c\nD) d\nCorrect Answer: B")
+    nodes._quiz_done(io, resumed, resumed["quiz_question"], "B", printer=printer)
+    checkpointer.save(resumed)
+    io = RecordingIO(["B"])
+    nodes.present_quiz_node(checkpointer.resume(state["session_id"]), io)
+    shown = "".join(io.output)
+    assert "Question: Why?" in shown and "Correct Answer" not in shown
+    checkpointer.close()
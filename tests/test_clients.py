@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from healthbot_modules import clients
+from healthbot_modules.clients import ClientRegistry, LazyClient, resolve_client
+
+
+class Recorded:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def modules(monkeypatch):
+    """Stand-ins for the modules the registry imports on first use, counting the imports"""
+    fakes = {
+        "httpx": types.SimpleNamespace(Limits=Recorded, Client=Recorded, AsyncClient=Recorded),
+        "langchain_openai": types.SimpleNamespace(ChatOpenAI=Recorded),
+        "langchain_community.tools.tavily_search": types.SimpleNamespace(TavilySearchResults=Recorded),
+        "langchain_core.messages": types.SimpleNamespace(),
+    }
+    imported = []
+
+    def timed_import(module):
+        imported.append(module)
+        return fakes[module]
+
+    monkeypatch.setattr(clients, "_timed_import", timed_import)
+    return imported
+
+
+def test_lazy_client_builds_once_on_first_use():
+    built = []
+
+    def factory():
+        time.sleep(0.01)
+        built.append(1)
+        return types.SimpleNamespace(name="client")
+
+    lazy = LazyClient(factory)
+    assert built == []
+    threads = [threading.Thread(target=lambda: lazy.name) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert built == [1]
+    assert resolve_client(lazy) is lazy.resolve()
+    plain = object()
+    assert resolve_client(plain) is plain
+
+
+def test_chat_models_are_shared_per_settings_over_one_http_pool(modules):
+    registry = ClientRegistry(max_connections=7)
+    assert modules == []
+    llm = registry.llm()
+    assert registry.llm() is llm
+    other = registry.llm("gpt-4o-mini", 0.0)
+    assert other is not llm
+    assert other.kwargs["model"] == "gpt-4o-mini"
+    assert other.kwargs["http_client"] is llm.kwargs["http_client"]
+    assert other.kwargs["http_async_client"] is llm.kwargs["http_async_client"]
+    assert llm.kwargs["http_client"].kwargs["limits"].kwargs["max_connections"] == 7
+    assert modules.count("httpx") == 1
+
+
+def test_search_tool_is_built_once_for_trusted_domains(modules):
+    registry = ClientRegistry()
+    tool = registry.search_tool()
+    assert registry.search_tool() is tool
+    assert tool.kwargs["include_domains"] == clients.TRUSTED_MEDICAL_DOMAINS
+    assert modules == ["langchain_community.tools.tavily_search"]
+
+
+def test_warming_failures_are_left_for_first_use(modules):
+    def broken():
+        raise RuntimeError("no API key")
+
+    ClientRegistry().warm_in_background(broken).join(5)
+    assert modules == ["langchain_core.messages"]
+
+
+def test_importing_the_package_does_not_import_langchain():
+    code = ("import sys, healthbot_modules.nodes, healthbot_modules.upstream; "
+            "print(sorted(name for name in sys.modules if name.startswith('langchain')))")
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=repo).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,57 @@
+import asyncio
+
+from healthbot_modules.coalesce import SingleFlight
+
+
+def test_concurrent_async_callers_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("key", fetch, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21]
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "errors": 0, "cancelled": 0, "in_flight": 0}
+
+
+def test_call_left_pending_by_a_closed_loop_is_not_joined():
+    flight = SingleFlight("test")
+
+    async def stuck():
+        await asyncio.Event().wait()
+
+    async def quick():
+        return "fresh"
+
+    loop = asyncio.new_event_loop()
+    pending = loop.create_task(flight.ado("key", stuck))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    loop.close()  # the shared task is still pending and its done callback never runs
+
+    assert asyncio.run(asyncio.wait_for(flight.ado("key", quick), 1)) == "fresh"
+    assert flight.stats()["in_flight"] == 0
+    assert not pending.done()
+
+
+def test_cancelled_waiter_leaves_the_shared_call_running():
+    flight = SingleFlight("test")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado("key", slow))
+        second = asyncio.ensure_future(flight.ado("key", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    assert flight.stats()["cancelled"] == 0
@@ -0,0 +1,135 @@
+import pytest
+
+from healthbot_modules import content_store
+from healthbot_modules.content_store import ContentImage, TopicContentStore
+from healthbot_modules.nodes import HealthBotNodes
+from healthbot_modules.session_io import SessionIO
+from healthbot_modules.state import StateManager
+
+
+class RecordingIO(SessionIO):
+    def __init__(self):
+        self.output = []
+
+    def write(self, text="", end="\n"):
+        self.output.append(text)
+
+
+def _rows(count):
+    return [(f"topic {index}", f"payload {index}".encode(), "a" * 16, 1000.0 + index) for index in range(count)]
+
+
+def test_every_written_entry_is_found(tmp_path):
+    path = str(tmp_path / "content.img")
+    assert ContentImage.write(path, _rows(50)) == 50
+    image = ContentImage(path)
+    assert image.count == 50
+    for topic_key, payload, template_hash, created_at in _rows(50):
+        assert image.find(topic_key) == (payload, template_hash, created_at)
+    assert image.find("topic 50") is None
+
+
+def test_empty_image_finds_nothing(tmp_path):
+    path = str(tmp_path / "content.img")
+    assert ContentImage.write(path, []) == 0
+    assert ContentImage(path).find("anything") is None
+
+
+def test_short_template_hashes_round_trip(tmp_path):
+    path = str(tmp_path / "content.img")
+    ContentImage.write(path, [("diabetes", b"\0payload\0", "abc", 5.0)])
+    assert ContentImage(path).find("diabetes") == (b"\0payload\0", "abc", 5.0)
+
+
+def test_keys_with_colliding_hashes_are_told_apart(tmp_path, monkeypatch):
+    monkeypatch.setattr(content_store, "_key_hash", lambda topic_key: len(topic_key))
+    path = str(tmp_path / "content.img")
+    ContentImage.write(path, [("flu", b"1", "t", 1.0), ("gout", b"2", "t", 2.0), ("mumps", b"3", "t", 3.0),
+                              ("lupus", b"4", "t", 4.0), ("cold", b"5", "t", 5.0)])
+    image = ContentImage(path)
+    assert image.find("lupus") == (b"4", "t", 4.0)
+    assert image.find("mumps") == (b"3", "t", 3.0)
+    assert image.find("cold") == (b"5", "t", 5.0)
+    assert image.find("polio") is None
+
+
+def test_files_that_are_not_images_are_rejected(tmp_path):
+    path = tmp_path / "content.img"
+    path.write_bytes(b"SQLite format 3\0" + bytes(64))
+    with pytest.raises(ValueError):
+        ContentImage(str(path))
+
+
+def test_readers_see_entries_once_they_are_published(tmp_path):
+    path = str(tmp_path / "content.sqlite3")
+    writer = TopicContentStore(path, "template")
+    reader = TopicContentStore(path, "template", refresh_seconds=0)
+    writer.put("Type 2 Diabetes", [{"title": "t"}], "summary", "quiz", "B")
+    # Before any image exists readers query SQLite
+    assert reader.get("type 2 diabetes")["summary"] == "summary"
+
+    assert writer.publish() == 1
+    writer.put("Asthma", [], "asthma summary", "quiz", "A")
+    assert reader.get("asthma") is None
+    assert reader.stats()["image"]["entries"] == 1
+    assert reader.get("type 2 diabetes")["summary"] == "summary"
+    writer.publish()
+    assert reader.get("asthma")["summary"] == "asthma summary"
+    writer.release_writer()
+
+
+def test_entries_built_with_another_template_are_stale(tmp_path):
+    path = str(tmp_path / "content.sqlite3")
+    writer = TopicContentStore(path, "old template")
+    writer.put("asthma", [], "summary", "quiz", "A")
+    writer.publish()
+    writer.release_writer()
+    reader = TopicContentStore(path, "new template")
+    assert reader.get("asthma") is None
+    assert reader.get("asthma", allow_stale=True)["summary"] == "summary"
+
+
+def test_sessions_decode_their_pre_warmed_entry_once_per_topic(tmp_path):
+    path = str(tmp_path / "content.sqlite3")
+    writer = TopicContentStore(path, "template")
+    results = [{"url": "https://www.cdc.gov/asthma", "content": "Asthma overview."}]
+    writer.put("asthma", results, "asthma summary", "quiz", "A")
+    writer.put("gout", [], "gout summary", "quiz", "B")
+    writer.publish()
+    writer.release_writer()
+    reader = TopicContentStore(path, "template")
+    decoded = []
+    reader.decode = lambda payload: decoded.append(payload) or TopicContentStore.decode(payload)
+    nodes = HealthBotNodes(llm=None, llm_with_tools=None, content_store=reader)
+    state = StateManager.create_initial_state()
+    StateManager.update_state(state, current_topic="Asthma", topic_key="asthma")
+
+    nodes.search_node(state, RecordingIO())
+    assert state["search_results"] == results
+    StateManager.update_state(state, summary="asthma summary")
+    assert nodes._precomputed_summary(state) == "asthma summary"
+    assert nodes._precomputed_quiz(state) == ("quiz", "A", None)
+    assert len(decoded) == 1
+
+    # A new topic in the same session is looked up again, as is a session that starts over
+    StateManager.update_state(state, current_topic="gout", topic_key="gout", search_results=[])
+    assert nodes._precomputed_summary(state) == "gout summary"
+    nodes._continue_chosen(RecordingIO(), state, "1")
+    assert nodes._precomputed_summary(state) == "gout summary"
+    assert len(decoded) == 3
+
+
+def test_store_knows_when_its_image_lacks_entries(tmp_path):
+    path = str(tmp_path / "content.sqlite3")
+    store = TopicContentStore(path, "template", refresh_seconds=0)
+    assert not store.unpublished()
+    store.put("asthma", [], "summary", "quiz", "A")
+    assert store.unpublished()
+    store.publish()
+    assert not store.unpublished()
+    # A rewritten topic is newer than the image even though the count is unchanged
+    store.put("asthma", [], "new summary", "quiz", "A")
+    assert store.unpublished()
+    store.publish()
+    store.release_writer()
+    assert not TopicContentStore(path, "template").unpublished()
@@ -0,0 +1,66 @@
+from healthbot_modules.context import ContextPacker, estimate_tokens
+
+SYMPTOMS = ("Asthma symptoms include wheezing, coughing and shortness of breath. "
+            "Symptoms often get worse at night or during exercise.")
+TREATMENT = ("Asthma treatment uses inhaled corticosteroids to control inflammation. "
+             "A rescue inhaler treats sudden attacks quickly.")
+FILLER = "The site uses cookies to improve your browsing experience and remember preferences."
+
+
+def _tokens(packed):
+    return sum(estimate_tokens(entry["content"]) for entry in packed)
+
+
+def test_near_duplicate_passages_keep_the_higher_ranked_copy():
+    packer = ContextPacker(passage_words=20)
+    results = [{"url": "https://a.org", "content": SYMPTOMS},
+               {"url": "https://b.org", "content": SYMPTOMS.replace("Asthma", "asthma")},
+               {"url": "https://c.org", "content": TREATMENT}]
+    packed = packer.pack("asthma", results)
+    assert [entry["url"] for entry in packed] == ["https://a.org", "https://c.org"]
+    assert packer.stats()["duplicates"] == 1
+
+
+def test_relevant_passages_are_preferred_within_the_budget():
+    packer = ContextPacker(token_budget=80, passage_words=20)
+    results = [{"url": "https://ads.example", "content": FILLER},
+               {"url": "https://a.org", "content": SYMPTOMS},
+               {"url": "https://c.org", "content": TREATMENT}]
+    packed = packer.pack("asthma", results)
+    assert [entry["url"] for entry in packed] == ["https://a.org", "https://c.org"]
+    assert _tokens(packed) <= 80
+
+
+def test_passages_from_one_source_are_merged_in_order():
+    packer = ContextPacker(passage_words=10)
+    packed = packer.pack("asthma", [{"url": "https://a.org", "content": SYMPTOMS + " " + TREATMENT}])
+    assert len(packed) == 1
+    content = packed[0]["content"]
+    assert content.index("wheezing") < content.index("corticosteroids")
+
+
+def test_long_unpunctuated_text_is_split_to_fit_the_budget():
+    packer = ContextPacker(token_budget=200, passage_words=60)
+    text = " ".join(["asthma symptoms wheezing treatment inhaler"] * 400)
+    packed = packer.pack("asthma", [{"url": "https://a.org", "content": text}])
+    assert packed and packed[0]["url"] == "https://a.org"
+    assert 0 < _tokens(packed) <= 200
+
+
+def test_oversized_top_passage_is_truncated_to_the_budget():
+    packer = ContextPacker(token_budget=50, passage_words=60)
+    # Words so long that a single piece is over the budget
+    text = " ".join(["asthma" + "x" * 60] * 30)
+    packed = packer.pack("asthma", [{"url": "https://a.org", "content": text}])
+    assert len(packed) == 1
+    assert 0 < estimate_tokens(packed[0]["content"]) <= 50
+    assert text.startswith(packed[0]["content"])
+
+
+def test_zero_budget_passes_results_through():
+    results = [{"url": "https://a.org", "content": FILLER}]
+    assert ContextPacker(token_budget=0).pack("asthma", results) == results
+
+
+def test_empty_results_pack_to_nothing():
+    assert ContextPacker().pack("asthma", [{"url": "https://a.org", "content": ""}]) == []
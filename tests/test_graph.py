@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from healthbot_modules.graph import END_STEP, NodeGraph
+from healthbot_modules.metrics import WorkflowMetrics, current_node, record_upstream_call
+
+
+def _graph():
+    graph = NodeGraph("search")
+
+    def search(state):
+        record_upstream_call("tavily", 0.2)
+        record_upstream_call("llm", 0.5, tokens=120)
+        return dict(state, workflow_step="summarize")
+
+    async def asearch(state):
+        return search(state)
+
+    def summarize(state, answer=None):
+        record_upstream_call("llm", 1.0, tokens=300)
+        return dict(state, workflow_step=answer or END_STEP)
+
+    graph.register("search", search, ["summarize"], asearch)
+    graph.register("summarize", summarize, [END_STEP])
+    return graph
+
+
+def test_validate_accepts_a_connected_graph():
+    _graph().validate()
+
+
+@pytest.mark.parametrize("change, error", [
+    (lambda graph: setattr(graph, "entry", "welcome"), "Entry node 'welcome' is not registered"),
+    (lambda graph: graph.register("quiz", lambda state: state, [END_STEP]), "unreachable from 'search'"),
+    (lambda graph: graph.register("quiz", lambda state: state, ["grade"]), "transitions to unknown steps"),
+])
+def test_validate_rejects_broken_graphs(change, error):
+    graph = _graph()
+    change(graph)
+    with pytest.raises(ValueError, match=error):
+        graph.validate()
+
+
+def test_duplicate_nodes_are_rejected():
+    with pytest.raises(ValueError, match="already registered"):
+        _graph().register("search", lambda state: state, [END_STEP])
+
+
+def test_hooks_run_around_each_node_in_order():
+    graph = _graph()
+    calls = []
+    graph.pre_hooks.append(lambda record, state: calls.append(("pre", record.node, state["workflow_step"],
+                                                                current_node())))
+    graph.post_hooks.append(lambda record, state: calls.append(("post", record.node, state["workflow_step"],
+                                                                 current_node())))
+    graph.post_hooks.append(lambda record, state: calls.append(("post2", record.node)))
+    state = graph.run_step({"workflow_step": "search"})
+    graph.run_step(state)
+    # Pre hooks see the node's input and its open step; post hooks see its output after the step closed
+    assert calls == [
+        ("pre", "search", "search", "search"), ("post", "search", "summarize", None), ("post2", "search"),
+        ("pre", "summarize", "summarize", "summarize"), ("post", "summarize", END_STEP, None), ("post2", "summarize"),
+    ]
+
+
+def test_disallowed_transition_raises_without_running_post_hooks():
+    graph = _graph()
+    posted = []
+    graph.post_hooks.append(lambda record, state: posted.append(record))
+    with pytest.raises(ValueError, match="moved to disallowed step 'search'"):
+        graph.run_step({"workflow_step": "summarize"}, "search")
+    assert posted == []
+    assert current_node() is None
+    with pytest.raises(ValueError, match="No node registered for step 'quiz'"):
+        graph.run_step({"workflow_step": "quiz"})
+
+
+def test_async_steps_need_an_async_variant():
+    graph = _graph()
+    state = asyncio.run(graph.arun_step({"workflow_step": "search"}))
+    assert state["workflow_step"] == "summarize"
+    with pytest.raises(ValueError, match="has no async variant"):
+        asyncio.run(graph.arun_step(state))
+
+
+def test_metrics_count_each_nodes_upstream_calls():
+    graph = _graph()
+    metrics = WorkflowMetrics()
+    graph.post_hooks.append(metrics.post_node)
+    for _ in range(2):
+        graph.run_step(graph.run_step({"workflow_step": "search"}))
+    # Calls after the node has finished are not attributed to it
+    record_upstream_call("llm", 9.0, tokens=999)
+    nodes = metrics.to_dict()
+    assert (nodes["search"]["llm_calls"], nodes["search"]["tavily_calls"], nodes["search"]["tokens"]) == (2, 2, 240)
+    assert (nodes["summarize"]["llm_calls"], nodes["summarize"]["tavily_calls"]) == (2, 0)
+    assert nodes["summarize"]["tokens"] == 600
+    assert nodes["summarize"]["llm"]["avg"] == 1.0
+    assert nodes["search"]["wall"]["count"] == 2
+    assert nodes["summarize"]["tavily"]["count"] == 0
+    assert len(metrics.report()) == 3
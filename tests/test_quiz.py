@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from healthbot_modules.quiz import QuizService
+
+
+def _bundle(question="What raises blood sugar?", correct="B"):
+    return {
+        "question": question,
+        "options": {"A": "Walking", "B": "Sugary drinks", "C": "Sleep", "D": "Water"},
+        "correct_answer": correct,
+        "feedback": {letter: f"Feedback {letter}" for letter in "ABCD"},
+    }
+
+
+def test_parse_quiz_bundle_normalizes_fields():
+    raw = _bundle(question="  What raises blood sugar?  ", correct=" b) Sugary drinks")
+    raw["options"]["A"] = " Walking "
+    bundle = QuizService.parse_quiz_bundle(json.dumps(raw))
+    assert bundle["question"] == "What raises blood sugar?"
+    assert bundle["correct_answer"] == "B"
+    assert bundle["options"]["A"] == "Walking"
+    assert set(bundle) == {"question", "options", "correct_answer", "feedback"}
+
+
+def test_parse_quiz_bundle_accepts_a_fenced_json_reply():
+    content = "```json\n" + json.dumps(_bundle()) + "\n```"
+    assert QuizService.parse_quiz_bundle(content)["correct_answer"] == "B"
+
+
+@pytest.mark.parametrize("content", ["not json", "[1, 2]", "{}"])
+def test_parse_quiz_bundle_rejects_non_bundles(content):
+    with pytest.raises(ValueError):
+        QuizService.parse_quiz_bundle(content)
+
+
+@pytest.mark.parametrize("change", [
+    lambda bundle: bundle.update(question=""),
+    lambda bundle: bundle.update(question=42),
+    lambda bundle: bundle["options"].pop("D"),
+    lambda bundle: bundle["options"].update(C=3),
+    lambda bundle: bundle["feedback"].update(A="   "),
+    lambda bundle: bundle.update(feedback=["A", "B", "C", "D"]),
+    lambda bundle: bundle.update(correct_answer="E"),
+    lambda bundle: bundle.update(correct_answer=None),
+])
+def test_validate_bundle_rejects_malformed_bundles(change):
+    bundle = _bundle()
+    change(bundle)
+    with pytest.raises(ValueError):
+        QuizService.validate_bundle(bundle)
+
+
+def test_format_quiz_bundle_matches_the_classic_format():
+    text = QuizService.format_quiz_bundle(QuizService.validate_bundle(_bundle()))
+    assert text.splitlines()[0] == "Question: What raises blood sugar?"
+    assert "B) Sugary drinks" in text
+    assert QuizService.parse_quiz(text) == (text, "B")
+
+
+def test_grade_from_bundle_uses_the_precomputed_feedback():
+    bundle = QuizService.validate_bundle(_bundle())
+    assert QuizService.grade_from_bundle(bundle, "B") == ("A", "Feedback B")
+    grade, feedback = QuizService.grade_from_bundle(bundle, "C")
+    assert grade == "F"
+    assert "You answered C) Sleep" in feedback
+    assert "The correct answer is B) Sugary drinks" in feedback
+
+
+def test_parse_quiz_pool_drops_malformed_and_repeated_questions():
+    questions = [
+        _bundle("What raises blood sugar?"),
+        _bundle("what raises blood sugar?  "),
+        dict(_bundle("Broken?"), correct_answer="Z"),
+        _bundle("Which habit helps?", correct="A"),
+        "not a question",
+    ]
+    pool = QuizService.parse_quiz_pool(json.dumps({"questions": questions}))
+    assert [row[0] for row in pool] == ["What raises blood sugar?", "Which habit helps?"]
+    assert pool[1][1] == "A"
+
+
+def test_parse_quiz_pool_accepts_a_bare_list():
+    pool = QuizService.parse_quiz_pool(json.dumps([_bundle()]))
+    assert len(pool) == 1
+
+
+@pytest.mark.parametrize("content", [
+    "not json",
+    json.dumps({"questions": "none"}),
+    json.dumps({"questions": [dict(_bundle(), correct_answer="Z")]}),
+])
+def test_parse_quiz_pool_rejects_pools_without_a_usable_question(content):
+    with pytest.raises(ValueError):
+        QuizService.parse_quiz_pool(content)
+
+
+def test_pool_rows_round_trip_to_bundles():
+    bundle = QuizService.validate_bundle(_bundle())
+    row = QuizService.pack_question(bundle)
+    assert row == ["What raises blood sugar?", "B", ["Walking", "Sugary drinks", "Sleep", "Water"],
+                   ["Feedback A", "Feedback B", "Feedback C", "Feedback D"]]
+    # Rows are stored as JSON, so they must survive it unchanged
+    assert QuizService.unpack_question(json.loads(json.dumps(row))) == bundle
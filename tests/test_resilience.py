@@ -0,0 +1,170 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from healthbot_modules import resilience
+from healthbot_modules.admission import AdmissionRejected
+from healthbot_modules.resilience import (BudgetExceeded, CircuitBreaker, CircuitOpenError, ResiliencePolicy,
+                                          ResilientUpstream)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _tripped():
+    breaker = CircuitBreaker("upstream", window=10, failure_ratio=0.5, min_calls=4, reset_timeout=30)
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_breaker_waits_for_min_calls_before_opening(clock):
+    breaker = CircuitBreaker("upstream", window=10, failure_ratio=0.5, min_calls=4)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+
+
+def test_failures_below_the_ratio_keep_the_breaker_closed(clock):
+    breaker = CircuitBreaker("upstream", window=10, failure_ratio=0.5, min_calls=4)
+    for _ in range(10):
+        breaker.record_success()
+        breaker.record_success()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.trips == 0
+
+
+def test_only_the_window_of_recent_calls_counts(clock):
+    breaker = CircuitBreaker("upstream", window=4, failure_ratio=0.5, min_calls=4)
+    for _ in range(3):
+        breaker.record_failure()
+    # Successes push the old failures out of the window
+    for _ in range(4):
+        breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_open_breaker_fails_fast(clock):
+    breaker = _tripped()
+    clock[0] += 29
+    with pytest.raises(CircuitOpenError, match="upstream is unavailable"):
+        breaker.check()
+
+
+def test_one_probe_is_let_through_after_the_reset_timeout(clock):
+    breaker = _tripped()
+    clock[0] += 30
+    assert breaker.state == "half_open"
+    breaker.check()
+    # Everyone else fails fast while the probe is out
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = _tripped()
+    clock[0] += 30
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+    # The failures from before the trip are forgotten
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = _tripped()
+    clock[0] += 30
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    # The reset timeout starts again from the failed probe
+    clock[0] += 30
+    breaker.check()
+
+
+def test_probe_without_an_outcome_can_be_released(clock):
+    breaker = _tripped()
+    clock[0] += 30
+    probe = breaker.check()
+    breaker.release(probe)
+    assert breaker.state == "half_open"
+    assert breaker.check() is not None
+    # Releasing a probe that already reported does not free its successor's slot
+    breaker.release(probe)
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def _half_open_upstream():
+    upstream = ResilientUpstream("upstream", ResiliencePolicy(deadline=5, max_attempts=1, breaker_window=4,
+                                                              breaker_reset=0))
+    for _ in range(4):
+        upstream.breaker.record_failure()
+    assert upstream.breaker.state == "half_open"
+    return upstream
+
+
+def test_cancelled_probe_does_not_hold_the_breaker_open():
+    upstream = _half_open_upstream()
+
+    async def answer():
+        return "ok"
+
+    async def main():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(10)
+
+        probe = asyncio.ensure_future(upstream.acall("site", hang))
+        await started.wait()
+        with pytest.raises(CircuitOpenError):
+            await upstream.acall("site", answer)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert await upstream.acall("site", answer) == "ok"
+
+    asyncio.run(main())
+    assert upstream.breaker.state == "closed"
+
+
+def test_probe_over_its_budget_does_not_hold_the_breaker_open():
+    upstream = _half_open_upstream()
+    with pytest.raises(BudgetExceeded):
+        upstream.call("site", time.sleep, 0.3, budget=0.05)
+    assert upstream.breaker.state == "half_open"
+    assert upstream.call("site", lambda: "ok") == "ok"
+    assert upstream.breaker.state == "closed"
+
+
+def test_shed_probe_does_not_hold_the_breaker_open():
+    upstream = _half_open_upstream()
+
+    def shed():
+        raise AdmissionRejected("upstream request waited too long")
+
+    with pytest.raises(AdmissionRejected):
+        upstream.call("site", shed)
+    assert upstream.call("site", lambda: "ok") == "ok"
+    assert upstream.breaker.state == "closed"
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from healthbot_modules import upstream
+from healthbot_modules.fakes import FakeMessage
+from healthbot_modules.resilience import UPSTREAMS, BudgetExceeded, ResiliencePolicy, ResilientUpstream
+from healthbot_modules.routing import ModelRouter, Route
+
+
+class TieredModel:
+    """A chat model whose answer takes delays[model] seconds, for whichever model it is bound to"""
+
+    def __init__(self, delays, model_name="default"):
+        self.delays = delays
+        self.model_name = model_name
+
+    def bind(self, **kwargs):
+        return TieredModel(self.delays, kwargs["model"])
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.delays[self.model_name])
+        return FakeMessage(self.model_name, input_tokens=10, output_tokens=5)
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self.delays[self.model_name])
+        return FakeMessage(self.model_name, input_tokens=10, output_tokens=5)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter({"summarize": Route("big", timeout=0.05, fallback="small"),
+                          "quiz": Route("small", max_tokens=100)}, min_calls=4, window=4, probe_every=3)
+    monkeypatch.setattr(upstream, "ROUTER", router)
+    monkeypatch.setitem(UPSTREAMS, "llm", ResilientUpstream("OpenAI", ResiliencePolicy(deadline=5)))
+    return router
+
+
+def test_plan_tries_the_route_under_its_budget_then_the_fallback(router):
+    attempts = router.plan("summarize")
+    assert [(route.model, budget) for route, budget in attempts] == [("big", 0.05), ("small", None)]
+    # Without a fallback the timeout is only a target, not a budget
+    assert [(route.model, budget) for route, budget in router.plan("quiz")] == [("small", None)]
+    assert router.plan("feedback") == [(None, None)]
+    router.enabled = False
+    assert router.plan("summarize") == [(None, None)]
+
+
+def test_sites_missing_their_budget_go_straight_to_the_fallback(router):
+    route = router.routes["summarize"]
+    for _ in range(4):
+        router.record("summarize", route, None, 0.05, abandoned=True)
+    plans = [[attempt.model for attempt, _ in router.plan("summarize")] for _ in range(6)]
+    # Every probe_every-th call tries the route again so the site can recover
+    assert plans == [["small"], ["small"], ["big", "small"], ["small"], ["small"], ["big", "small"]]
+    assert router.stats()["rerouted"] == 4
+    assert router.stats()["probes"] == 2
+
+
+def test_call_over_budget_is_answered_by_the_fallback(router):
+    llm = TieredModel({"big": 0.3, "small": 0.0})
+    assert upstream.invoke_llm(llm, [FakeMessage("hi")], "summarize").content == "small"
+    assert asyncio.run(upstream.ainvoke_llm(llm, [FakeMessage("hi")], "summarize")).content == "small"
+    rows = {row["model"]: row for row in router.stats()["calls"]}
+    assert rows["big"]["abandoned"] == 2
+    assert (rows["small"]["calls"], rows["small"]["fallback"], rows["small"]["tokens"]) == (2, True, 30)
+
+
+def test_call_within_budget_keeps_its_route(router):
+    llm = TieredModel({"big": 0.0, "small": 0.0})
+    assert upstream.invoke_llm(llm, [FakeMessage("hi")], "summarize").content == "big"
+    assert upstream.invoke_llm(llm, [FakeMessage("hi")], "quiz").content == "small"
+
+
+def test_last_attempt_over_budget_raises(router, monkeypatch):
+    route = router.routes["summarize"]
+    monkeypatch.setattr(router, "plan", lambda site: [(route, 0.05)])
+    llm = TieredModel({"big": 0.3})
+    with pytest.raises(BudgetExceeded):
+        upstream.invoke_llm(llm, [FakeMessage("hi")], "summarize")
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(upstream.ainvoke_llm(llm, [FakeMessage("hi")], "summarize"))
+
+
+def test_half_open_probe_over_budget_lets_the_fallback_probe(router):
+    breaker = UPSTREAMS["llm"].breaker
+    breaker.reset_timeout = 0
+    for _ in range(breaker.min_calls):
+        breaker.record_failure()
+    llm = TieredModel({"big": 0.3, "small": 0.0})
+    # The routed model runs out of budget as the probe; the fallback's answer closes the breaker
+    assert upstream.invoke_llm(llm, [FakeMessage("hi")], "summarize").content == "small"
+    assert breaker.state == "closed"
@@ -0,0 +1,231 @@
+import asyncio
+import threading
+
+import pytest
+
+from healthbot_modules import search
+from healthbot_modules.cache import SQLiteCacheTier, TieredCache
+from healthbot_modules.fakes import FakeMessage
+from healthbot_modules.resilience import UPSTREAMS
+from healthbot_modules.search import TAVILY_TOOL_NAME, MedicalSearchService
+from healthbot_modules.session_io import SessionIO, session_notices
+
+RESULTS = [{"url": "https://www.cdc.gov/asthma", "content": "Asthma overview."}]
+
+
+class RecordingIO(SessionIO):
+    def __init__(self):
+        self.output = []
+
+    def write(self, text="", end="\n"):
+        self.output.append(text)
+
+
+class SearchTool:
+    """Tavily stand-in answering each query from a dict of results or errors"""
+
+    name = TAVILY_TOOL_NAME
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def _answer(self, args):
+        self.queries.append(args["query"])
+        answer = self.answers.get(args["query"], [])
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def invoke(self, args, **kwargs):
+        return self._answer(args)
+
+    async def ainvoke(self, args, **kwargs):
+        await asyncio.sleep(0)
+        return self._answer(args)
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    # Injected failures must not be retried, or trip the shared breakers
+    for upstream in UPSTREAMS.values():
+        monkeypatch.setattr(upstream, "enabled", False)
+
+
+def test_service_notices_reach_the_sessions_io_not_stdout(capsys):
+    cache = TieredCache()
+    service = MedicalSearchService(cache=cache, strategy="direct", search_tool=SearchTool({}))
+    cache.set(service.cache_key("asthma"), RESULTS)
+    io = RecordingIO()
+    with session_notices(io):
+        assert service.search_medical_info("asthma", None) == RESULTS
+    assert io.output == ["Serving cached results from trusted medical sources..."]
+    assert capsys.readouterr().out == ""
+
+
+def test_concurrent_sessions_each_get_their_own_fallback_notice(tmp_path, capsys):
+    disk = SQLiteCacheTier(str(tmp_path / "cache.sqlite3"), stale_seconds=3600)
+    cache = TieredCache(disk=disk)
+    service = MedicalSearchService(cache=cache, strategy="direct",
+                                   search_tool=SearchTool({"asthma medical information symptoms treatment causes":
+                                                           ConnectionError("Tavily is down")}))
+    cache.set(service.cache_key("asthma"), RESULTS, ttl_seconds=-1)
+    ios = [RecordingIO(), RecordingIO()]
+
+    async def session(io):
+        with session_notices(io):
+            return await service.asearch_medical_info("asthma", None)
+
+    async def main():
+        return await asyncio.gather(*(session(io) for io in ios))
+
+    assert asyncio.run(main()) == [RESULTS, RESULTS]
+    for io in ios:
+        assert io.output == ["Search is unavailable (Tavily is down); serving saved results from trusted "
+                             "medical sources..."]
+    assert capsys.readouterr().out == ""
+
+
+def _calls(*queries):
+    return [{"name": TAVILY_TOOL_NAME, "args": {"query": query}} for query in queries]
+
+
+def test_fanned_out_results_are_merged_in_call_order_without_repeated_urls():
+    tool = SearchTool({"symptoms": [{"url": "https://a.org", "content": "a"}, {"url": "https://b.org", "content": "b"}],
+                       "treatment": [{"url": "https://b.org", "content": "b again"},
+                                     {"url": "https://c.org", "content": "c"}]})
+    service = MedicalSearchService(search_tool=tool)
+    calls = _calls("symptoms", "treatment") + [{"name": "other_tool", "args": {"query": "ignored"}}]
+    expected = ["https://a.org", "https://b.org", "https://c.org"]
+    assert [result["url"] for result in service._run_tool_calls(calls)] == expected
+    assert [result["url"] for result in asyncio.run(service._arun_tool_calls(calls))] == expected
+    assert sorted(tool.queries) == ["symptoms", "symptoms", "treatment", "treatment"]
+
+
+def test_failed_calls_are_skipped_while_others_succeed(caplog):
+    tool = SearchTool({"symptoms": RESULTS, "treatment": ConnectionError("Tavily is down")})
+    service = MedicalSearchService(search_tool=tool)
+    with caplog.at_level("WARNING", logger="healthbot_modules.search"):
+        assert service._run_tool_calls(_calls("symptoms", "treatment")) == RESULTS
+        assert asyncio.run(service._arun_tool_calls(_calls("treatment", "symptoms"))) == RESULTS
+    assert caplog.messages == ["1 of 2 searches failed; using partial results"] * 2
+
+
+def test_every_call_failing_raises_the_first_error():
+    tool = SearchTool({"symptoms": ConnectionError("first"), "treatment": TimeoutError("second")})
+    service = MedicalSearchService(search_tool=tool)
+    with pytest.raises(ConnectionError, match="first"):
+        service._run_tool_calls(_calls("symptoms", "treatment"))
+    with pytest.raises(ConnectionError, match="first"):
+        asyncio.run(service._arun_tool_calls(_calls("symptoms", "treatment")))
+
+
+def test_calls_are_skipped_while_timed_out_calls_hold_every_worker():
+    release = threading.Event()
+
+    class StuckTool(SearchTool):
+        def invoke(self, args, **kwargs):
+            if args["query"] == "stuck":
+                release.wait(5)
+            return super().invoke(args, **kwargs)
+
+    service = MedicalSearchService(search_tool=StuckTool({"symptoms": RESULTS}), tool_call_workers=1,
+                                   tool_call_timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError, match="exceeded"):
+            service._run_tool_calls(_calls("stuck"))
+        # The timed-out call still has the only worker, so this call is not queued behind it
+        with pytest.raises(TimeoutError, match="saturated"):
+            service._run_tool_calls(_calls("symptoms"))
+        assert service.saturated == 1
+    finally:
+        release.set()
+    # Once the stuck call returns, its worker takes new calls again
+    assert service._tool_slots.acquire(timeout=5)
+    service._tool_slots.release()
+    assert service._run_tool_calls(_calls("symptoms")) == RESULTS
+
+
+class Planner:
+    """Tool-calling model stand-in that answers with the given tool calls"""
+
+    def __init__(self, tool_calls):
+        self.tool_calls = tool_calls
+        self.calls = 0
+
+    def bind(self, **kwargs):
+        return self
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return FakeMessage("", tool_calls=self.tool_calls)
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+
+DIRECT_QUERY = "asthma medical information symptoms treatment causes"
+PLANNED = [{"url": "https://www.nih.gov/asthma", "content": "Planned search."}]
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    monkeypatch.setattr(search, "human_message", FakeMessage)
+
+
+def _search(service, planner):
+    sync = service._search_uncached("asthma", planner)
+    return sync, asyncio.run(service._asearch_uncached("asthma", planner))
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError, match="Unknown search strategy"):
+        MedicalSearchService(strategy="fastest")
+
+
+def test_direct_strategy_searches_without_the_planner(messages):
+    tool = SearchTool({DIRECT_QUERY: RESULTS})
+    planner = Planner(_calls("planned"))
+    service = MedicalSearchService(strategy="direct", search_tool=tool)
+    assert _search(service, planner) == (RESULTS, RESULTS)
+    assert planner.calls == 0
+    assert service.latency_stats()["direct"]["count"] == 2
+
+
+def test_planner_strategy_runs_the_models_tool_calls(messages):
+    tool = SearchTool({"planned": PLANNED, DIRECT_QUERY: RESULTS})
+    planner = Planner(_calls("planned"))
+    service = MedicalSearchService(strategy="planner", search_tool=tool)
+    assert _search(service, planner) == (PLANNED, PLANNED)
+    assert (planner.calls, tool.queries) == (2, ["planned", "planned"])
+
+
+def test_planner_without_tool_calls_falls_back_to_the_direct_query(messages):
+    tool = SearchTool({DIRECT_QUERY: RESULTS})
+    service = MedicalSearchService(strategy="planner", search_tool=tool)
+    assert _search(service, Planner([])) == (RESULTS, RESULTS)
+    assert tool.queries == [DIRECT_QUERY, DIRECT_QUERY]
+
+
+def test_hybrid_strategy_skips_the_planner_when_direct_results_suffice(messages):
+    tool = SearchTool({DIRECT_QUERY: RESULTS, "planned": PLANNED})
+    planner = Planner(_calls("planned"))
+    service = MedicalSearchService(strategy="hybrid", hybrid_min_results=1, search_tool=tool)
+    assert _search(service, planner) == (RESULTS, RESULTS)
+    assert planner.calls == 0
+
+
+def test_hybrid_strategy_adds_planned_results_to_thin_direct_results(messages):
+    tool = SearchTool({DIRECT_QUERY: RESULTS, "planned": PLANNED + RESULTS})
+    planner = Planner(_calls("planned"))
+    service = MedicalSearchService(strategy="hybrid", hybrid_min_results=2, search_tool=tool)
+    assert _search(service, planner) == (RESULTS + PLANNED, RESULTS + PLANNED)
+    assert planner.calls == 2
+
+
+def test_hybrid_strategy_asks_the_planner_when_the_direct_search_fails(messages, caplog):
+    tool = SearchTool({DIRECT_QUERY: ConnectionError("Tavily is down"), "planned": PLANNED})
+    service = MedicalSearchService(strategy="hybrid", search_tool=tool)
+    with caplog.at_level("WARNING", logger="healthbot_modules.search"):
+        assert _search(service, Planner(_calls("planned"))) == (PLANNED, PLANNED)
+    assert "Direct search failed (Tavily is down), asking the search planner" in caplog.messages
@@ -0,0 +1,134 @@
+import asyncio
+import uuid
+
+import aiohttp
+from aiohttp.test_utils import TestServer, unused_port
+
+from healthbot_modules import server as server_module
+from healthbot_modules.server import HealthBotServer
+from healthbot_modules.state import StateCheckpointer
+
+
+class EchoWorkflow:
+    """Stands in for AsyncHealthBotWorkflow: greets, then echoes one line"""
+
+    def __init__(self, name, checkpointer=None):
+        self.name = name
+        self.checkpointer = checkpointer
+
+    async def execute_session(self, io, state):
+        if self.checkpointer is not None:
+            self.checkpointer.save(state)
+        io.write(f"hello from {self.name}")
+        text = await io.aread("> ")
+        io.write(f"{self.name} echoes {text}")
+
+
+async def _with_two_workers(scenario):
+    ports = [unused_port(), unused_port()]
+    servers = [HealthBotServer(EchoWorkflow(f"worker-{index}"), worker_index=index, worker_ports=ports)
+               for index in range(2)]
+    sites = [TestServer(servers[index].create_app(), host=server_module.WORKER_HOST, port=ports[index])
+             for index in range(2)]
+    for site in sites:
+        await site.start_server()
+    try:
+        async with aiohttp.ClientSession() as client:
+            await scenario(client, servers, [str(site.make_url("")) for site in sites])
+    finally:
+        for site in sites:
+            await site.close()
+
+
+def _session_owned_by(server, index):
+    while True:
+        session_id = uuid.uuid4().hex
+        if server.owner(session_id) == index:
+            return session_id
+
+
+def test_http_requests_for_another_workers_session_are_proxied():
+    async def scenario(client, servers, urls):
+        async with client.post(urls[0] + "/sessions") as response:
+            created = await response.json()
+        assert created["output"] == "hello from worker-0\n"
+        session_id = created["session_id"]
+        assert servers[0].owner(session_id) == 0
+
+        # The same session through the other worker, as a load balancer may route it
+        async with client.post(f"{urls[1]}/sessions/{session_id}/input", json={"text": "hi"}) as response:
+            assert response.status == 200
+            assert (await response.json())["output"] == "worker-0 echoes hi\n"
+        async with client.get(f"{urls[1]}/sessions/{session_id}") as response:
+            assert response.status == 404  # the session ended after echoing
+        assert servers[1].proxied == 2
+        assert servers[0].proxied == 0
+
+    asyncio.run(_with_two_workers(scenario))
+
+
+def test_resuming_a_session_is_created_on_its_owner():
+    async def scenario(client, servers, urls):
+        session_id = _session_owned_by(servers[1], 0)
+        async with client.post(urls[1] + "/sessions", json={"session_id": session_id}) as response:
+            created = await response.json()
+        assert created == {"session_id": session_id, "output": "hello from worker-0\n", "prompt": "> "}
+        assert session_id in servers[0].sessions
+        assert session_id not in servers[1].sessions
+
+    asyncio.run(_with_two_workers(scenario))
+
+
+def test_websocket_for_another_workers_session_is_relayed():
+    async def scenario(client, servers, urls):
+        async with client.post(urls[0] + "/sessions") as response:
+            session_id = (await response.json())["session_id"]
+
+        async with client.ws_connect(f"{urls[1]}/sessions/{session_id}/ws") as ws:
+            await ws.send_str("over the socket")
+            events = []
+            async for message in ws:
+                events.append(message.json())
+        assert {"type": "output", "text": "worker-0 echoes over the socket\n"} in events
+        assert events[-1]["type"] == "end"
+
+    asyncio.run(_with_two_workers(scenario))
+
+
+def test_websocket_for_an_unknown_session_is_refused():
+    async def scenario(client, servers, urls):
+        session_id = _session_owned_by(servers[1], 0)
+        try:
+            await client.ws_connect(f"{urls[1]}/sessions/{session_id}/ws")
+        except aiohttp.WSServerHandshakeError as e:
+            assert e.status == 404
+        else:
+            raise AssertionError("connected to a session that does not exist")
+
+    asyncio.run(_with_two_workers(scenario))
+
+
+def test_deleted_and_evicted_sessions_leave_the_journal(tmp_path):
+    checkpointer = StateCheckpointer(str(tmp_path / "sessions.journal"))
+    server = HealthBotServer(EchoWorkflow("worker", checkpointer), idle_timeout=0)
+
+    async def main():
+        site = TestServer(server.create_app())
+        await site.start_server()
+        try:
+            async with aiohttp.ClientSession() as client:
+                session_ids = []
+                for _ in range(2):
+                    async with client.post(str(site.make_url("/sessions"))) as response:
+                        session_ids.append((await response.json())["session_id"])
+                assert sorted(checkpointer.sessions()) == sorted(session_ids)
+                async with client.delete(str(site.make_url(f"/sessions/{session_ids[0]}"))) as response:
+                    assert response.status == 200
+                assert checkpointer.sessions() == [session_ids[1]]
+                assert await server.evict_idle() == 1
+                assert checkpointer.sessions() == []
+        finally:
+            await site.close()
+
+    asyncio.run(main())
+    checkpointer.close()
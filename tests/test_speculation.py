@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import pytest
+
+from healthbot_modules.admission import INTERACTIVE, SPECULATIVE, current_priority
+from healthbot_modules.speculation import QuizSpeculator
+
+QUIZ = ("What narrows in asthma?", "B", None)
+
+
+@pytest.fixture
+def speculator():
+    speculator = QuizSpeculator(max_workers=2)
+    yield speculator
+    speculator.shutdown()
+
+
+def test_finished_speculation_is_handed_back_for_its_summary(speculator):
+    priorities = []
+
+    def generate(summary):
+        priorities.append(current_priority())
+        return QUIZ
+
+    speculator.start("s1", "summary", generate, "summary")
+    speculator._pending["s1"][1].result(5)
+    assert speculator.collect("s1", "summary") == QUIZ
+    # Speculative calls queue behind waiting patients; the caller's priority is untouched
+    assert priorities == [SPECULATIVE]
+    assert current_priority() == INTERACTIVE
+    stats = speculator.stats()
+    assert (stats["started"], stats["ready"], stats["payoff_rate"]) == (1, 1, 1.0)
+
+
+def test_collect_waits_for_a_running_speculation(speculator):
+    release = threading.Event()
+
+    def generate():
+        release.wait(5)
+        return QUIZ
+
+    speculator.start("s1", "summary", generate)
+    threading.Timer(0.05, release.set).start()
+    assert speculator.collect("s1", "summary") == QUIZ
+    stats = speculator.stats()
+    assert (stats["waited"], stats["ready"]) == (1, 0)
+    assert stats["avg_wait_seconds"] > 0
+
+
+def test_speculation_for_another_summary_is_never_handed_back(speculator):
+    speculator.start("s1", "old summary", lambda: QUIZ)
+    assert speculator.collect("s1", "new summary") is None
+    assert speculator.collect("s1", "old summary") is None
+    stats = speculator.stats()
+    assert (stats["missed"], stats["cancelled"]) == (2, 1)
+
+
+def test_failed_speculation_leaves_the_quiz_to_the_caller(speculator):
+    def generate():
+        raise ValueError("no usable question")
+
+    speculator.start("s1", "summary", generate)
+    assert speculator.collect("s1", "summary") is None
+    assert speculator.stats()["failed"] == 1
+
+
+def test_starting_again_cancels_the_pending_speculation(speculator):
+    async def main():
+        started = asyncio.Event()
+
+        async def generate(answer):
+            started.set()
+            await asyncio.sleep(5)
+            return answer
+
+        speculator.astart("s1", "summary", generate("first"))
+        await started.wait()
+        first = speculator._pending["s1"][1]
+        speculator.astart("s1", "summary", asyncio.sleep(0, result=QUIZ))
+        collected = await speculator.acollect("s1", "summary")
+        await asyncio.sleep(0)
+        return first, collected
+
+    first, collected = asyncio.run(main())
+    assert collected == QUIZ
+    assert first.cancelled()
+    assert speculator.stats()["cancelled"] == 1
+
+
+def test_cancel_discards_a_session_speculation(speculator):
+    async def main():
+        task_started = asyncio.Event()
+
+        async def generate():
+            task_started.set()
+            await asyncio.sleep(5)
+
+        speculator.astart("s1", "summary", generate())
+        await task_started.wait()
+        task = speculator._pending["s1"][1]
+        speculator.cancel("s1")
+        await asyncio.sleep(0)
+        return task, await speculator.acollect("s1", "summary")
+
+    task, collected = asyncio.run(main())
+    assert task.cancelled()
+    assert collected is None
+    stats = speculator.stats()
+    assert (stats["cancelled"], stats["missed"]) == (1, 1)
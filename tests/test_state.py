@@ -0,0 +1,58 @@
+import json
+
+from healthbot_modules.state import EventLog, StateManager
+
+
+def test_events_read_like_message_dicts():
+    log = EventLog()
+    summary = "Asthma narrows the airways."
+    log.append("summary", summary, {"topic_key": "asthma", "streamed": True})
+    event = log[0]
+    assert (event["type"], event["content"], event["topic_key"]) == ("summary", summary, "asthma")
+    assert event.get("missing", "default") == "default"
+    assert event.content is summary
+    assert log.to_dicts() == [{"type": "summary", "content": summary, "topic_key": "asthma", "streamed": True}]
+
+
+def test_capped_log_drops_the_oldest_events():
+    log = EventLog(max_events=3)
+    for index in range(5):
+        log.append("user_input", f"message {index}", {})
+    assert [event.content for event in log] == ["message 2", "message 3", "message 4"]
+    assert [event.content for event in reversed(log)] == ["message 4", "message 3", "message 2"]
+    assert (len(log), log.dropped, log.total) == (3, 2, 5)
+
+
+def test_since_returns_only_events_appended_after_a_total():
+    log = EventLog(max_events=3)
+    log.append("user_input", "first", {})
+    assert log.since(0) == [{"type": "user_input", "content": "first"}]
+    saved = log.total
+    assert log.since(saved) == []
+    for index in range(4):
+        log.append("user_input", f"message {index}", {"index": index})
+    # Only the events still held are returned, even if more were appended
+    assert [message["index"] for message in log.since(saved)] == [1, 2, 3]
+    assert [message["index"] for message in log.since(log.total - 1)] == [3]
+
+
+def test_replaying_the_journaled_events_rebuilds_the_log():
+    log = EventLog(max_events=4)
+    log.append("user_input", "Learning topic: asthma", {"topic_key": "asthma"})
+    log.append("summary", "Asthma narrows the airways.", {"sources": ["https://www.cdc.gov/asthma"]})
+    log.append("quiz", "What narrows in asthma?", {"correct_answer": "B"})
+    replayed = EventLog.from_dicts(json.loads(json.dumps(log.to_dicts())), max_events=4)
+    assert replayed.to_dicts() == log.to_dicts()
+    assert replayed[1]["sources"] == ["https://www.cdc.gov/asthma"]
+    # A replayed log keeps its cap
+    for index in range(2):
+        replayed.append("user_input", f"message {index}", {})
+    assert (len(replayed), replayed.dropped) == (4, 1)
+
+
+def test_add_message_appends_to_the_state_log():
+    state = StateManager.create_initial_state("session")
+    StateManager.add_message(state, "user_input", "Learning topic: asthma", topic_key="asthma")
+    assert state["messages"].to_dicts() == [{"type": "user_input", "content": "Learning topic: asthma",
+                                             "topic_key": "asthma"}]
+    assert state["messages"]._events.maxlen == StateManager.MAX_MESSAGES
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from healthbot_modules.streaming import QuizStreamFilter
+
+QUIZ = ("Question: Which food raises blood sugar fastest?\n"
+        "A) Brown rice\n"
+        "B) Fruit juice\n"
+        "C) Lentils\n"
+        "D) Broccoli\n"
+        "Correct Answer: B\n"
+        "Correct answers are explained after you choose.\n")
+SHOWN = QUIZ.replace("Correct Answer: B\n", "")
+
+
+def _stream(chunks):
+    emitted = []
+    quiz_filter = QuizStreamFilter(emitted.append)
+    for chunk in chunks:
+        quiz_filter.feed(chunk)
+    quiz_filter.close()
+    return "".join(emitted)
+
+
+def _split(text, seed):
+    rng = random.Random(seed)
+    chunks, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(1, 12)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+@pytest.mark.parametrize("chunks", [
+    [QUIZ],
+    list(QUIZ),
+    *[_split(QUIZ, seed) for seed in range(5)],
+])
+def test_hidden_line_is_withheld_however_the_text_is_chunked(chunks):
+    assert _stream(chunks) == SHOWN
+
+
+def test_hidden_line_without_a_trailing_newline_is_withheld():
+    assert _stream(["Question: Why?\nA) x\n", "Correct Answ", "er: C"]) == "Question: Why?\nA) x\n"
+
+
+def test_text_is_passed_through_as_soon_as_it_cannot_be_hidden():
+    emitted = []
+    quiz_filter = QuizStreamFilter(emitted.append)
+    quiz_filter.feed("Corr")
+    assert emitted == []  # could still become the hidden line
+    quiz_filter.feed("ect")
+    quiz_filter.feed("ly")
+    assert "".join(emitted) == "Correctly"
+    quiz_filter.feed(" done")
+    assert "".join(emitted) == "Correctly done"
+
+
+def test_close_flushes_a_trailing_partial_line():
+    assert _stream(["A) last option", "\nCorr"]) == "A) last option\nCorr"
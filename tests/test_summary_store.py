@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from healthbot_modules import search
+from healthbot_modules.cache import create_summary_store
+from healthbot_modules.fakes import FakeChatModel, FakeMessage
+from healthbot_modules.resilience import UPSTREAMS
+from healthbot_modules.search import MedicalSummarizationService
+
+RESULTS = [{"url": "https://www.cdc.gov/asthma", "content": "Asthma narrows the airways."}]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("HEALTHBOT_CACHE_DIR", str(tmp_path / "cache"))
+    return os.environ["HEALTHBOT_CACHE_DIR"]
+
+
+def test_summary_keys_cover_every_input(cache_dir):
+    store = create_summary_store("template-1", cache_dir)
+    key = store.key("asthma", RESULTS, "gpt-4o", 0.3, {"token_budget": 1200})
+    assert key == store.key("asthma", list(RESULTS), "gpt-4o", 0.3, {"token_budget": 1200})
+    changed = [
+        store.key("copd", RESULTS, "gpt-4o", 0.3, {"token_budget": 1200}),
+        store.key("asthma", [dict(RESULTS[0], content="Other text.")], "gpt-4o", 0.3, {"token_budget": 1200}),
+        store.key("asthma", RESULTS, "gpt-4o-mini", 0.3, {"token_budget": 1200}),
+        store.key("asthma", RESULTS, "gpt-4o", 0.0, {"token_budget": 1200}),
+        store.key("asthma", RESULTS, "gpt-4o", 0.3, {"token_budget": 800}),
+        create_summary_store("template-2", cache_dir).key("asthma", RESULTS, "gpt-4o", 0.3, {"token_budget": 1200}),
+    ]
+    assert key not in changed
+    assert len(set(changed)) == len(changed)
+
+
+def test_invalidating_a_template_drops_its_summaries_and_pools(cache_dir):
+    old = create_summary_store("template-1", cache_dir)
+    old.set("k1", "old summary")
+    old.set_quiz_pool("k1", [["Q?", "A", ["a", "b", "c", "d"], ["1", "2", "3", "4"]]])
+    current = create_summary_store("template-2", cache_dir)
+    current.set("k2", "new summary")
+    assert current.invalidate() == 1
+    reopened = create_summary_store("template-2", cache_dir)
+    assert reopened.get("k1") is None
+    assert reopened.get_quiz_pool("k1") is None
+    assert reopened.get("k2") == "new summary"
+
+
+def test_identical_summary_requests_are_served_from_the_store(cache_dir, monkeypatch):
+    monkeypatch.setattr(search, "system_message", FakeMessage)
+    monkeypatch.setattr(search, "human_message", FakeMessage)
+    monkeypatch.setattr(UPSTREAMS["llm"], "enabled", False)
+    llm = FakeChatModel()
+    store = create_summary_store("template", cache_dir)
+    summary, cached = MedicalSummarizationService.create_patient_summary_cached(llm, "asthma", RESULTS, store)
+    assert not cached
+    # Survives a restart: a fresh store over the same directory has it
+    store = create_summary_store("template", cache_dir)
+    assert MedicalSummarizationService.create_patient_summary_cached(llm, "asthma", RESULTS, store) == (summary, True)
+    assert llm.stats()["calls"] == 1
+
+
+class RecordingChatModel(FakeChatModel):
+    """FakeChatModel that keeps every prompt it answers"""
+
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def _reply(self, messages):
+        self.prompts.append("\n".join(message.content for message in messages))
+        return super()._reply(messages)
+
+
+def test_shared_summaries_are_prompted_with_the_canonical_topic(cache_dir, monkeypatch):
+    monkeypatch.setattr(search, "system_message", FakeMessage)
+    monkeypatch.setattr(search, "human_message", FakeMessage)
+    monkeypatch.setattr(UPSTREAMS["llm"], "enabled", False)
+    llm = RecordingChatModel()
+    store = create_summary_store("template", cache_dir)
+    first = MedicalSummarizationService.create_patient_summary_cached(
+        llm, "heart attack", RESULTS, store, key_topic="myocardial infarction")
+    assert "myocardial infarction" in llm.prompts[0]
+    assert "heart attack" not in llm.prompts[0]
+    # Another patient's wording of the same topic is served the same stored summary
+    second = MedicalSummarizationService.create_patient_summary_cached(
+        llm, "MI", RESULTS, store, key_topic="myocardial infarction")
+    assert second == (first[0], True)
+    assert len(llm.prompts) == 1
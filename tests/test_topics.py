@@ -0,0 +1,67 @@
+import pytest
+
+from healthbot_modules.topics import TopicIndex, fold_topic
+
+
+@pytest.fixture
+def index():
+    index = TopicIndex()
+    index.add_topics(["asthma", "migraine"])
+    return index
+
+
+def test_fold_topic_normalizes_case_punctuation_and_spaces():
+    assert fold_topic("  Heart   Attack?! ") == "heart attack"
+    assert fold_topic("COVID-19") == "covid-19"
+    assert fold_topic("Crohn’s disease") == "crohn's disease"
+
+
+@pytest.mark.parametrize("name", ["Graves disease", "rickets", "diabetes", "measles"])
+def test_fold_topic_keeps_names_ending_in_s(name):
+    assert fold_topic(name) == name.lower()
+
+
+@pytest.mark.parametrize("typed, canonical, how", [
+    ("diabetes", "diabetes", "exact"),
+    ("Myocardial Infarction", "heart attack", "synonym"),
+    ("type II diabetes", "type 2 diabetes", "synonym"),
+    ("influenza", "flu", "synonym"),
+    ("asthmaa", "asthma", "fuzzy"),
+    ("migraines", "migraine", "fuzzy"),
+    ("Heart Attacks", "heart attack", "fuzzy"),
+    ("hypertention", "high blood pressure", "fuzzy"),
+])
+def test_resolve_matches_known_topics(index, typed, canonical, how):
+    assert index.resolve(typed) == (canonical, how)
+
+
+@pytest.mark.parametrize("typed", [
+    # A different prefix or number is another condition, not a typo
+    "hypotension", "hypolipidemia", "type 3 diabetes",
+    # Too far from any known topic once plurals are not folded
+    "hives", "rickets", "Graves disease",
+    # Ambiguous aliases are not in the table
+    "add", "aids", "kidney disease",
+])
+def test_resolve_leaves_other_topics_alone(index, typed):
+    assert index.resolve(typed) == (fold_topic(typed), "new")
+
+
+def test_only_curated_topics_are_fuzzy_targets(index):
+    # A new topic is used as typed; it never becomes a correction target for others
+    assert index.canonical("sinusitiss") == "sinusitiss"
+    assert index.canonical("sinusitis") == "sinusitis"
+
+
+def test_short_topics_are_not_fuzzy_matched():
+    index = TopicIndex(synonyms={})
+    index.add_topics(["gout", "lupus"])
+    assert index.resolve("gut") == ("gut", "new")
+    assert index.resolve("lupuss") == ("lupus", "fuzzy")
+
+
+def test_stats_count_each_kind_of_lookup(index):
+    for typed in ["asthma", "influenza", "asthmaa", "something new"]:
+        index.canonical(typed)
+    stats = index.stats()
+    assert (stats["exact"], stats["synonym"], stats["fuzzy"], stats["new"]) == (1, 1, 1, 1)